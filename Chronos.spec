@@ -10,7 +10,7 @@ a = Analysis(
     ['main.py'],
     pathex=[],
     binaries=[],
-    datas=[('icon.icns', '.'), ('icon.png', '.'), ('icon.svg', '.'), ('Info.plist', '.')],
+    datas=[('icon.icns', '.'), ('icon.png', '.'), ('icon.svg', '.'), ('runner.py', '.'), ('Info.plist', '.')],
     hiddenimports=hiddenimports,
     hookspath=[],
     hooksconfig={},
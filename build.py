@@ -26,6 +26,7 @@ def build():
         # 添加数据文件
         f'--add-data={os.path.join(current_dir, "icon.png")}:.',
         f'--add-data={os.path.join(current_dir, "icon.svg")}:.',
+        f'--add-data={os.path.join(current_dir, "runner.py")}:.',  # 任务执行器
         # 设置Info.plist选项（macOS）
         '--osx-bundle-identifier=com.konbluesky.chronos',
         # 隐藏控制台窗口
@@ -59,6 +60,7 @@ def build():
             '--add-data=icon.icns:.',
             '--add-data=icon.png:.',
             '--add-data=icon.svg:.',
+            '--add-data=runner.py:.',
             '--add-data=Info.plist:.',
             '--clean',
             '--noconfirm'
@@ -20,17 +20,44 @@ import sys
 import re
 import subprocess
 import json
+import sqlite3
+import getpass
+import hashlib
+import uuid
+import codecs
+import shutil
+import mmap
+import bisect
+import threading
+import signal
+import fcntl
+import heapq
+import itertools
+import gzip
+import zlib
+import tempfile
+import time
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from array import array
+from collections import namedtuple
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-                             QFormLayout, QLabel, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem,
+                             QFormLayout, QLabel, QLineEdit, QPushButton, QTableView, QAbstractItemView,
                              QHeaderView, QMessageBox, QSystemTrayIcon, QMenu, QToolBar, QStatusBar,
-                             QHeaderView, QCheckBox, QDialog, QPlainTextEdit, QTextEdit, QComboBox,
-                             QFileDialog)
-from PyQt6.QtCore import Qt, QTimer, QSize
-from PyQt6.QtGui import QIcon, QAction, QCursor, QBrush, QColor
+                             QHeaderView, QCheckBox, QDialog, QPlainTextEdit, QComboBox,
+                             QFileDialog, QWidgetAction, QScrollBar, QSpinBox, QStackedWidget,
+                             QTableWidget, QTableWidgetItem, QScrollArea, QToolTip, QGroupBox)
+from PyQt6.QtCore import (Qt, QTimer, QSize, QObject, QFileSystemWatcher, pyqtSignal,
+                          QAbstractTableModel, QModelIndex, QThread, QEvent, QProcess, QSettings,
+                          QProcessEnvironment)
+from PyQt6.QtGui import (QIcon, QAction, QCursor, QBrush, QColor, QTextCursor, QPainter, QPen,
+                         QTextCharFormat, QFont)
 import os
 import datetime
 from crontab import CronTab
 from version import VERSION
+# 日志段命名、执行次数附属文件和账本轮转与执行器共用同一份定义，写入者和读取者不会不一致
+from runner import SEGMENT_PATTERN, RUN_COUNT_SUFFIX, LEDGER_ROTATE_BYTES, log_segments, rotate_ledger
 
 class CronEditor(QWidget):
     def __init__(self, parent=None):
@@ -350,16 +377,107 @@ class JobDialog(QDialog):
         layout.addRow(command_label, self.command_edit)
         layout.addRow(schedule_label, self.cron_editor)
 
+        # 高级选项：保存在任务元数据的 options 中，生成脚本时使用
+        self.options_group = QGroupBox('高级选项')
+        options_layout = QFormLayout(self.options_group)
+        self.splay_spin = QSpinBox()
+        self.splay_spin.setRange(-1, 3600)
+        self.splay_spin.setValue(-1)
+        self.splay_spin.setSuffix(' 秒')
+        self.splay_spin.setSpecialValueText('使用全局设置')
+        self.splay_spin.setToolTip('在此窗口内按任务名称散列出一个固定延迟，错开同时启动的任务；0 表示不延迟')
+        options_layout.addRow('错峰窗口', self.splay_spin)
+        self.overlap_combo = QComboBox()
+        for text, policy in (('不限制', 'allow'), ('跳过本次执行', 'skip'), ('排队等待', 'queue')):
+            self.overlap_combo.addItem(text, policy)
+        self.overlap_combo.setToolTip('上一次运行尚未结束时的处理方式')
+        options_layout.addRow('重叠运行', self.overlap_combo)
+        self.instances_spin = QSpinBox()
+        self.instances_spin.setRange(1, 32)
+        self.instances_spin.setSuffix(' 个')
+        self.instances_spin.setToolTip('同时运行的实例达到此数量时，新的运行按上面的方式跳过或排队')
+        options_layout.addRow('最多同时运行', self.instances_spin)
+        self.overlap_combo.currentIndexChanged.connect(
+            lambda: self.instances_spin.setEnabled(self.overlap_combo.currentData() != 'allow'))
+        self.instances_spin.setEnabled(False)
+
+        # 执行策略：由执行器在运行命令时应用，需要 python3
+        self.run_timeout_spin = QSpinBox()
+        self.run_timeout_spin.setRange(0, 7 * 24 * 3600)
+        self.run_timeout_spin.setSuffix(' 秒')
+        self.run_timeout_spin.setSpecialValueText('不限时')
+        self.run_timeout_spin.setToolTip('超时后先发送 SIGTERM，10 秒后仍未结束则强制终止')
+        options_layout.addRow('执行超时', self.run_timeout_spin)
+        self.nice_spin = QSpinBox()
+        self.nice_spin.setRange(0, 19)
+        self.nice_spin.setSpecialValueText('默认')
+        self.nice_spin.setToolTip('CPU调度的 nice 值，越大优先级越低')
+        options_layout.addRow('CPU优先级', self.nice_spin)
+        self.io_combo = QComboBox()
+        for text, io_class in (('默认', None), ('低', 'low'), ('仅空闲时', 'idle')):
+            self.io_combo.addItem(text, io_class)
+        self.io_combo.setToolTip('I/O调度类别，需要 ionice，仅在 Linux 上生效')
+        options_layout.addRow('I/O优先级', self.io_combo)
+        self.memory_spin = QSpinBox()
+        self.memory_spin.setRange(0, 1024 * 1024)
+        self.memory_spin.setSuffix(' MB')
+        self.memory_spin.setSpecialValueText('不限制')
+        self.memory_spin.setToolTip('进程地址空间上限，超出时内存分配失败')
+        options_layout.addRow('内存上限', self.memory_spin)
+        self.cpu_limit_spin = QSpinBox()
+        self.cpu_limit_spin.setRange(0, 7 * 24 * 3600)
+        self.cpu_limit_spin.setSuffix(' 秒')
+        self.cpu_limit_spin.setSpecialValueText('不限制')
+        self.cpu_limit_spin.setToolTip('每个进程可使用的CPU时间上限')
+        options_layout.addRow('CPU时间上限', self.cpu_limit_spin)
+
+        # 日志轮转：满足任一条件时在下次运行前轮转，旧日志段在后台压缩
+        rotate_layout = QHBoxLayout()
+        self.rotate_size_spin = QSpinBox()
+        self.rotate_size_spin.setRange(0, 1024 * 1024)
+        self.rotate_size_spin.setSuffix(' MB')
+        self.rotate_size_spin.setSpecialValueText('不按大小')
+        self.rotate_age_spin = QSpinBox()
+        self.rotate_age_spin.setRange(0, 3650)
+        self.rotate_age_spin.setSuffix(' 天')
+        self.rotate_age_spin.setSpecialValueText('不按天数')
+        self.rotate_runs_spin = QSpinBox()
+        self.rotate_runs_spin.setRange(0, 1000000)
+        self.rotate_runs_spin.setSuffix(' 次')
+        self.rotate_runs_spin.setSpecialValueText('不按次数')
+        self.rotate_keep_spin = QSpinBox()
+        self.rotate_keep_spin.setRange(1, 1000)
+        self.rotate_keep_spin.setPrefix('保留 ')
+        self.rotate_keep_spin.setSuffix(' 段')
+        self.rotate_keep_spin.setValue(5)
+        for spin in (self.rotate_size_spin, self.rotate_age_spin, self.rotate_runs_spin, self.rotate_keep_spin):
+            rotate_layout.addWidget(spin)
+        rotate_widget = QWidget()
+        rotate_widget.setLayout(rotate_layout)
+        rotate_layout.setContentsMargins(0, 0, 0, 0)
+        rotate_widget.setToolTip('日志达到大小、开始时间超过天数或执行次数达到上限时轮转，需要 python3')
+        options_layout.addRow('日志轮转', rotate_widget)
+        layout.addRow('', self.options_group)
+
         # 创建按钮布局
         buttons = QHBoxLayout()
         buttons.setSpacing(10)  # 设置按钮之间的间距
         self.test_button = QPushButton('测试命令')
+        self.timeout_spin = QSpinBox()
+        self.timeout_spin.setRange(0, 24 * 3600)
+        self.timeout_spin.setValue(10)
+        self.timeout_spin.setPrefix('超时 ')
+        self.timeout_spin.setSuffix(' 秒')
+        self.timeout_spin.setSpecialValueText('不限时')
+        self.timeout_spin.setToolTip('测试命令的超时时间，0 表示不限制')
+        self.test_dialogs = []
         self.ok_button = QPushButton('确定')
         self.cancel_button = QPushButton('取消')
         self.test_button.setFixedWidth(100)  # 统一按钮宽度
         self.ok_button.setFixedWidth(100)
         self.cancel_button.setFixedWidth(100)
         buttons.addWidget(self.test_button)
+        buttons.addWidget(self.timeout_spin)
         buttons.addStretch()
         buttons.addWidget(self.ok_button)
         buttons.addWidget(self.cancel_button)
@@ -370,100 +488,1035 @@ class JobDialog(QDialog):
 
         layout.addRow('', buttons)
 
+    def set_options(self, options):
+        splay = options.get('splay')
+        self.splay_spin.setValue(-1 if splay is None else splay)
+        index = self.overlap_combo.findData(options.get('overlap', 'allow'))
+        self.overlap_combo.setCurrentIndex(max(index, 0))
+        self.instances_spin.setValue(options.get('instances', 1))
+        self.run_timeout_spin.setValue(options.get('timeout', 0))
+        self.nice_spin.setValue(options.get('nice', 0))
+        self.io_combo.setCurrentIndex(max(self.io_combo.findData(options.get('io_class')), 0))
+        self.memory_spin.setValue(options.get('memory_limit', 0))
+        self.cpu_limit_spin.setValue(options.get('cpu_limit', 0))
+        self.rotate_size_spin.setValue(options.get('rotate_size', 0))
+        self.rotate_age_spin.setValue(options.get('rotate_age', 0))
+        self.rotate_runs_spin.setValue(options.get('rotate_runs', 0))
+        self.rotate_keep_spin.setValue(options.get('rotate_keep', 5))
+
+    def get_options(self, options=None):
+        """在已有选项的基础上返回对话框中编辑后的选项"""
+        options = dict(options or {})
+        if self.splay_spin.value() < 0:
+            options.pop('splay', None)
+        else:
+            options['splay'] = self.splay_spin.value()
+        options['overlap'] = self.overlap_combo.currentData()
+        if options['overlap'] == 'allow':
+            options.pop('overlap')
+            options.pop('instances', None)
+        else:
+            options['instances'] = self.instances_spin.value()
+        # 取值为 0 或默认的执行策略不保存
+        for key, value in (('timeout', self.run_timeout_spin.value()), ('nice', self.nice_spin.value()),
+                           ('io_class', self.io_combo.currentData()), ('memory_limit', self.memory_spin.value()),
+                           ('cpu_limit', self.cpu_limit_spin.value()),
+                           ('rotate_size', self.rotate_size_spin.value()), ('rotate_age', self.rotate_age_spin.value()),
+                           ('rotate_runs', self.rotate_runs_spin.value())):
+            if value:
+                options[key] = value
+            else:
+                options.pop(key, None)
+        if any(key in options for key in ('rotate_size', 'rotate_age', 'rotate_runs')):
+            options['rotate_keep'] = self.rotate_keep_spin.value()
+        else:
+            options.pop('rotate_keep', None)
+        return options
+
     def test_command(self):
-        """测试命令功能"""
+        """在独立窗口中异步测试命令，可以同时运行多个测试"""
         command = self.command_edit.toPlainText().strip()
         if not command:
             QMessageBox.warning(self, '警告', '请输入要测试的命令')
             return
-            
+
+        dialog = CommandTestDialog(command, self.timeout_spin.value(), self.parent(), self)
+        self.test_dialogs.append(dialog)
+        dialog.finished.connect(lambda _, dialog=dialog: self.test_dialogs.remove(dialog))
+        dialog.show()
+        dialog.start()
+
+    def done(self, result):
+        # 关闭编辑窗口时结束仍在运行的测试
+        for dialog in list(self.test_dialogs):
+            dialog.close()
+        super().done(result)
+
+
+class CommandTestDialog(QDialog):
+    """命令测试窗口
+
+    用 QProcess 异步执行命令，标准输出和错误输出实时显示（错误输出为红色），
+    界面不会被阻塞。输出超过 OUTPUT_LIMIT 后不再显示；
+    超时或点击取消时先发送 SIGTERM，KILL_GRACE 毫秒后仍未结束则发送 SIGKILL。
+    """
+
+    OUTPUT_LIMIT = 1024 * 1024  # 最多显示的输出字节数
+    KILL_GRACE = 3000
+
+    def __init__(self, command, timeout, manager=None, parent=None):
+        super().__init__(parent)
+        self.command = command
+        self.timeout = timeout  # 秒，0 表示不限制
+        self.manager = manager
+        self.setWindowTitle(f'测试命令 - {command.splitlines()[0][:40]}')
+        self.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        self.resize(800, 500)
+
+        self.process = None
+        self.output_bytes = 0
+        self.truncated = False
+        self.stopping = None  # 主动结束的原因：'取消' 或 '超时'
+        self.decoders = {}
+        self.elapsed = QTimer(self)
+        self.elapsed.setInterval(1000)
+        self.elapsed.timeout.connect(self.tick)
+        self.seconds = 0
+        self.deadline = QTimer(self)
+        self.deadline.setSingleShot(True)
+        self.deadline.timeout.connect(lambda: self.stop('超时'))
+        self.kill_timer = QTimer(self)
+        self.kill_timer.setSingleShot(True)
+        self.kill_timer.timeout.connect(lambda: self.send_signal(signal.SIGKILL))
+
+        layout = QVBoxLayout(self)
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+
+        self.output_text = QPlainTextEdit()
+        self.output_text.setReadOnly(True)
+        self.output_text.setStyleSheet("""
+            QPlainTextEdit {
+                font-family: Monaco, Menlo, Consolas, "Courier New", monospace;
+                font-size: 12px;
+                background-color: white;
+                border: 1px solid #ddd;
+                border-radius: 4px;
+            }
+        """)
+        layout.addWidget(self.output_text)
+
+        button_layout = QHBoxLayout()
+        open_logs_button = QPushButton('打开日志目录')
+        open_scripts_button = QPushButton('打开脚本目录')
+        if manager is not None:
+            open_logs_button.clicked.connect(manager.open_logs_directory)
+            open_scripts_button.clicked.connect(manager.open_scripts_directory)
+        button_layout.addWidget(open_logs_button)
+        button_layout.addWidget(open_scripts_button)
+        button_layout.addStretch()
+        self.rerun_button = QPushButton('重新运行')
+        self.rerun_button.clicked.connect(self.start)
+        self.cancel_button = QPushButton('取消')
+        self.cancel_button.clicked.connect(lambda: self.stop('取消'))
+        close_button = QPushButton('关闭')
+        close_button.clicked.connect(self.close)
+        button_layout.addWidget(self.rerun_button)
+        button_layout.addWidget(self.cancel_button)
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout)
+
+    def start(self):
+        if self.is_running():
+            return
+        self.output_text.clear()
+        self.output_bytes = 0
+        self.truncated = False
+        self.stopping = None
+        self.seconds = 0
+        self.decoders = {
+            QProcess.ProcessChannel.StandardOutput: codecs.getincrementaldecoder('utf-8')('replace'),
+            QProcess.ProcessChannel.StandardError: codecs.getincrementaldecoder('utf-8')('replace'),
+        }
+
+        self.process = QProcess(self)
+        if hasattr(self.process, 'setUnixProcessParameters'):
+            # 在新会话中运行，取消时可以结束命令启动的所有子进程
+            self.process.setUnixProcessParameters(QProcess.UnixProcessFlag.CreateNewSession)
+        self.process.readyReadStandardOutput.connect(
+            lambda: self.read_channel(QProcess.ProcessChannel.StandardOutput))
+        self.process.readyReadStandardError.connect(
+            lambda: self.read_channel(QProcess.ProcessChannel.StandardError))
+        self.process.finished.connect(self.on_finished)
+        self.process.errorOccurred.connect(self.on_error)
+        # 与生成的脚本一致：用 bash -e 执行，遇到错误即停止
+        self.process.start('/bin/bash', ['-ec', self.command])
+
+        self.elapsed.start()
+        if self.timeout > 0:
+            self.deadline.start(self.timeout * 1000)
+        self.rerun_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.update_status()
+
+    def is_running(self):
+        return self.process is not None and self.process.state() != QProcess.ProcessState.NotRunning
+
+    def read_channel(self, channel):
+        self.process.setReadChannel(channel)
+        data = bytes(self.process.readAll())
+        if self.truncated:
+            return
+        remaining = self.OUTPUT_LIMIT - self.output_bytes
+        if len(data) > remaining:
+            data = data[:remaining]
+            self.truncated = True
+        self.output_bytes += len(data)
+        text = self.decoders[channel].decode(data)
+        if text:
+            self.append_output(text, channel == QProcess.ProcessChannel.StandardError)
+        if self.truncated:
+            self.append_output(f'\n[输出超过 {self.OUTPUT_LIMIT // 1024} KB，后续内容不再显示]\n', True)
+
+    def append_output(self, text, is_error):
+        cursor = self.output_text.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        char_format = cursor.charFormat()
+        char_format.setForeground(QBrush(QColor('#d32f2f' if is_error else '#333333')))
+        cursor.insertText(text, char_format)
+        self.output_text.setTextCursor(cursor)
+        self.output_text.ensureCursorVisible()
+
+    def send_signal(self, signum):
+        if not self.is_running():
+            return
+        pid = self.process.processId()
         try:
-            # 创建一个临时的日志文件来捕获命令输出
-            import tempfile
-            import subprocess
-            
-            with tempfile.NamedTemporaryFile(mode='w+', delete=False) as temp_file:
-                process = subprocess.Popen(
-                    command,
-                    shell=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-                
-                stdout, stderr = process.communicate(timeout=10)
-                
-                if process.returncode == 0:
-                    temp_file.write(f"命令执行成功！\n\n输出：\n{stdout}")
-                    title = '测试成功'
+            if hasattr(self.process, 'setUnixProcessParameters'):
+                os.killpg(pid, signum)  # 新会话的进程组ID就是 bash 的进程ID
+            else:
+                os.kill(pid, signum)
+        except OSError:
+            pass
+
+    def stop(self, reason):
+        if not self.is_running():
+            return
+        self.stopping = reason
+        self.cancel_button.setEnabled(False)
+        self.send_signal(signal.SIGTERM)
+        self.kill_timer.start(self.KILL_GRACE)
+        self.update_status()
+
+    def tick(self):
+        self.seconds += 1
+        self.update_status()
+
+    def update_status(self):
+        if self.is_running():
+            text = f'运行中… 已用时 {self.seconds} 秒'
+            if self.stopping:
+                text += f'（{self.stopping}，正在结束）'
+            self.status_label.setText(text)
+
+    def finish(self, text, success):
+        self.elapsed.stop()
+        self.deadline.stop()
+        self.kill_timer.stop()
+        self.rerun_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+        color = '#2e7d32' if success else '#d32f2f'
+        self.status_label.setText(f'<span style="color: {color};">{text}</span>')
+
+    def on_finished(self, exit_code, exit_status):
+        # 输出缓冲中剩余的内容
+        for channel in self.decoders:
+            self.read_channel(channel)
+        if self.stopping:
+            self.finish(f'已取消（用时 {self.seconds} 秒）' if self.stopping == '取消'
+                        else f'执行超时，已在 {self.timeout} 秒后结束', False)
+        elif exit_status == QProcess.ExitStatus.CrashExit:
+            self.finish('命令被信号终止', False)
+        elif exit_code == 0:
+            self.finish('命令执行成功！', True)
+        else:
+            self.finish(f'命令执行失败！退出码 {exit_code}', False)
+
+    def on_error(self, error):
+        if error == QProcess.ProcessError.FailedToStart:
+            self.finish(f'执行命令时发生错误：{self.process.errorString()}', False)
+
+    def done(self, result):
+        if self.is_running():
+            # 窗口关闭后不再关心输出，直接结束整个进程组
+            self.process.finished.disconnect(self.on_finished)
+            self.send_signal(signal.SIGKILL)
+            self.process.waitForFinished(1000)
+        super().done(result)
+
+class SettingsDialog(QDialog):
+    """程序设置，保存在 QSettings 中"""
+
+    DEFAULTS = {
+        'run/max_workers': 4,  # 立即运行的最大并发数
+        'run/splay': 0,        # 全局错峰窗口（秒），任务没有单独设置时使用
+        'run/lean': False,     # 精简包装脚本：由执行器完成日志和执行记录
+        'logs/budget_mb': 0,   # 日志目录的磁盘预算（MB），0 表示不限制
+    }
+
+    @classmethod
+    def value(cls, settings, key):
+        default = cls.DEFAULTS[key]
+        return settings.value(key, default, type=type(default))
+
+    def __init__(self, settings, parent=None):
+        super().__init__(parent)
+        self.settings = settings
+        self.setWindowTitle('设置')
+        self.setMinimumWidth(400)
+
+        layout = QFormLayout(self)
+        self.max_workers_spin = QSpinBox()
+        self.max_workers_spin.setRange(1, 64)
+        self.max_workers_spin.setValue(self.value(settings, 'run/max_workers'))
+        self.max_workers_spin.setToolTip('同时运行的"立即运行"任务数量上限，其余任务排队等待')
+        layout.addRow('立即运行并发数', self.max_workers_spin)
+
+        self.splay_spin = QSpinBox()
+        self.splay_spin.setRange(0, 3600)
+        self.splay_spin.setSuffix(' 秒')
+        self.splay_spin.setSpecialValueText('不错峰')
+        self.splay_spin.setValue(self.value(settings, 'run/splay'))
+        self.splay_spin.setToolTip('任务启动前按名称散列延迟的最大秒数，用于错开同一时刻启动的大量任务')
+        layout.addRow('全局错峰窗口', self.splay_spin)
+
+        self.lean_check = QCheckBox('由执行器完成日志和执行记录')
+        self.lean_check.setChecked(self.value(settings, 'run/lean'))
+        self.lean_check.setToolTip('每次运行只启动一个 python3 进程，代替 date、tee、wc 等多个进程；\n'
+                                   '日志格式不变，没有 python3 时仍按普通方式运行')
+        layout.addRow('精简包装脚本', self.lean_check)
+
+        self.budget_spin = QSpinBox()
+        self.budget_spin.setRange(0, 1024 * 1024)
+        self.budget_spin.setSuffix(' MB')
+        self.budget_spin.setSpecialValueText('不限制')
+        self.budget_spin.setValue(self.value(settings, 'logs/budget_mb'))
+        self.budget_spin.setToolTip('日志目录超出该大小时，后台先压缩、再从最旧的已轮转日志段开始删除，\n'
+                                    '包含失败执行的日志段最后删除，当前日志不受影响')
+        layout.addRow('日志磁盘预算', self.budget_spin)
+
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        ok_button = QPushButton('确定')
+        cancel_button = QPushButton('取消')
+        ok_button.clicked.connect(self.accept)
+        cancel_button.clicked.connect(self.reject)
+        buttons.addWidget(ok_button)
+        buttons.addWidget(cancel_button)
+        layout.addRow('', buttons)
+
+    def accept(self):
+        self.settings.setValue('run/max_workers', self.max_workers_spin.value())
+        self.settings.setValue('run/splay', self.splay_spin.value())
+        self.settings.setValue('run/lean', self.lean_check.isChecked())
+        self.settings.setValue('logs/budget_mb', self.budget_spin.value())
+        super().accept()
+
+
+class LogTailer:
+    """增量读取日志文件
+
+    记住已读取的字节偏移和文件的 inode，每次只读取新追加的字节。
+    文件变短（被截断，例如清除日志）或 inode 改变（被替换，例如日志轮转）时从头重新读取。
+    首次打开时只读取文件末尾 INITIAL_BYTES 字节。
+    """
+
+    INITIAL_BYTES = 1024 * 1024
+    READ_LIMIT = 4 * 1024 * 1024  # 单次最多读取的字节数，超出部分留到下次
+
+    def __init__(self, path):
+        self.path = path
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self.inode = None
+        self.size = 0  # 最近一次读取时的文件大小
+        self.decoder = codecs.getincrementaldecoder('utf-8')('replace')
+
+    def poll(self):
+        """读取新内容，返回 (是否需要重置显示, 新文本)；文件不存在时抛出 FileNotFoundError"""
+        st = os.stat(self.path)
+        self.size = st.st_size
+        reset = self.inode is None or st.st_ino != self.inode or st.st_size < self.offset
+        if reset:
+            self.decoder.reset()
+            self.inode = st.st_ino
+            self.offset = max(0, st.st_size - self.INITIAL_BYTES)
+        if st.st_size == self.offset:
+            return reset, ''
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(min(st.st_size - self.offset, self.READ_LIMIT))
+        skip = 0
+        if reset and self.offset > 0:
+            # 从文件中间开始读取时丢弃第一行的残缺部分
+            skip = data.find(b'\n') + 1
+        self.offset += len(data)
+        return reset, self.decoder.decode(data[skip:])
+
+
+class LineIndex:
+    """日志文件的稀疏行索引
+
+    每隔 CHECKPOINT_BYTES 字节记录一个检查点（字节偏移, 该偏移之前的换行符数量）。
+    建立索引只需要按块统计换行符，5GB 的文件也只有几千个检查点；
+    定位某一行时从最近的检查点向后查找，最多扫描一个检查点间隔。
+    索引在后台线程中追加，界面线程同时读取，因此用锁保护。
+    """
+
+    CHECKPOINT_BYTES = 1024 * 1024
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.offsets = array('Q', [0])
+        self.lines = array('Q', [0])
+        self.indexed = 0       # 已经统计过的字节数
+        self.newlines = 0      # 已统计范围内的换行符数量
+        self.partial = False   # 已统计范围的最后一行没有换行符
+
+    def extend(self, mm, end):
+        """统计 [indexed, end) 范围内的换行符，每次处理一个检查点间隔"""
+        start = self.indexed
+        chunk_end = min(end, self.offsets[-1] + self.CHECKPOINT_BYTES)
+        if chunk_end <= start:
+            chunk_end = min(end, start + self.CHECKPOINT_BYTES)
+        count = mm[start:chunk_end].count(b'\n')
+        with self.lock:
+            self.newlines += count
+            self.indexed = chunk_end
+            self.partial = mm[chunk_end - 1:chunk_end] != b'\n'
+            if chunk_end - self.offsets[-1] >= self.CHECKPOINT_BYTES:
+                self.offsets.append(chunk_end)
+                self.lines.append(self.newlines)
+        return chunk_end
+
+    def line_count(self):
+        with self.lock:
+            return self.newlines + (1 if self.partial else 0)
+
+    def line_of_offset(self, mm, offset):
+        """返回字节偏移所在的行号（从0开始），超出已索引范围时返回 None"""
+        with self.lock:
+            if offset > self.indexed:
+                return None
+            i = bisect.bisect_right(self.offsets, offset) - 1
+            start = self.offsets[i]
+            line = self.lines[i]
+        return line + mm[start:offset].count(b'\n')
+
+    def offset_of_line(self, mm, line):
+        """返回第 line 行（从0开始）的起始字节偏移，超出已索引范围时返回 None"""
+        if line <= 0:
+            return 0
+        with self.lock:
+            if line > self.newlines:
+                return None
+            i = bisect.bisect_left(self.lines, line) - 1
+            offset = self.offsets[i]
+            remaining = line - self.lines[i]
+            limit = self.indexed
+        while remaining > 0:
+            pos = mm.find(b'\n', offset, limit)
+            if pos < 0:
+                return None
+            offset = pos + 1
+            remaining -= 1
+        return offset
+
+
+class LineIndexer(QThread):
+    """在后台线程中为日志文件建立行索引"""
+
+    progress = pyqtSignal()
+
+    def __init__(self, path, index, size, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.index = index
+        self.size = size
+
+    def run(self):
+        try:
+            with open(self.path, 'rb') as f:
+                with mmap.mmap(f.fileno(), self.size, access=mmap.ACCESS_READ) as mm:
+                    chunks = 0
+                    while self.index.indexed < self.size and not self.isInterruptionRequested():
+                        self.index.extend(mm, self.size)
+                        chunks += 1
+                        if chunks % 64 == 0:
+                            self.progress.emit()
+        except (OSError, ValueError) as e:
+            print(f"建立日志索引时出错: {str(e)}")
+        self.progress.emit()
+
+
+class PagedLogView(QWidget):
+    """大日志文件的分页视图
+
+    以内存映射的方式打开文件，在后台建立行索引，只解码和渲染当前窗口可见的几十行，
+    打开数GB的日志也不需要把文件读入内存。支持跳转到开头、末尾和指定行。
+    """
+
+    MAX_WINDOW_BYTES = 256 * 1024  # 单个窗口最多解码的字节数，防止超长行拖慢界面
+
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.file = None
+        self.mm = None
+        self.size = 0
+        self.inode = None
+        self.index = LineIndex()
+        self.indexer = None
+        self.top_line = 0
+        self.pending_offset = None  # 跳转目标所在行的字节偏移，后台索引还没有到达时先按偏移显示
+        self.follow_end = False
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        toolbar = QHBoxLayout()
+        self.start_button = QPushButton('开头')
+        self.start_button.clicked.connect(lambda: self.scroll_to_line(0))
+        toolbar.addWidget(self.start_button)
+        self.end_button = QPushButton('末尾')
+        self.end_button.clicked.connect(self.scroll_to_end)
+        toolbar.addWidget(self.end_button)
+        toolbar.addWidget(QLabel('行号'))
+        self.line_spin = QSpinBox()
+        self.line_spin.setRange(1, 1)
+        toolbar.addWidget(self.line_spin)
+        self.goto_button = QPushButton('跳转')
+        self.goto_button.clicked.connect(lambda: self.scroll_to_line(self.line_spin.value() - 1))
+        toolbar.addWidget(self.goto_button)
+        toolbar.addStretch()
+        self.status_label = QLabel()
+        self.status_label.setStyleSheet('color: #666;')
+        toolbar.addWidget(self.status_label)
+        layout.addLayout(toolbar)
+
+        body = QHBoxLayout()
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+        self.text.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.text.setStyleSheet('font-family: monospace; background-color: #f8f9fa; padding: 10px;')
+        self.text.viewport().installEventFilter(self)
+        body.addWidget(self.text)
+        self.scrollbar = QScrollBar(Qt.Orientation.Vertical)
+        self.scrollbar.valueChanged.connect(self.on_scroll)
+        body.addWidget(self.scrollbar)
+        layout.addLayout(body)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Wheel:
+            steps = event.angleDelta().y() // 40
+            self.scrollbar.setValue(self.scrollbar.value() - steps)
+            return True
+        if event.type() == QEvent.Type.Resize:
+            QTimer.singleShot(0, self.render)
+        return super().eventFilter(obj, event)
+
+    def visible_lines(self):
+        spacing = self.text.fontMetrics().lineSpacing() or 1
+        return max(1, self.text.viewport().height() // spacing)
+
+    def close_map(self):
+        if self.indexer is not None:
+            self.indexer.requestInterruption()
+            self.indexer.wait()
+            self.indexer = None
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def refresh(self):
+        """检查文件变化：增长时继续建立索引，被截断或替换时重新开始"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            self.close_map()
+            self.index = LineIndex()
+            self.size = 0
+            self.text.setPlainText('日志文件不存在')
+            return
+        if st.st_ino != self.inode or st.st_size < self.size:
+            self.close_map()
+            self.index = LineIndex()
+            self.size = 0
+            self.inode = st.st_ino
+            self.top_line = 0
+            self.pending_offset = None
+        if st.st_size == self.size:
+            return
+
+        # 文件增长后重新映射，并在后台继续索引新增部分
+        if self.indexer is not None:
+            if self.indexer.isRunning():
+                return
+            self.indexer = None
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self.file is None:
+            self.file = open(self.path, 'rb')
+        self.size = st.st_size
+        self.mm = mmap.mmap(self.file.fileno(), self.size, access=mmap.ACCESS_READ)
+        self.indexer = LineIndexer(self.path, self.index, self.size, self)
+        self.indexer.progress.connect(self.on_index_progress)
+        self.indexer.start()
+
+    def on_index_progress(self):
+        total = self.index.line_count()
+        self.line_spin.setMaximum(max(1, total))
+        self.scrollbar.setRange(0, max(0, total - self.visible_lines()))
+        self.scrollbar.setPageStep(self.visible_lines())
+        percent = self.index.indexed * 100 // self.size if self.size else 100
+        self.status_label.setText(f'{total} 行' if percent >= 100 else f'{total} 行（已索引 {percent}%）')
+        if self.pending_offset is not None:
+            # 索引越过跳转位置、滚动条范围也足够时换算成行号，滚动条随之定位
+            line = self.index.line_of_offset(self.mm, self.pending_offset) if self.mm is not None else None
+            if line is not None and (line <= self.scrollbar.maximum() or self.index.indexed >= self.size):
+                self.scroll_to_line(line)
+            else:
+                self.render()
+            return
+        if self.follow_end:
+            self.scroll_to_end()
+        else:
+            self.render()
+
+    def scroll_to_offset(self, offset):
+        """定位到字节偏移所在的行，不等待后台索引：先直接从内存映射显示该行，索引到达后再同步滚动条"""
+        if self.mm is None:
+            return
+        offset = min(offset, self.size)
+        self.follow_end = False
+        self.pending_offset = self.mm.rfind(b'\n', 0, offset) + 1
+        self.on_index_progress()
+
+    def scroll_to_line(self, line):
+        self.follow_end = False
+        self.pending_offset = None
+        self.scrollbar.setValue(max(0, min(line, self.scrollbar.maximum())))
+        self.render()
+
+    def scroll_to_end(self):
+        self.scrollbar.setValue(self.scrollbar.maximum())
+        self.follow_end = True
+        self.render()
+
+    def on_scroll(self, value):
+        self.top_line = value
+        self.pending_offset = None
+        # 手动滚动到底部后继续跟随新内容
+        self.follow_end = value == self.scrollbar.maximum()
+        self.render()
+
+    def render(self):
+        if self.mm is None:
+            if self.size == 0 and self.inode is not None:
+                self.text.setPlainText('')
+            return
+        if self.pending_offset is not None:
+            start = self.pending_offset
+        else:
+            start = self.index.offset_of_line(self.mm, self.top_line)
+        if start is None:
+            return
+        end = start
+        limit = min(self.size, start + self.MAX_WINDOW_BYTES)
+        for _ in range(self.visible_lines()):
+            pos = self.mm.find(b'\n', end, limit)
+            if pos < 0:
+                end = limit
+                break
+            end = pos + 1
+        self.text.setPlainText(self.mm[start:end].decode('utf-8', 'replace').rstrip('\n'))
+
+    def closeEvent(self, event):
+        self.close_map()
+        super().closeEvent(event)
+
+
+# 日志中的一次执行：分隔线的字节偏移、开始时间、结束时间和结果（'成功'/'失败'/None表示未结束）
+LogRun = namedtuple('LogRun', ['offset', 'started', 'finished', 'outcome'])
+
+
+class RunIndex:
+    """日志中每次执行的索引
+
+    生成的脚本在每次执行时写入 “执行时间: ...” 分隔块，结束时写入 “[时间] 执行成功/执行失败/已跳过”。
+    本类只扫描日志中新追加的字节，把找到的执行边界以追加方式写入索引文件（字段以制表符分隔）：
+        I <inode>                    日志文件标识，变化时重建索引
+        R <偏移> <开始时间>           一次执行开始
+        E <结束时间> <结果>           最近一次执行结束
+        P <偏移>                     已扫描到的位置
+    日志被截断或替换时索引文件被整体替换。
+    同一个索引文件可能同时被多个实例更新（多个查看器、合并时间线），
+    因此更新时对索引文件加 flock，先读入其他实例追加的记录，再从最新的 P 位置继续扫描。
+    """
+
+    RUN_PATTERN = re.compile(
+        r'^(?:执行时间: (\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)|\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\] (执行成功|执行失败|已跳过))\s*$'
+        .encode('utf-8'), re.M)
+    SCAN_BYTES = 8 * 1024 * 1024  # 每次扫描的块大小
+    OUTCOMES = {'执行成功'.encode('utf-8'): '成功', '执行失败'.encode('utf-8'): '失败',
+                '已跳过'.encode('utf-8'): '跳过'}
+
+    def __init__(self, log_path, index_path):
+        self.log_path = log_path
+        self.index_path = index_path
+        self.loaded = False
+        self.clear()
+
+    def clear(self):
+        self.runs = []
+        self.inode = None
+        self.scanned = 0
+        self.index_inode = None  # 已读入的索引文件及其字节数
+        self.index_size = 0
+
+    def open_index(self, lock):
+        """打开并锁定索引文件；文件在等待锁期间被其他实例替换时改为打开新文件"""
+        while True:
+            f = open(self.index_path, 'a+b')
+            fcntl.flock(f, lock)
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(self.index_path).st_ino:
+                    return f
+            except OSError:
+                pass
+            f.close()
+
+    def read_records(self, f):
+        """读入索引文件中尚未读入的记录（包括其他实例追加的），返回是否读到了新记录"""
+        st = os.fstat(f.fileno())
+        if st.st_ino != self.index_inode or st.st_size < self.index_size:
+            self.clear()
+            self.index_inode = st.st_ino
+        if st.st_size == self.index_size:
+            return False
+        f.seek(self.index_size)
+        data = f.read(st.st_size - self.index_size)
+        end = data.rfind(b'\n') + 1
+        self.index_size += end
+        try:
+            for line in data[:end].decode('utf-8').splitlines():
+                parts = line.split('\t')
+                if parts[0] == 'I':
+                    self.inode = int(parts[1])
+                elif parts[0] == 'R':
+                    self.runs.append(LogRun(int(parts[1]), parts[2], None, None))
+                elif parts[0] == 'E' and self.runs:
+                    self.runs[-1] = self.runs[-1]._replace(finished=parts[1], outcome=parts[2])
+                elif parts[0] == 'P':
+                    self.scanned = int(parts[1])
+        except (ValueError, IndexError):
+            # 索引文件损坏，下次更新时重建
+            index_inode, index_size = self.index_inode, self.index_size
+            self.clear()
+            self.index_inode, self.index_size = index_inode, index_size
+        return True
+
+    def load(self):
+        """从索引文件恢复，已扫描的部分不需要再读日志"""
+        self.loaded = True
+        self.clear()
+        try:
+            with self.open_index(fcntl.LOCK_SH) as f:
+                self.read_records(f)
+        except OSError:
+            pass
+
+    def skip_line(self, f, offset, size):
+        """返回 offset 之后下一个换行符之后的位置，文件中没有换行符时返回 None"""
+        while offset < size:
+            f.seek(offset)
+            data = f.read(min(self.SCAN_BYTES, size - offset))
+            pos = data.find(b'\n')
+            if pos >= 0:
+                return offset + pos + 1
+            offset += len(data)
+        return None
+
+    def refresh(self):
+        """只读入其他实例（例如后台的 RunIndexer）已写入的记录，不扫描日志，返回执行记录是否有变化
+
+        记录按整行追加、重建时整体替换，不加锁读取也不会读到半条记录。
+        """
+        first = not self.loaded
+        self.loaded = True
+        try:
+            with open(self.index_path, 'rb') as f:
+                return self.read_records(f) or first
+        except OSError:
+            return first
+
+    def unscanned(self):
+        """日志中尚未扫描的字节数"""
+        try:
+            st = os.stat(self.log_path)
+        except OSError:
+            return 0
+        if st.st_ino != self.inode or st.st_size < self.scanned:
+            return st.st_size
+        return st.st_size - self.scanned
+
+    def update(self, limit=None):
+        """扫描日志新增的内容，返回执行记录是否有变化（首次加载也视为变化）
+
+        limit 为本次最多扫描的字节数，未扫描完时 caught_up 为 False。
+        """
+        first = not self.loaded
+        self.loaded = True
+        self.caught_up = True
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            index_file = self.open_index(fcntl.LOCK_EX)
+        except OSError as e:
+            print(f"打开执行索引时出错: {str(e)}")
+            return first
+        with index_file:
+            changed = self.read_records(index_file) or first
+            try:
+                st = os.stat(self.log_path)
+            except OSError:
+                return changed
+
+            records = []
+            rebuild = st.st_ino != self.inode or st.st_size < self.scanned
+            if rebuild:
+                self.clear()
+                self.inode = st.st_ino
+                records.append(f'I\t{st.st_ino}')
+            if st.st_size == self.scanned and not rebuild:
+                return changed
+
+            began = self.scanned
+            with open(self.log_path, 'rb') as f:
+                while self.scanned < st.st_size:
+                    if limit is not None and self.scanned - began >= limit:
+                        self.caught_up = False
+                        break
+                    f.seek(self.scanned)
+                    data = f.read(min(self.SCAN_BYTES, st.st_size - self.scanned))
+                    # 只处理完整的行，最后一行可能还在写入
+                    end = data.rfind(b'\n') + 1
+                    if end == 0:
+                        if len(data) < self.SCAN_BYTES:
+                            break
+                        # 超过扫描块大小的长行不可能是执行边界，跳过整行
+                        next_line = self.skip_line(f, self.scanned + len(data), st.st_size)
+                        if next_line is None:
+                            break
+                        self.scanned = next_line
+                        continue
+                    data = data[:end]
+                    for match in self.RUN_PATTERN.finditer(data):
+                        if match.group(1):
+                            # 执行开始位置取分隔线所在行
+                            line_start = data.rfind(b'\n', 0, max(0, match.start() - 1)) + 1
+                            run = LogRun(self.scanned + line_start, match.group(1).decode(), None, None)
+                            self.runs.append(run)
+                            records.append(f'R\t{run.offset}\t{run.started}')
+                        elif self.runs and self.runs[-1].outcome is None:
+                            outcome = self.OUTCOMES[match.group(3)]
+                            self.runs[-1] = self.runs[-1]._replace(finished=match.group(2).decode(), outcome=outcome)
+                            records.append(f'E\t{self.runs[-1].finished}\t{outcome}')
+                        changed = True
+                    self.scanned += end
+            records.append(f'P\t{self.scanned}')
+            data = ('\n'.join(records) + '\n').encode('utf-8')
+
+            try:
+                if rebuild:
+                    # 写入临时文件后替换，等待锁的其他实例会发现文件已被替换并重新打开
+                    temp_path = f'{self.index_path}.{os.getpid()}.tmp'
+                    with open(temp_path, 'wb') as f:
+                        f.write(data)
+                    os.replace(temp_path, self.index_path)
+                    self.index_inode = os.stat(self.index_path).st_ino
+                    self.index_size = len(data)
                 else:
-                    temp_file.write(f"命令执行失败！\n\n错误输出：\n{stderr}\n\n标准输出：\n{stdout}")
-                    title = '测试失败'
-                    
-            # 显示结果对话框
-            with open(temp_file.name, 'r') as f:
-                content = f.read()
-                
-            msg = QMessageBox(self)
-            msg.setWindowTitle(title)
-            msg.setText(content)
-            msg.setDetailedText(content)
-            msg.setIcon(QMessageBox.Icon.Information if process.returncode == 0 else QMessageBox.Icon.Warning)
-            
-            # 添加打开日志目录和脚本目录的按钮
-            open_logs_button = msg.addButton('打开日志目录', QMessageBox.ButtonRole.ActionRole)
-            open_scripts_button = msg.addButton('打开脚本目录', QMessageBox.ButtonRole.ActionRole)
-            msg.addButton(QMessageBox.StandardButton.Ok)
-            
-            # 设置弹窗样式和布局
-            msg.setStyleSheet("""
-                QMessageBox {
-                    min-width: 600px;
-                }
-                QLabel {
-                    min-width: 500px;
-                    font-size: 13px;
-                    padding: 10px;
-                }
-                QMessageBox QLabel#qt_msgbox_label {
-                    min-height: 40px;
-                }
-                QMessageBox QLabel#qt_msgboxex_icon_label {
-                    min-width: 100px;
-                    padding-right: 20px;
-                }
-                QPushButton {
-                    min-width: 100px;
-                    padding: 6px;
-                }
-            """)
-            
-            result = msg.exec()
-            
-            # 处理按钮点击事件
-            clicked_button = msg.clickedButton()
-            if clicked_button == open_logs_button:
-                self.parent().open_logs_directory()
-            elif clicked_button == open_scripts_button:
-                self.parent().open_scripts_directory()
-            
-            # 清理临时文件
-            os.unlink(temp_file.name)
-            
-        except subprocess.TimeoutExpired:
-            QMessageBox.critical(self, '错误', '命令执行超时')
-        except Exception as e:
-            QMessageBox.critical(self, '错误', f'执行命令时发生错误：{str(e)}')
+                    index_file.write(data)
+                    index_file.flush()
+                    self.index_size += len(data)
+            except OSError as e:
+                print(f"写入执行索引时出错: {str(e)}")
+        return changed or rebuild
+
+    def nth_last(self, n):
+        """倒数第 n 次执行（n 从1开始）"""
+        if 0 < n <= len(self.runs):
+            return self.runs[-n]
+        return None
+
+    def last_failure(self):
+        for run in reversed(self.runs):
+            if run.outcome == '失败':
+                return run
+        return None
+
+
+class RunIndexer(QThread):
+    """在后台线程中扫描日志、建立执行索引
+
+    使用自己的 RunIndex 实例，每扫描 BATCH_BYTES 字节写入一次索引文件并发出 progress，
+    界面线程的实例通过 RunIndex.refresh 读入新记录，不需要等待整个日志扫描完。
+    """
+
+    progress = pyqtSignal()
+
+    BATCH_BYTES = 32 * 1024 * 1024
+
+    def __init__(self, log_path, index_path, parent=None):
+        super().__init__(parent)
+        self.index = RunIndex(log_path, index_path)
+
+    def run(self):
+        while not self.isInterruptionRequested():
+            self.index.update(self.BATCH_BYTES)
+            self.progress.emit()
+            if self.index.caught_up:
+                break
+
+
+class RunIndexUpdater(QObject):
+    """更新界面使用的执行索引：少量新增内容直接在界面线程中扫描，大量未扫描的内容交给 RunIndexer
+
+    首次打开没有索引的大日志时界面不会被阻塞，后台扫描的进度通过 changed 信号通知。
+    """
+
+    changed = pyqtSignal()
+
+    INLINE_BYTES = 1024 * 1024  # 界面线程中最多直接扫描的字节数
+
+    def __init__(self, run_index, parent=None):
+        super().__init__(parent)
+        self.run_index = run_index
+        self.indexer = None
+
+    def update(self):
+        """返回执行记录是否立即有变化；交给后台扫描时之后通过 changed 通知"""
+        if self.indexer is not None:
+            return False  # 后台扫描结束后会再检查一次
+        changed = self.run_index.refresh()
+        if self.run_index.unscanned() <= self.INLINE_BYTES:
+            return self.run_index.update() or changed
+        self.indexer = RunIndexer(self.run_index.log_path, self.run_index.index_path, self)
+        self.indexer.progress.connect(self.on_progress)
+        self.indexer.finished.connect(self.on_finished)
+        self.indexer.start()
+        return changed
+
+    def on_progress(self):
+        if self.run_index.refresh():
+            self.changed.emit()
+
+    def on_finished(self):
+        self.indexer = None
+        # 扫描期间日志可能又有新增
+        if self.update():
+            self.changed.emit()
+
+    def stop(self):
+        if self.indexer is not None:
+            self.indexer.finished.disconnect(self.on_finished)
+            self.indexer.requestInterruption()
+            self.indexer.wait()
+            self.indexer = None
+
+
+class SegmentExtractor(QThread):
+    """在后台线程中把压缩的日志段解压到临时文件"""
+
+    progress = pyqtSignal(object)         # 已解压的字节数
+    done = pyqtSignal(str, str, str)      # 日志段、解压后的文件、错误信息（成功时为空）
+
+    def __init__(self, path, target, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.target = target
+
+    def run(self):
+        error = ''
+        written = 0
+        try:
+            with gzip.open(self.path, 'rb') as source, open(self.target + '.tmp', 'wb') as f:
+                for data in iter(lambda: source.read(4 * 1024 * 1024), b''):
+                    if self.isInterruptionRequested():
+                        break
+                    f.write(data)
+                    written += len(data)
+                    self.progress.emit(written)
+            if self.isInterruptionRequested():
+                os.unlink(self.target + '.tmp')
+                error = '已取消'
+            else:
+                os.replace(self.target + '.tmp', self.target)
+        except (OSError, EOFError, zlib.error) as e:
+            error = str(e) or type(e).__name__
+            try:
+                os.unlink(self.target + '.tmp')
+            except OSError:
+                pass
+        self.done.emit(self.path, self.target, error)
+
 
 class LogViewerDialog(QDialog):
-    def __init__(self, log_file, parent=None):
+    """任务日志查看器
+
+    默认跟随当前日志的新内容；已轮转的日志段（包括压缩的 .gz）可以在日志段列表中选择，
+    压缩的日志段解压到临时目录后以分页方式浏览，窗口关闭时删除。
+    """
+
+    MAX_BLOCKS = 20000  # 显示区域最多保留的行数，更早的内容会被丢弃
+    PAGED_THRESHOLD = 16 * 1024 * 1024  # 超过该大小的日志默认使用分页浏览
+    MAX_LISTED_RUNS = 500  # 执行记录列表最多列出的次数
+
+    def __init__(self, log_file, parent=None, run_index_path=None):
         super().__init__(parent)
         self.log_file = log_file
+        self.tailer = LogTailer(log_file)
+        self.run_index = RunIndex(log_file, run_index_path) if run_index_path else None
+        self.run_updater = None
+        if self.run_index is not None:
+            self.run_updater = RunIndexUpdater(self.run_index, self)
+            self.run_updater.changed.connect(self.update_run_combo)
+        self.paged_view = None
+        self.segments = []
+        self.segment = None       # 正在查看的已轮转日志段，None 表示当前日志
+        self.segment_file = None  # 该日志段解压后的文件
+        self.temp_dir = None
+        self.extractor = None     # 正在后台解压的日志段
+        self.pending_jump = None  # 日志段解压完成后要跳转到的字节偏移
         self.setWindowTitle('日志查看器')
         self.setup_ui()
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_log)
-        self.timer.start(1000)  # 每秒更新一次
+        # 只在日志文件或所在目录（日志段的出现、压缩和删除）变化时才读取，空闲的查看器不做任何读取
+        self.watched = [log_file, os.path.dirname(log_file)]
+        self.watch_service = FileWatchService.instance()
+        for path in self.watched:
+            self.watch_service.watch(path)
+        self.watch_service.changed.connect(self.on_file_changed)
+        self.finished.connect(self.stop)
 
     def setup_ui(self):
         self.setMinimumSize(800, 600)
@@ -482,75 +1535,2907 @@ class LogViewerDialog(QDialog):
         self.export_button = QPushButton('导出日志')
         self.export_button.clicked.connect(self.export_log)
         toolbar.addWidget(self.export_button)
-        
+
+        # 大文件使用内存映射分页浏览，不把整个文件读入内存
+        self.paged_checkbox = QCheckBox('分页浏览')
+        try:
+            self.paged_checkbox.setChecked(os.path.getsize(self.log_file) > self.PAGED_THRESHOLD)
+        except OSError:
+            pass
+        self.paged_checkbox.toggled.connect(self.set_paged_mode)
+        toolbar.addWidget(self.paged_checkbox)
+
+        # 已轮转的日志段
+        self.segment_combo = QComboBox()
+        self.segment_combo.addItem('当前日志', None)
+        self.segment_combo.activated.connect(self.show_segment)
+        toolbar.addWidget(self.segment_combo)
+        self.older_button = QPushButton('较早')
+        self.older_button.clicked.connect(lambda: self.step_segment(1))
+        toolbar.addWidget(self.older_button)
+        self.newer_button = QPushButton('较新')
+        self.newer_button.clicked.connect(lambda: self.step_segment(-1))
+        toolbar.addWidget(self.newer_button)
+
         toolbar.addStretch()
+
+        # 按执行记录跳转
+        self.run_combo = QComboBox()
+        self.run_combo.setMinimumWidth(260)
+        self.run_combo.activated.connect(self.jump_to_selected_run)
+        self.last_failure_button = QPushButton('上次失败')
+        self.last_failure_button.clicked.connect(self.jump_to_last_failure)
+        if self.run_index is not None:
+            toolbar.addWidget(self.run_combo)
+            toolbar.addWidget(self.last_failure_button)
         layout.addLayout(toolbar)
-        
+
         # 日志显示区域
-        self.log_text = QTextEdit()
+        self.stack = QStackedWidget()
+        self.log_text = QPlainTextEdit()
         self.log_text.setReadOnly(True)
+        self.log_text.setMaximumBlockCount(self.MAX_BLOCKS)
         self.log_text.setStyleSheet('font-family: monospace; background-color: #f8f9fa; padding: 10px;')
-        layout.addWidget(self.log_text)
-        
+        self.stack.addWidget(self.log_text)
+        layout.addWidget(self.stack)
+
+        self.set_paged_mode(self.paged_checkbox.isChecked())
+
+    def set_paged_mode(self, paged):
+        if paged:
+            if self.paged_view is None:
+                self.paged_view = PagedLogView(self.segment_file or self.log_file)
+                self.stack.addWidget(self.paged_view)
+                self.paged_view.refresh()
+            self.stack.setCurrentWidget(self.paged_view)
+            self.paged_view.follow_end = self.auto_scroll_checkbox.isChecked()
+        else:
+            self.remove_paged_view()
+            self.stack.setCurrentWidget(self.log_text)
+            self.tailer.reset()
         self.update_log()
 
-    def update_log(self):
-        try:
-            if not os.path.exists(self.log_file):
-                self.log_text.setText('日志文件不存在')
-                return
-                
-            with open(self.log_file, 'r') as f:
-                content = f.read()
-                if content != self.log_text.toPlainText():
-                    self.log_text.setText(content)
-                    if self.auto_scroll_checkbox.isChecked():
-                        self.log_text.verticalScrollBar().setValue(
-                            self.log_text.verticalScrollBar().maximum()
-                        )
-        except PermissionError:
-            self.log_text.setText('无法读取日志文件：权限不足')
-        except Exception as e:
-            self.log_text.setText(f'读取日志文件时发生错误：{str(e)}')
+    def remove_paged_view(self):
+        if self.paged_view is not None:
+            self.paged_view.close_map()
+            self.stack.removeWidget(self.paged_view)
+            self.paged_view.deleteLater()
+            self.paged_view = None
+
+    def update_segments(self):
+        """日志段列表按时间倒序排列，日志段被压缩后保持选中同一段"""
+        segments = log_segments(self.log_file)
+        if segments == self.segments:
+            return
+        self.segments = segments
+        selected = self.segment_key(self.segment_combo.currentData())
+        self.segment_combo.clear()
+        self.segment_combo.addItem('当前日志', None)
+        for path in reversed(segments):
+            match = SEGMENT_PATTERN.fullmatch(path[len(self.log_file):])
+            rotated = datetime.datetime.strptime(match.group(1), '%Y%m%d-%H%M%S')
+            label = f'{rotated:%Y-%m-%d %H:%M:%S} 轮转' + ('（已压缩）' if match.group(3) else '')
+            self.segment_combo.addItem(label, path)
+            if selected is not None and self.segment_key(path) == selected:
+                self.segment_combo.setCurrentIndex(self.segment_combo.count() - 1)
+                self.segment = path
+        if selected is not None and self.segment_key(self.segment_combo.currentData()) != selected:
+            # 正在查看的日志段已被删除，已打开的内容仍可浏览
+            self.segment_combo.insertItem(1, '已删除的日志段', self.segment)
+            self.segment_combo.setCurrentIndex(1)
+        self.update_segment_buttons()
+
+    @staticmethod
+    def segment_key(path):
+        if path is None:
+            return None
+        return path[:-3] if path.endswith('.gz') else path
+
+    def update_segment_buttons(self):
+        index = self.segment_combo.currentIndex()
+        self.older_button.setEnabled(index < self.segment_combo.count() - 1)
+        self.newer_button.setEnabled(index > 0)
+
+    def step_segment(self, step):
+        index = self.segment_combo.currentIndex() + step
+        if 0 <= index < self.segment_combo.count():
+            self.segment_combo.setCurrentIndex(index)
+            self.show_segment(index)
+
+    def segment_target(self, path):
+        """压缩的日志段解压到临时目录中的路径"""
+        if self.temp_dir is None:
+            self.temp_dir = tempfile.mkdtemp(prefix='chronos-log-')
+        return os.path.join(self.temp_dir, os.path.basename(path)[:-3])
+
+    def show_segment(self, combo_index):
+        path = self.segment_combo.itemData(combo_index)
+        if path == self.segment:
+            self.update_segment_buttons()
+            return
+        self.cancel_extraction()
+        if path is not None and path.endswith('.gz'):
+            target = self.segment_target(path)
+            if not os.path.exists(target):
+                # 在后台解压，完成后再显示，解压数GB的日志段也不会阻塞界面
+                self.segment = path
+                self.segment_file = None
+                self.remove_paged_view()
+                self.stack.setCurrentWidget(self.log_text)
+                self.log_text.setPlainText('正在解压日志段...')
+                self.set_segment_controls(False)
+                self.extractor = SegmentExtractor(path, target, self)
+                self.extractor.progress.connect(lambda written: self.log_text.setPlainText(
+                    f'正在解压日志段...（已解压 {format_memory(written // 1024)}）'))
+                self.extractor.done.connect(self.on_segment_extracted)
+                self.extractor.start()
+                return
+            self.activate_segment(path, target)
+        else:
+            self.activate_segment(path, path)
+
+    def on_segment_extracted(self, path, target, error):
+        self.extractor = None
+        if error:
+            self.pending_jump = None
+            QMessageBox.critical(self, '错误', f'读取日志段失败：{error}')
+            self.segment = None
+            self.segments = []  # 重新列出日志段并恢复选中项
+            self.update_segments()
+            self.segment_combo.setCurrentIndex(0)
+            self.activate_segment(None, None)
+            return
+        if path == self.segment:
+            self.segment = None
+            self.activate_segment(path, target)
+
+    def cancel_extraction(self):
+        if self.extractor is not None:
+            self.extractor.done.disconnect(self.on_segment_extracted)
+            self.extractor.requestInterruption()
+            self.extractor.wait()
+            self.extractor = None
+
+    def set_segment_controls(self, current):
+        # 已轮转的日志段不再变化，只能分页浏览，执行记录只对应当前日志
+        self.paged_checkbox.setEnabled(current)
+        self.run_combo.setEnabled(current)
+        self.last_failure_button.setEnabled(current and self.run_index is not None
+                                            and self.run_index.last_failure() is not None)
+
+    def activate_segment(self, path, segment_file):
+        self.segment = path
+        self.segment_file = segment_file
+        self.remove_paged_view()
+        current = path is None
+        self.set_segment_controls(current)
+        if not current:
+            self.auto_scroll_checkbox.setChecked(False)
+            self.paged_checkbox.blockSignals(True)
+            self.paged_checkbox.setChecked(True)
+            self.paged_checkbox.blockSignals(False)
+        self.update_segment_buttons()
+        self.set_paged_mode(self.paged_checkbox.isChecked())
+        if self.pending_jump is not None:
+            offset, self.pending_jump = self.pending_jump, None
+            self.scroll_to_offset(offset)
+
+    def update_log(self):
+        self.update_segments()
+        if self.run_updater is not None and self.run_updater.update():
+            self.update_run_combo()
+        if self.extractor is not None:
+            return
+        if self.paged_view is not None:
+            if self.segment is None:
+                self.paged_view.refresh()
+            return
+        try:
+            reset, text = self.tailer.poll()
+        except FileNotFoundError:
+            self.show_message('日志文件不存在')
+            return
+        except PermissionError:
+            self.show_message('无法读取日志文件：权限不足')
+            return
+        except Exception as e:
+            self.show_message(f'读取日志文件时发生错误：{str(e)}')
+            return
+
+        if self.tailer.offset < self.tailer.size:
+            # 超过单次读取上限的部分稍后继续读取
+            QTimer.singleShot(0, self.update_log)
+        if reset:
+            self.log_text.setPlainText(text)
+        elif text:
+            # 只在文档末尾追加新内容，不重新排版已有内容
+            cursor = QTextCursor(self.log_text.document())
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+            cursor.insertText(text)
+        else:
+            return
+        if self.auto_scroll_checkbox.isChecked():
+            self.log_text.verticalScrollBar().setValue(
+                self.log_text.verticalScrollBar().maximum()
+            )
+
+    def update_run_combo(self):
+        """执行记录按时间倒序列出，最多列出最近 MAX_LISTED_RUNS 次"""
+        runs = self.run_index.runs
+        self.run_combo.clear()
+        self.run_combo.addItem(f'执行记录（共 {len(runs)} 次）', None)
+        for n in range(1, min(len(runs), self.MAX_LISTED_RUNS) + 1):
+            run = runs[-n]
+            outcome = run.outcome or '未结束'
+            self.run_combo.addItem(f'倒数第{n}次  {run.started}  {outcome}', n)
+        self.last_failure_button.setEnabled(self.segment is None and self.run_index.last_failure() is not None)
+
+    def jump_to_selected_run(self, combo_index):
+        n = self.run_combo.itemData(combo_index)
+        if n is not None:
+            self.jump_to_run(self.run_index.nth_last(n))
+
+    def jump_to_last_failure(self):
+        run = self.run_index.last_failure()
+        if run is None:
+            QMessageBox.information(self, '提示', '没有失败的执行记录')
+            return
+        self.jump_to_run(run)
+
+    def jump_to_run(self, run):
+        """切换到分页浏览并定位到该次执行的起始位置"""
+        if run is not None:
+            self.jump_to_offset(run.offset)
+
+    def jump_to_offset(self, offset, segment=None):
+        """切换到分页浏览并定位到当前日志或指定日志段中该字节偏移所在的行"""
+        index = 0
+        if segment is not None:
+            self.update_segments()
+            index = self.segment_combo.findData(segment)
+            if index < 0:
+                QMessageBox.information(self, '提示', '该日志段已被删除')
+                return
+        if self.segment_combo.currentData() != segment or self.segment != segment:
+            self.segment_combo.setCurrentIndex(index)
+            self.show_segment(index)
+        if self.extractor is not None:
+            self.pending_jump = offset
+            return
+        self.scroll_to_offset(offset)
+
+    def scroll_to_offset(self, offset):
+        self.auto_scroll_checkbox.setChecked(False)
+        if not self.paged_checkbox.isChecked():
+            self.paged_checkbox.setChecked(True)
+        self.paged_view.scroll_to_offset(offset)
+
+    def show_message(self, message):
+        """显示提示信息，文件恢复后从头读取"""
+        self.tailer.reset()
+        if self.log_text.toPlainText() != message:
+            self.log_text.setPlainText(message)
+
+    def clear_log(self):
+        message = '确定要清除日志吗？'
+        if self.segments:
+            message += f'\n已轮转的 {len(self.segments)} 个日志段也会被删除。'
+        reply = QMessageBox.question(self, '确认', message,
+                                   QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if reply == QMessageBox.StandardButton.Yes:
+            try:
+                with open(self.log_file, 'w') as f:
+                    f.write(f"=== 日志清除于 {datetime.datetime.now()} ===\n")
+                for path in self.segments:
+                    os.remove(path)
+                if os.path.exists(self.log_file + RUN_COUNT_SUFFIX):
+                    os.remove(self.log_file + RUN_COUNT_SUFFIX)
+                if self.segment is not None:
+                    self.segment_combo.setCurrentIndex(0)
+                    self.show_segment(0)
+                self.update_log()
+                QMessageBox.information(self, '成功', '日志已清除')
+            except PermissionError:
+                QMessageBox.critical(self, '错误', '无法清除日志：权限不足')
+            except Exception as e:
+                QMessageBox.critical(self, '错误', f'清除日志失败：{str(e)}')
+
+    def export_log(self):
+        try:
+            timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+            default_name = f'log_export_{timestamp}.txt'
+            
+            file_path, _ = QFileDialog.getSaveFileName(
+                self,
+                '导出日志',
+                os.path.join(os.path.expanduser('~/Desktop'), default_name),
+                '文本文件 (*.txt);;所有文件 (*)'
+            )
+            
+            if file_path:
+                if self.extractor is not None:
+                    QMessageBox.information(self, '提示', '日志段正在解压，请稍后再导出')
+                    return
+                shutil.copyfile(self.segment_file or self.log_file, file_path)
+                QMessageBox.information(self, '成功', f'日志已导出到：{file_path}')
+        except Exception as e:
+            QMessageBox.critical(self, '错误', f'导出日志失败：{str(e)}')
+
+    def on_file_changed(self, path, start, end, replaced):
+        if path == self.log_file:
+            self.update_log()
+        elif path in self.watched:
+            self.update_segments()
+
+    def stop(self):
+        if self.watched:
+            self.watch_service.changed.disconnect(self.on_file_changed)
+            for path in self.watched:
+                self.watch_service.unwatch(path)
+            self.watched = []
+        self.cancel_extraction()
+        if self.run_updater is not None:
+            self.run_updater.stop()
+        if self.paged_view is not None:
+            self.paged_view.close_map()
+        if self.temp_dir is not None:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self.temp_dir = None
+
+    def closeEvent(self, event):
+        self.stop()
+        event.accept()
+
+def compress_log_segment(path):
+    """把未压缩的日志段压缩为 .gz，返回压缩后的路径
+
+    与执行器的后台压缩使用同样的文件锁，日志段正在被其他进程压缩时返回 None。
+    """
+    with open(path, 'rb') as source:
+        try:
+            fcntl.flock(source.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return None
+        if not os.path.exists(path):
+            return None  # 加锁前已被其他进程压缩
+        target = path + '.gz'
+        try:
+            with gzip.open(target + '.tmp', 'wb') as f:
+                shutil.copyfileobj(source, f, 1024 * 1024)
+            os.replace(target + '.tmp', target)
+        except OSError:
+            if os.path.exists(target + '.tmp'):
+                os.remove(target + '.tmp')
+            raise
+        os.remove(path)
+        return target
+
+
+class LogCompactor(QThread):
+    """在后台线程中把日志目录的总大小控制在磁盘预算之内
+
+    超出预算时先压缩尚未压缩的已轮转日志段，仍然超出时从最旧的日志段开始删除，
+    包含失败执行的日志段排在没有失败的日志段之后；正在写入的当前日志不会被改动。
+    """
+
+    report = pyqtSignal('qint64', int, int, 'qint64')  # 释放的字节数、压缩的日志段数、删除的日志段数、整理后的总大小
+    FAILURE_MARKER = '] 执行失败'.encode('utf-8')
+
+    def __init__(self, log_dir, budget, failure_cache, parent=None):
+        super().__init__(parent)
+        self.log_dir = log_dir
+        self.budget = budget
+        # 路径 -> ((大小, mtime), 是否包含失败)，在多次整理之间复用，避免重复解压
+        self.failure_cache = failure_cache
+
+    def inventory(self):
+        """返回 (日志目录总大小, [(轮转时间, 路径, 大小), ...])，日志段按轮转时间从旧到新排列"""
+        total = 0
+        segments = []
+        for entry in os.scandir(self.log_dir):
+            try:
+                size = entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                continue
+            total += size
+            position = entry.name.rfind('.log.')
+            match = SEGMENT_PATTERN.fullmatch(entry.name[position + 4:]) if position >= 0 else None
+            if match:
+                segments.append(((match.group(1), int(match.group(2) or 0)), entry.path, size))
+        segments.sort()
+        return total, segments
+
+    def has_failure(self, path):
+        st = os.stat(path)
+        key = (st.st_size, st.st_mtime_ns)
+        cached = self.failure_cache.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        found = False
+        tail = b''
+        with (gzip.open if path.endswith('.gz') else open)(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                data = tail + chunk
+                if self.FAILURE_MARKER in data:
+                    found = True
+                    break
+                tail = data[-(len(self.FAILURE_MARKER) - 1):]
+        self.failure_cache[path] = (key, found)
+        return found
+
+    def compact(self):
+        total, segments = self.inventory()
+        reclaimed = compressed = removed = 0
+        if total <= self.budget:
+            return reclaimed, compressed, removed, total
+
+        # 压缩不丢失内容，优先进行
+        for i, (rotated, path, size) in enumerate(segments):
+            if self.isInterruptionRequested():
+                return reclaimed, compressed, removed, total
+            if path.endswith('.gz'):
+                continue
+            try:
+                target = compress_log_segment(path)
+            except (OSError, EOFError):
+                continue
+            if target is not None:
+                saved = size - os.path.getsize(target)
+                segments[i] = (rotated, target, size - saved)
+                total -= saved
+                reclaimed += saved
+                compressed += 1
+
+        # 仍超出预算时删除日志段：从最旧的开始挑选没有失败的日志段，
+        # 凑够需要释放的空间就停止检查，不够时再按从旧到新删除包含失败的日志段
+        doomed = []
+        failing = []
+        excess = total - self.budget
+        for rotated, path, size in segments:
+            if excess <= 0 or self.isInterruptionRequested():
+                break
+            try:
+                failed = self.has_failure(path)
+            except (OSError, EOFError, zlib.error):
+                failed = False  # 损坏的日志段直接删除
+            if failed:
+                failing.append((path, size))
+            else:
+                doomed.append((path, size))
+                excess -= size
+        for path, size in doomed + failing:
+            if total <= self.budget:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.failure_cache.pop(path, None)
+            total -= size
+            reclaimed += size
+            removed += 1
+        return reclaimed, compressed, removed, total
+
+    def run(self):
+        try:
+            result = self.compact()
+        except OSError as e:
+            print(f"整理日志目录时出错: {str(e)}")
+            return
+        self.report.emit(*result)
+
+
+# 全文搜索的一条结果：日志文件、匹配行的字节偏移、所在执行的开始时间和匹配行内容
+SearchHit = namedtuple('SearchHit', ['path', 'offset', 'started', 'line'])
+
+
+class LogSearchIndex:
+    """日志目录中所有日志（包括已轮转和压缩的日志段）的全文索引
+
+    索引保存在 SQLite 中：chunks 表按执行和行边界把日志切成不超过 CHUNK_BYTES 的片段，
+    chunks_fts 是以 trigram 分词的 FTS5 外部内容表，任意至少3个字符的子串都可以走索引查询；
+    索引不保存词的位置（detail=none），体积和建立索引的时间都更小，候选片段再逐行确认。
+    files 表记录每个文件已索引到的字节偏移，每次同步只读取新追加的内容；
+    日志轮转时按 inode 识别被改名的文件，日志段被压缩后沿用原来的索引，不需要重新读取。
+    需要读取的文件由多个工作线程并行切片，唯一的写入者负责写入数据库。
+    片段文本按 UTF-8 解码，含无效字节的片段另外保存每行的字节偏移，搜索结果总能定位到原文件中的行。
+    """
+
+    SCHEMA_VERSION = 2  # 表结构变化时递增，旧版本的索引被丢弃后重建
+    CHUNK_BYTES = 16 * 1024
+    READ_BYTES = 8 * 1024 * 1024
+    WORKERS = 4
+    SEPARATOR_PATTERN = re.compile(r'^执行时间: (\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\s*$'.encode('utf-8'), re.M)
+
+    def __init__(self, path, log_dir):
+        self.path = path
+        self.log_dir = log_dir
+
+    def connect(self):
+        """每个线程使用自己的连接"""
+        conn = sqlite3.connect(self.path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        with conn:
+            if conn.execute('PRAGMA user_version').fetchone()[0] < self.SCHEMA_VERSION:
+                conn.executescript(
+                    'DROP TABLE IF EXISTS chunks_fts; DROP TABLE IF EXISTS chunks; DROP TABLE IF EXISTS files;'
+                    f'PRAGMA user_version = {self.SCHEMA_VERSION};')
+            # lines 为片段中每行相对片段起点的字节偏移（array('I')），片段是有效的 UTF-8 时为 NULL
+            conn.executescript(
+                'CREATE TABLE IF NOT EXISTS files ('
+                ' id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE, inode INTEGER NOT NULL,'
+                ' indexed INTEGER NOT NULL, started INTEGER NOT NULL, compressed INTEGER NOT NULL);'
+                'CREATE TABLE IF NOT EXISTS chunks ('
+                ' id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL, offset INTEGER NOT NULL,'
+                ' started INTEGER NOT NULL, text TEXT NOT NULL, lines BLOB);'
+                'CREATE INDEX IF NOT EXISTS chunks_file ON chunks(file_id);'
+                "CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5("
+                " text, content='chunks', content_rowid='id', tokenize='trigram', detail='none');"
+                'CREATE TRIGGER IF NOT EXISTS chunks_insert AFTER INSERT ON chunks BEGIN'
+                ' INSERT INTO chunks_fts(rowid, text) VALUES (new.id, new.text); END;'
+                'CREATE TRIGGER IF NOT EXISTS chunks_delete AFTER DELETE ON chunks BEGIN'
+                " INSERT INTO chunks_fts(chunks_fts, rowid, text) VALUES ('delete', old.id, old.text); END;")
+        return conn
+
+    def log_files(self):
+        """日志目录中的当前日志和已轮转的日志段：路径 -> stat"""
+        files = {}
+        for entry in os.scandir(self.log_dir):
+            position = entry.name.rfind('.log.')
+            if not (entry.name.endswith('.log') or
+                    position >= 0 and SEGMENT_PATTERN.fullmatch(entry.name[position + 4:])):
+                continue
+            try:
+                files[entry.path] = entry.stat()
+            except OSError:
+                continue
+        return files
+
+    def read_chunks(self, path, offset, started, compressed):
+        """从 offset 开始切分文件中完整的行，逐个返回 (偏移, 执行开始时间, 文本, 行偏移)，最后返回 (偏移, 开始时间, None, None)"""
+        opener = gzip.open if compressed else open
+        with opener(path, 'rb') as f:
+            f.seek(offset)
+            pending = b''
+            while True:
+                block = f.read(self.READ_BYTES)
+                if not block:
+                    break  # 不完整的最后一行留到下次同步
+                data = pending + block
+                end = data.rfind(b'\n') + 1
+                pending = data[end:]
+                data = data[:end]
+                if not data:
+                    continue
+                # 每次执行的分隔行开始一个新片段，片段的开始时间就是所属执行的开始时间
+                bounds = [(0, started)]
+                for match in self.SEPARATOR_PATTERN.finditer(data):
+                    moment = datetime.datetime.strptime(match.group(1).decode(), '%Y-%m-%d %H:%M:%S')
+                    bounds.append((match.start(), int(moment.timestamp())))
+                bounds.append((len(data), None))
+                for (start, run_started), (stop, _) in zip(bounds, bounds[1:]):
+                    while start < stop:
+                        cut = data.rfind(b'\n', start, min(stop, start + self.CHUNK_BYTES)) + 1
+                        if cut <= start:
+                            cut = data.find(b'\n', start, stop) + 1 or stop  # 超长的行单独成为一个片段
+                        yield (offset + start, run_started) + self.decode_chunk(data[start:cut])
+                        start = cut
+                    started = run_started
+                offset += end
+        yield offset, started, None, None
+
+    @staticmethod
+    def decode_chunk(raw):
+        """返回 (文本, 行偏移)；含无效 UTF-8 字节时解码后的长度与原文不一致，另外记录每行的字节偏移"""
+        try:
+            return raw.decode('utf-8'), None
+        except UnicodeDecodeError:
+            starts = array('I', [0])
+            starts.extend(match.end() for match in re.finditer(b'\n', raw[:-1]))
+            return raw.decode('utf-8', 'replace'), starts.tobytes()
+
+    def sync(self, conn, progress=None):
+        """把索引同步到日志目录的当前状态"""
+        disk = self.log_files()
+        known = {row[1]: row for row in conn.execute(
+            'SELECT id, path, inode, indexed, started, compressed FROM files')}
+        inodes = {st.st_ino: path for path, st in disk.items()}
+
+        jobs = []
+        with conn:
+            for path, (file_id, _, inode, indexed, started, compressed) in list(known.items()):
+                st = disk.get(path)
+                if st is not None and st.st_ino == inode:
+                    continue
+                # 当前日志被轮转改名为日志段，或日志段被压缩：沿用已有的索引
+                renamed = inodes.get(inode)
+                if renamed is not None and not (renamed.startswith(path + '.') and disk[renamed].st_size >= indexed):
+                    renamed = None  # inode 被其他文件重用
+                if renamed is None and not compressed and st is None and path + '.gz' in disk:
+                    renamed = path + '.gz'
+                if renamed is not None and renamed not in known:
+                    gz = renamed.endswith('.gz')
+                    conn.execute('UPDATE files SET path = ?, inode = ?, indexed = ?, compressed = ? WHERE id = ?',
+                                 (renamed, disk[renamed].st_ino, disk[renamed].st_size if gz else indexed, int(gz),
+                                  file_id))
+                    known[renamed] = (file_id, renamed, disk[renamed].st_ino,
+                                      disk[renamed].st_size if gz else indexed, started, int(gz))
+                elif st is not None:
+                    continue  # 文件被替换，下面从头索引
+                else:
+                    conn.execute('DELETE FROM chunks WHERE file_id = ?', (file_id,))
+                    conn.execute('DELETE FROM files WHERE id = ?', (file_id,))
+                del known[path]
+
+            for path, st in disk.items():
+                compressed = path.endswith('.gz')
+                row = known.get(path)
+                if row is not None and row[2] == st.st_ino and (compressed or st.st_size >= row[3]):
+                    if compressed or st.st_size == row[3]:
+                        continue
+                    jobs.append((row[0], path, row[3], row[4], False))
+                    continue
+                # 新文件，或文件被替换、截断：从头索引
+                if row is not None:
+                    conn.execute('DELETE FROM chunks WHERE file_id = ?', (row[0],))
+                    conn.execute('DELETE FROM files WHERE id = ?', (row[0],))
+                cursor = conn.execute(
+                    'INSERT INTO files (path, inode, indexed, started, compressed) VALUES (?, ?, 0, 0, ?)',
+                    (path, st.st_ino, int(compressed)))
+                jobs.append((cursor.lastrowid, path, 0, 0, compressed))
+
+        if not jobs:
+            return
+        # 多个线程并行读取和切片，结果通过有界队列交给当前线程写入数据库
+        results = queue.Queue(maxsize=64)
+
+        def work(job):
+            file_id, path, offset, started, compressed = job
+            batch = []
+            try:
+                for chunk_offset, chunk_started, text, lines in self.read_chunks(path, offset, started, compressed):
+                    if text is None:
+                        results.put((file_id, batch, (chunk_offset, chunk_started)))
+                        return
+                    batch.append((file_id, chunk_offset, chunk_started or 0, text, lines))
+                    if len(batch) >= 256:
+                        results.put((file_id, batch, None))
+                        batch = []
+            except (OSError, EOFError, zlib.error) as e:
+                print(f"索引日志 {path} 时出错: {str(e)}")
+            results.put((file_id, batch, False))
+
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            for job in jobs:
+                pool.submit(work, job)
+            while done < len(jobs):
+                file_id, batch, state = results.get()
+                with conn:
+                    conn.executemany('INSERT INTO chunks (file_id, offset, started, text, lines) VALUES (?, ?, ?, ?, ?)',
+                                     batch)
+                    if state:
+                        offset, started = state
+                        conn.execute('UPDATE files SET indexed = ?, started = ? WHERE id = ?',
+                                     (offset, started or 0, file_id))
+                if state is not None:
+                    done += 1
+                    if progress is not None:
+                        progress(done, len(jobs))
+
+    def search(self, conn, text, since=0, limit=2000):
+        """返回包含 text 的行（不区分大小写），按执行时间从新到旧排列，最多 limit 行"""
+        # trigram 分词的 FTS5 表可以直接用索引执行 LIKE（至少3个连续的非通配字符，否则退化为扫描）；
+        # 文本中的 % 和 _ 换成单字符通配符，多匹配的片段在下面逐行查找时被排除
+        pattern = '%' + text.replace('%', '_') + '%'
+        cursor = conn.execute(
+            'SELECT f.path, c.offset, c.started, c.text, c.lines FROM chunks_fts'
+            ' JOIN chunks c ON c.id = chunks_fts.rowid JOIN files f ON f.id = c.file_id'
+            ' WHERE chunks_fts.text LIKE ? AND c.started >= ? ORDER BY c.started DESC, c.offset DESC',
+            (pattern, since))
+        # 逐行比较 casefold 后的文本，不依赖大小写转换前后字符位置一致；
+        # 行的字节偏移取自索引时记录的行偏移，或由有效的 UTF-8 文本重新编码得到
+        needle = text.casefold()
+        hits = []
+        for path, offset, started, chunk, lines in cursor:
+            if needle not in chunk.casefold():
+                continue
+            starts = None
+            if lines is not None:
+                starts = array('I')
+                starts.frombytes(lines)
+            line_offset = 0
+            for number, line in enumerate(chunk.split('\n')):
+                if needle in line.casefold():
+                    position = starts[number] if starts is not None else line_offset
+                    hits.append(SearchHit(path, offset + position, started, line))
+                    if len(hits) >= limit:
+                        return hits
+                if starts is None:
+                    line_offset += len(line.encode('utf-8')) + 1
+        return hits
+
+
+class LogSearchWorker(QThread):
+    """在后台线程中同步索引并执行一次搜索"""
+
+    progress = pyqtSignal(int, int)
+    results = pyqtSignal(list, float)
+    failed = pyqtSignal(str)  # 无法建立或查询索引时的错误信息
+
+    def __init__(self, index, text, since, parent=None):
+        super().__init__(parent)
+        self.index = index
+        self.text = text
+        self.since = since
+
+    def run(self):
+        began = time.monotonic()
+        hits = []
+        try:
+            conn = self.index.connect()
+            try:
+                self.index.sync(conn, lambda done, total: self.progress.emit(done, total))
+                hits = self.index.search(conn, self.text, self.since)
+            finally:
+                conn.close()
+        except (OSError, sqlite3.Error) as e:
+            # 例如 SQLite 未编译 FTS5 或不支持 trigram 分词
+            self.failed.emit(str(e))
+            return
+        self.results.emit(hits, time.monotonic() - began)
+
+
+class LogSearchDialog(QDialog):
+    """在所有任务的日志中搜索文本，双击结果在日志查看器中定位到匹配的行"""
+
+    RANGES = [('最近1小时', 3600), ('最近1天', 86400), ('最近7天', 7 * 86400), ('全部', None)]
+
+    open_requested = pyqtSignal(str, 'qint64')  # 日志文件（可能是已轮转的日志段）、字节偏移
+
+    def __init__(self, index, names, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('搜索日志')
+        self.resize(900, 560)
+        self.index = index
+        self.names = names  # 当前日志路径 -> 任务名称
+        self.worker = None
+
+        layout = QVBoxLayout(self)
+        search_layout = QHBoxLayout()
+        self.query_edit = QLineEdit()
+        self.query_edit.setPlaceholderText('输入要查找的文本，例如错误信息')
+        self.query_edit.returnPressed.connect(self.search)
+        search_layout.addWidget(self.query_edit)
+        self.range_combo = QComboBox()
+        for text, seconds in self.RANGES:
+            self.range_combo.addItem(text, seconds)
+        self.range_combo.setCurrentIndex(1)
+        search_layout.addWidget(self.range_combo)
+        self.search_button = QPushButton('搜索')
+        self.search_button.clicked.connect(self.search)
+        search_layout.addWidget(self.search_button)
+        layout.addLayout(search_layout)
+
+        self.status_label = QLabel('首次搜索需要为全部日志建立索引，之后只索引新增的内容')
+        self.status_label.setStyleSheet('color: #666;')
+        layout.addWidget(self.status_label)
+
+        self.table = QTableWidget(0, 3)
+        self.table.setHorizontalHeaderLabels(['任务', '执行时间', '内容'])
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.setColumnWidth(0, 160)
+        self.table.setColumnWidth(1, 150)
+        self.table.cellDoubleClicked.connect(self.open_hit)
+        layout.addWidget(self.table)
+        self.hits = []
+
+    def job_name(self, path):
+        """日志段对应其当前日志所属的任务"""
+        position = path.rfind('.log.')
+        current = path[:position + 4] if position >= 0 else path
+        return self.names.get(current, os.path.basename(current)[:-4])
+
+    def search(self):
+        text = self.query_edit.text().strip()
+        if not text or (self.worker is not None and self.worker.isRunning()):
+            return
+        seconds = self.range_combo.currentData()
+        since = int(time.time()) - seconds if seconds else 0
+        self.search_button.setEnabled(False)
+        self.status_label.setText('正在更新索引...')
+        self.worker = LogSearchWorker(self.index, text, since, self)
+        self.worker.progress.connect(lambda done, total: self.status_label.setText(f'正在索引 {done}/{total} 个日志文件...'))
+        self.worker.results.connect(self.show_results)
+        self.worker.failed.connect(self.show_error)
+        self.worker.start()
+
+    def show_results(self, hits, seconds):
+        self.search_button.setEnabled(True)
+        self.hits = hits
+        self.table.setRowCount(len(hits))
+        for row, hit in enumerate(hits):
+            started = datetime.datetime.fromtimestamp(hit.started).strftime('%Y-%m-%d %H:%M:%S') if hit.started else ''
+            for column, text in enumerate((self.job_name(hit.path), started, hit.line.strip())):
+                self.table.setItem(row, column, QTableWidgetItem(text))
+        jobs = len({self.job_name(hit.path) for hit in hits})
+        self.status_label.setText(f'{len(hits)} 行匹配，涉及 {jobs} 个任务，用时 {seconds:.2f} 秒'
+                                  '（双击结果查看日志）')
+
+    def show_error(self, error):
+        self.search_button.setEnabled(True)
+        self.hits = []
+        self.table.setRowCount(0)
+        self.status_label.setText(f'搜索日志失败：{error}')
+
+    def open_hit(self, row, column):
+        hit = self.hits[row]
+        self.open_requested.emit(hit.path, hit.offset)
+
+    def done(self, result):
+        if self.worker is not None:
+            self.worker.wait()
+        super().done(result)
+
+
+# 合并时间线中的一次执行：开始时间、所属日志的序号、在日志中的起止字节偏移和结果
+MergedRun = namedtuple('MergedRun', ['started', 'source', 'start', 'end', 'outcome'])
+
+
+class MergedLogDialog(QDialog):
+    """按执行开始时间合并多个任务日志的时间线
+
+    每个日志的执行索引（RunIndex）本身按时间排列，用 heapq.merge 做 k 路归并得到合并后的执行列表；
+    列表只包含偏移和时间，内容只在显示时读取当前窗口内的 WINDOW_RUNS 次执行，日志再大也不需要整体读入。
+    每个任务使用一种颜色，可以按任务和结果筛选。
+    """
+
+    COLORS = ['#1565c0', '#2e7d32', '#c62828', '#6a1b9a', '#ef6c00', '#00838f', '#5d4037', '#ad1457']
+    WINDOW_RUNS = 20             # 每页显示的执行次数
+    MAX_RUN_BYTES = 64 * 1024    # 每次执行最多显示的字节数
+
+    def __init__(self, sources, parent=None):
+        """sources 为 [(任务名称, 日志路径, 执行索引路径), ...]"""
+        super().__init__(parent)
+        self.setWindowTitle('合并日志时间线')
+        self.resize(1000, 700)
+        self.names = [name for name, _, _ in sources]
+        self.paths = [path for _, path, _ in sources]
+        self.indexes = [RunIndex(path, index_path) for _, path, index_path in sources]
+        # 首次打开没有执行索引的大日志时在后台扫描，扫描进度到达时重新合并
+        self.updaters = [RunIndexUpdater(index, self) for index in self.indexes]
+        for updater in self.updaters:
+            updater.changed.connect(self.merge_runs)
+        self.files = {}
+        self.runs = []       # 归并后的全部执行
+        self.visible = []    # 筛选后的执行
+        self.first = 0       # 当前页第一次执行在 visible 中的位置
+        self.follow_end = True
+
+        layout = QVBoxLayout(self)
+        filter_layout = QHBoxLayout()
+        self.source_checks = []
+        for i, name in enumerate(self.names):
+            check = QCheckBox(name)
+            check.setChecked(True)
+            check.setStyleSheet(f'color: {self.color(i)}; font-weight: bold;')
+            check.toggled.connect(self.apply_filter)
+            filter_layout.addWidget(check)
+            self.source_checks.append(check)
+        filter_layout.addStretch()
+        self.failed_only_check = QCheckBox('仅显示失败')
+        self.failed_only_check.toggled.connect(self.apply_filter)
+        filter_layout.addWidget(self.failed_only_check)
+        layout.addLayout(filter_layout)
+
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+        self.text.setStyleSheet('font-family: monospace; background-color: #f8f9fa; padding: 10px;')
+        layout.addWidget(self.text)
+
+        nav_layout = QHBoxLayout()
+        self.start_button = QPushButton('最早')
+        self.start_button.clicked.connect(lambda: self.show_page(0))
+        nav_layout.addWidget(self.start_button)
+        self.older_button = QPushButton('较早')
+        self.older_button.clicked.connect(lambda: self.show_page(self.first - self.WINDOW_RUNS))
+        nav_layout.addWidget(self.older_button)
+        self.position_slider = QScrollBar(Qt.Orientation.Horizontal)
+        self.position_slider.valueChanged.connect(self.on_slider)
+        nav_layout.addWidget(self.position_slider, 1)
+        self.newer_button = QPushButton('较新')
+        self.newer_button.clicked.connect(lambda: self.show_page(self.first + self.WINDOW_RUNS))
+        nav_layout.addWidget(self.newer_button)
+        self.end_button = QPushButton('最新')
+        self.end_button.clicked.connect(self.show_end)
+        nav_layout.addWidget(self.end_button)
+        self.status_label = QLabel()
+        self.status_label.setStyleSheet('color: #666;')
+        nav_layout.addWidget(self.status_label)
+        layout.addLayout(nav_layout)
+
+        # 任一日志变化时合并新的执行
+        self.watched = list(self.paths)
+        self.watch_service = FileWatchService.instance()
+        for path in self.watched:
+            self.watch_service.watch(path)
+        self.watch_service.changed.connect(self.on_file_changed)
+        self.finished.connect(self.stop)
+        self.update_runs()
+
+    def color(self, source):
+        return self.COLORS[source % len(self.COLORS)]
+
+    def update_runs(self):
+        changed = False
+        for updater in self.updaters:
+            changed = updater.update() or changed
+        if changed:
+            self.merge_runs()
+
+    def merge_runs(self):
+        # 日志可能已被轮转，重新打开
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
+        sizes = []
+        for path in self.paths:
+            try:
+                sizes.append(os.path.getsize(path))
+            except OSError:
+                sizes.append(0)
+
+        def stream(source):
+            runs = self.indexes[source].runs
+            for i, run in enumerate(runs):
+                end = runs[i + 1].offset if i + 1 < len(runs) else sizes[source]
+                yield MergedRun(run.started, source, run.offset, end, run.outcome)
+
+        # 时间相同的执行按任务的顺序排列
+        self.runs = list(heapq.merge(*(stream(source) for source in range(len(self.paths))),
+                                     key=lambda run: (run.started, run.source)))
+        self.apply_filter()
+
+    def apply_filter(self):
+        enabled = {i for i, check in enumerate(self.source_checks) if check.isChecked()}
+        failed_only = self.failed_only_check.isChecked()
+        self.visible = [run for run in self.runs
+                        if run.source in enabled and (not failed_only or run.outcome == '失败')]
+        self.position_slider.blockSignals(True)
+        self.position_slider.setRange(0, max(0, len(self.visible) - self.WINDOW_RUNS))
+        self.position_slider.setPageStep(self.WINDOW_RUNS)
+        self.position_slider.blockSignals(False)
+        if self.follow_end:
+            self.show_end()
+        else:
+            self.show_page(self.first)
+
+    def show_end(self):
+        self.show_page(len(self.visible) - self.WINDOW_RUNS)
+        self.follow_end = True
+
+    def on_slider(self, value):
+        self.show_page(value)
+
+    def show_page(self, first):
+        self.first = max(0, min(first, len(self.visible) - self.WINDOW_RUNS))
+        self.follow_end = self.first + self.WINDOW_RUNS >= len(self.visible)
+        self.position_slider.blockSignals(True)
+        self.position_slider.setValue(self.first)
+        self.position_slider.blockSignals(False)
+        page = self.visible[self.first:self.first + self.WINDOW_RUNS]
+        self.older_button.setEnabled(self.first > 0)
+        self.start_button.setEnabled(self.first > 0)
+        self.newer_button.setEnabled(not self.follow_end)
+        self.end_button.setEnabled(not self.follow_end)
+        if page:
+            self.status_label.setText(f'第 {self.first + 1}-{self.first + len(page)} 次 / 共 {len(self.visible)} 次')
+        else:
+            self.status_label.setText('没有执行记录')
+        self.render(page)
+
+    def read_run(self, run):
+        """读取一次执行的日志内容，过长时只显示开头部分"""
+        f = self.files.get(run.source)
+        if f is None:
+            f = self.files[run.source] = open(self.paths[run.source], 'rb')
+        f.seek(run.start)
+        length = max(0, run.end - run.start)
+        data = f.read(min(length, self.MAX_RUN_BYTES))
+        text = data.decode('utf-8', 'replace').strip('\n')
+        if length > self.MAX_RUN_BYTES:
+            text += f'\n...（省略 {length - self.MAX_RUN_BYTES} 字节，请在日志查看器中查看完整内容）'
+        return text
+
+    def render(self, page):
+        self.text.clear()
+        cursor = QTextCursor(self.text.document())
+        for run in page:
+            header = QTextCharFormat()
+            header.setForeground(QColor(self.color(run.source)))
+            header.setFontWeight(QFont.Weight.Bold)
+            outcome = run.outcome or '未结束'
+            cursor.insertText(f'■ {self.names[run.source]}  {run.started}  {outcome}\n', header)
+            body = QTextCharFormat()
+            body.setForeground(QColor(self.color(run.source)))
+            try:
+                content = self.read_run(run)
+            except OSError as e:
+                content = f'读取日志失败：{str(e)}'
+            # 去掉日志中的分隔线，只保留命令输出
+            lines = [line for line in content.split('\n')
+                     if not line.startswith('-' * 40) and not line.startswith('执行时间: ')]
+            cursor.insertText('\n'.join(lines).strip('\n') + '\n\n', body)
+        if self.follow_end:
+            self.text.verticalScrollBar().setValue(self.text.verticalScrollBar().maximum())
+
+    def on_file_changed(self, path, start, end, replaced):
+        if path in self.watched:
+            self.update_runs()
+
+    def stop(self):
+        if self.watched:
+            self.watch_service.changed.disconnect(self.on_file_changed)
+            for path in self.watched:
+                self.watch_service.unwatch(path)
+            self.watched = []
+        for updater in self.updaters:
+            updater.stop()
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
+
+
+class FileWatchService(QObject):
+    """应用范围内共享的文件监视服务
+
+    日志查看器、合并时间线以及驱动任务列表和托盘菜单的 CrontabWatcher 都通过同一个实例订阅路径，
+    同一路径只注册一次 QFileSystemWatcher（Linux 上为 inotify，macOS 上为 kqueue），
+    并同时监视所在目录，文件被重命名替换或稍后才创建时也能收到事件。
+    事件在 DEBOUNCE_INTERVAL 内合并，随后比较 stat 指纹，只有确实变化时才发出 changed 信号并附带变化的字节范围：
+    追加时为 [原大小, 新大小)，被截断、替换或删除时 replaced 为 True，范围为整个新文件；目录变化时范围为空。
+    没有变化的文件不会被读取；无法注册监视的路径（例如所在目录还不存在）退化为每 POLL_INTERVAL 比较一次指纹。
+    """
+
+    changed = pyqtSignal(str, 'qint64', 'qint64', bool)  # 路径、起始偏移、结束偏移、是否被截断或替换
+
+    DEBOUNCE_INTERVAL = 200  # 毫秒
+    POLL_INTERVAL = 5000     # 毫秒
+
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        """整个应用共享的实例"""
+        if cls._instance is None:
+            cls._instance = cls(QApplication.instance())
+        return cls._instance
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.subscribers = {}   # 路径 -> 订阅次数
+        self.prints = {}        # 路径 -> (inode, 大小, mtime)，不存在时为 None
+        self.pending = set()
+        self.polled = set()     # 无法注册监视、需要轮询的路径
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.on_event)
+        self.watcher.directoryChanged.connect(self.on_event)
+
+        self.debounce_timer = QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.setInterval(self.DEBOUNCE_INTERVAL)
+        self.debounce_timer.timeout.connect(self.flush)
+
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(self.POLL_INTERVAL)
+        self.poll_timer.timeout.connect(lambda: self.check(self.polled))
+
+    @staticmethod
+    def fingerprint(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def watch(self, path):
+        """订阅路径的变化，与 unwatch 成对调用"""
+        self.subscribers[path] = self.subscribers.get(path, 0) + 1
+        if self.subscribers[path] == 1:
+            self.prints[path] = self.fingerprint(path)
+            self.register(path)
+
+    def unwatch(self, path):
+        count = self.subscribers.get(path, 0) - 1
+        if count > 0:
+            self.subscribers[path] = count
+            return
+        self.subscribers.pop(path, None)
+        self.prints.pop(path, None)
+        self.pending.discard(path)
+        self.polled.discard(path)
+        still_needed = {os.path.dirname(other) for other in self.subscribers} | set(self.subscribers)
+        for watched in (path, os.path.dirname(path)):
+            if watched not in still_needed and watched in self.watcher.files() + self.watcher.directories():
+                self.watcher.removePath(watched)
+        if not self.polled:
+            self.poll_timer.stop()
+
+    def register(self, path):
+        """注册路径及其所在目录，两者都无法注册时改为轮询"""
+        for target in (os.path.dirname(path), path):
+            if target not in self.watcher.files() + self.watcher.directories() and os.path.exists(target):
+                self.watcher.addPath(target)
+        watched = self.watcher.files() + self.watcher.directories()
+        # 文件本身还不存在时依靠目录事件发现它的创建，目录也不存在时只能轮询
+        if path in watched or os.path.dirname(path) in watched:
+            self.polled.discard(path)
+        else:
+            self.polled.add(path)
+            self.poll_timer.start()
+
+    def sync(self, path):
+        """以当前状态为基准，之后只报告新的变化（例如本程序自己写入之后）"""
+        if path in self.subscribers:
+            self.prints[path] = self.fingerprint(path)
+            self.pending.discard(path)
+
+    def on_event(self, path):
+        if path in self.subscribers:
+            self.pending.add(path)
+        # 目录事件：该目录下订阅的文件可能被创建、删除或替换
+        self.pending.update(other for other in self.subscribers if os.path.dirname(other) == path)
+        if self.pending:
+            self.debounce_timer.start()
+
+    def flush(self):
+        pending, self.pending = self.pending, set()
+        self.check(pending)
+
+    def check(self, paths):
+        for path in list(paths):
+            if path not in self.subscribers:
+                continue
+            old = self.prints.get(path)
+            new = self.fingerprint(path)
+            if new == old:
+                continue
+            self.prints[path] = new
+            if new is not None and (path in self.polled or path not in self.watcher.files()):
+                self.register(path)  # 文件被替换后需要重新注册
+            if os.path.isdir(path):
+                self.changed.emit(path, 0, 0, False)
+            elif old is not None and new is not None and new[0] == old[0] and new[1] > old[1]:
+                self.changed.emit(path, old[1], new[1], False)
+            else:
+                self.changed.emit(path, 0, new[1] if new is not None else 0, True)
+
+    def stop(self):
+        self.debounce_timer.stop()
+        self.poll_timer.stop()
+        paths = self.watcher.files() + self.watcher.directories()
+        if paths:
+            self.watcher.removePaths(paths)
+        self.subscribers.clear()
+        self.prints.clear()
+        self.pending.clear()
+        self.polled.clear()
+
+
+class CrontabWatcher(QObject):
+    """监视用户crontab、脚本目录和执行记录账本的变化
+
+    文件事件通过共享的 FileWatchService 订阅，只有指纹确实变化时才发出信号。
+    如果 crontab 的 spool 文件不可访问（大多数 Linux 发行版对普通用户不可读），
+    则每隔几秒 stat 一次 spool 目录本身（所有用户都可以 stat），目录的 mtime 变化时才运行 `crontab -l` 比较摘要；
+    连 spool 目录也找不到时退化为定期比较 `crontab -l` 输出的摘要。
+    """
+
+    crontab_changed = pyqtSignal()
+    scripts_changed = pyqtSignal()
+    runs_changed = pyqtSignal()
+
+    SPOOL_DIRS = [
+        '/var/spool/cron/crontabs',  # Debian/Ubuntu
+        '/var/spool/cron',           # RHEL/Fedora
+        '/var/cron/tabs',            # FreeBSD
+        '/usr/lib/cron/tabs',        # macOS
+        '/var/at/tabs',              # macOS/FreeBSD
+    ]
+    SPOOL_POLL_INTERVAL = 3000    # spool 目录 mtime 轮询间隔（毫秒）
+    DIGEST_POLL_INTERVAL = 60000  # crontab -l 摘要轮询间隔（毫秒）
+
+    def __init__(self, scripts_dir, ledger_path=None, parent=None, service=None):
+        super().__init__(parent)
+        self.scripts_dir = scripts_dir
+        self.ledger_path = ledger_path
+        self.spool_file = self.find_spool_file()
+        self.spool_dir = self.find_spool_dir() if not self.spool_file else None
+        self.service = service or FileWatchService.instance()
+        self.paths = [path for path in (scripts_dir, ledger_path, self.spool_file) if path]
+        for path in self.paths:
+            self.service.watch(path)
+        self.service.changed.connect(self.on_changed)
+
+        self.poll_timer = QTimer(self)
+        if self.spool_dir:
+            self.poll_timer.timeout.connect(self.check_spool_dir)
+            self.poll_timer.start(self.SPOOL_POLL_INTERVAL)
+        elif not self.spool_file:
+            self.poll_timer.timeout.connect(self.check_digest)
+            self.poll_timer.start(self.DIGEST_POLL_INTERVAL)
+
+        self.reset()
+
+    def find_spool_file(self):
+        """查找当前用户可以stat的crontab spool文件"""
+        user = getpass.getuser()
+        for directory in self.SPOOL_DIRS:
+            path = os.path.join(directory, user)
+            try:
+                os.stat(path)
+                return path
+            except OSError:
+                continue
+        return None
+
+    def find_spool_dir(self):
+        """查找存在的crontab spool目录，crontab 写入时会在其中替换文件，目录的 mtime 随之变化"""
+        for directory in self.SPOOL_DIRS:
+            if self.dir_fingerprint(directory) is not None:
+                return directory
+        return None
+
+    @staticmethod
+    def dir_fingerprint(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns)
+
+    def crontab_digest(self):
+        try:
+            output = subprocess.run(['crontab', '-l'], capture_output=True).stdout
+        except OSError:
+            return None
+        return hashlib.sha1(output).hexdigest()
+
+    def reset(self):
+        """以当前状态为基准，之后只报告新的变化（例如本程序自己写入crontab之后）"""
+        for path in self.paths:
+            self.service.sync(path)
+        self.spool_print = self.dir_fingerprint(self.spool_dir) if self.spool_dir else None
+        self.digest = self.crontab_digest() if not self.spool_file else None
+
+    def on_changed(self, path, start, end, replaced):
+        if path == self.spool_file:
+            self.crontab_changed.emit()
+        elif path == self.scripts_dir:
+            self.scripts_changed.emit()
+        elif path == self.ledger_path:
+            self.runs_changed.emit()
+
+    def check_spool_dir(self):
+        spool_print = self.dir_fingerprint(self.spool_dir)
+        if spool_print != self.spool_print:
+            self.spool_print = spool_print
+            self.check_digest()
+
+    def check_digest(self):
+        digest = self.crontab_digest()
+        if digest != self.digest:
+            self.digest = digest
+            self.crontab_changed.emit()
+
+    def stop(self):
+        self.poll_timer.stop()
+        self.service.changed.disconnect(self.on_changed)
+        for path in self.paths:
+            self.service.unwatch(path)
+        self.paths = []
+
+
+class JobIndex:
+    """任务索引
+
+    维护 名称 -> CronItem 和 任务ID -> CronItem 的映射，查找都是 O(1)。
+    任务ID按名称分配，crontab重新加载后同名任务保持原来的ID，
+    因此界面可以用ID而不是表格行号来定位任务。
+    """
+
+    def __init__(self):
+        self.by_name = {}    # 名称 -> [CronItem]，外部编辑可能产生同名任务
+        self.by_id = {}      # 任务ID -> CronItem
+        self.item_ids = {}   # id(CronItem) -> 任务ID
+        self.ids = {}        # (名称, 同名序号) -> 任务ID，跨重新加载保持稳定
+        self.keys = {}       # 任务ID -> (名称, 同名序号)
+
+    def new_id(self):
+        return uuid.uuid4().hex[:12]
+
+    def rebuild(self, cron):
+        """按当前crontab内容重建索引"""
+        self.by_name = {}
+        self.by_id = {}
+        self.item_ids = {}
+        for job in cron:
+            occurrence = len(self.by_name.get(job.comment, ()))
+            self.insert(job, (job.comment, occurrence))
+
+    def insert(self, job, key):
+        job_id = self.ids.get(key)
+        if job_id is None:
+            job_id = self.new_id()
+            self.ids[key] = job_id
+            self.keys[job_id] = key
+        self.by_id[job_id] = job
+        self.item_ids[id(job)] = job_id
+        self.by_name.setdefault(job.comment, []).append(job)
+        return job_id
+
+    def remember(self, name, job_id):
+        """采用元数据存储中持久化的任务ID，已经绑定到任务的ID不会被替换"""
+        key = (name, 0)
+        current = self.ids.get(key)
+        # 已经属于某个任务的ID由 rename 负责迁移
+        if current == job_id or current in self.by_id or job_id in self.by_id:
+            return
+        if current is not None:
+            self.keys.pop(current, None)
+        self.ids[key] = job_id
+        self.keys[job_id] = key
+
+    def add(self, job):
+        """登记新建的任务，返回它的ID"""
+        occurrence = 0
+        while self.ids.get((job.comment, occurrence)) in self.by_id:
+            occurrence += 1
+        return self.insert(job, (job.comment, occurrence))
+
+    def remove(self, jobs):
+        for job in jobs:
+            job_id = self.item_ids.pop(id(job), None)
+            if job_id is None:
+                continue
+            del self.by_id[job_id]
+            self.ids.pop(self.keys.pop(job_id), None)
+            self.discard_name(job, job.comment)
+
+    def rename(self, job, old_name):
+        """任务改名后更新索引，ID保持不变"""
+        job_id = self.item_ids.get(id(job))
+        if job_id is None:
+            return
+        self.discard_name(job, old_name)
+        self.ids.pop(self.keys[job_id], None)
+        occurrence = len(self.by_name.get(job.comment, ()))
+        self.ids[(job.comment, occurrence)] = job_id
+        self.keys[job_id] = (job.comment, occurrence)
+        self.by_name.setdefault(job.comment, []).append(job)
+
+    def discard_name(self, job, name):
+        # CronItem 按内容比较相等，这里必须按对象身份移除
+        jobs = [other for other in self.by_name.get(name, []) if other is not job]
+        if jobs:
+            self.by_name[name] = jobs
+        else:
+            self.by_name.pop(name, None)
+
+    def id_of(self, job):
+        return self.item_ids.get(id(job))
+
+    def get(self, name):
+        jobs = self.by_name.get(name)
+        return jobs[0] if jobs else None
+
+    def get_by_id(self, job_id):
+        return self.by_id.get(job_id)
+
+    def __contains__(self, name):
+        return name in self.by_name
+
+    def __len__(self):
+        return len(self.by_id)
+
+
+class CronSchedule:
+    """编译后的cron执行计划
+
+    每个字段编译成一个整数位掩码（分钟60位、小时24位、日期31位、月份12位、星期7位），
+    计算下次运行时间只需要逐日检查日期/星期位，再用位运算找出当天第一个匹配的小时和分钟，
+    不需要逐分钟遍历 datetime。相同的表达式只编译一次。
+    """
+
+    FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+    NAMES = [
+        {}, {}, {},
+        {name: i + 1 for i, name in enumerate(['jan', 'feb', 'mar', 'apr', 'may', 'jun',
+                                               'jul', 'aug', 'sep', 'oct', 'nov', 'dec'])},
+        {name: i for i, name in enumerate(['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat'])},
+    ]
+    SPECIALS = {
+        '@yearly': '0 0 1 1 *', '@annually': '0 0 1 1 *', '@monthly': '0 0 1 * *',
+        '@weekly': '0 0 * * 0', '@daily': '0 0 * * *', '@midnight': '0 0 * * *',
+        '@hourly': '0 * * * *',
+    }
+    MAX_DAYS = 366 * 8  # 最多向后查找的天数（覆盖 2月29日 这类少见的组合）
+
+    cache = {}
+
+    @classmethod
+    def compile(cls, expression):
+        """返回表达式对应的 CronSchedule；@reboot 或无法解析的表达式返回 None"""
+        if expression not in cls.cache:
+            try:
+                cls.cache[expression] = cls(expression)
+            except ValueError:
+                cls.cache[expression] = None
+        return cls.cache[expression]
+
+    def __init__(self, expression):
+        expression = self.SPECIALS.get(expression.strip().lower(), expression)
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f'无效的cron表达式：{expression}')
+        masks = [self.parse_field(field, index) for index, field in enumerate(fields)]
+        self.minutes, self.hours, days, months, weekdays = masks
+        self.days = days >> 1      # 位0 对应1日
+        self.months = months >> 1  # 位0 对应1月
+        self.weekdays = weekdays
+        # 日期和星期都有限制时，满足其一即可（cron的标准语义）
+        self.day_any = fields[2].startswith('*')
+        self.weekday_any = fields[4].startswith('*')
+
+    def parse_field(self, field, index):
+        low, high = self.FIELDS[index]
+        if index == 4:
+            high = 7  # 星期的 0 和 7 都表示星期日，展开范围后再把 7 合并到位0
+        mask = 0
+        for part in field.lower().split(','):
+            step = 1
+            if '/' in part:
+                part, step = part.split('/', 1)
+                step = int(step)
+                if step <= 0:
+                    raise ValueError(f'无效的步长：{field}')
+            if part == '*':
+                start, end = low, self.FIELDS[index][1]
+            elif '-' in part:
+                start, end = (self.parse_value(value, index) for value in part.split('-', 1))
+            else:
+                start = self.parse_value(part, index)
+                end = high if step > 1 else start  # "5/10" 表示从5开始每10个
+            if not (low <= start <= high and low <= end <= high) or start > end:
+                raise ValueError(f'超出范围：{field}')
+            for value in range(start, end + 1, step):
+                mask |= 1 << value
+        if index == 4 and mask & (1 << 7):
+            mask = mask & ~(1 << 7) | 1
+        return mask
+
+    def parse_value(self, value, index):
+        if value in self.NAMES[index]:
+            return self.NAMES[index][value]
+        return int(value)
+
+    @staticmethod
+    def first_bit(mask, start):
+        """mask 中不小于 start 的最低位，没有时返回 None"""
+        mask >>= start
+        if not mask:
+            return None
+        return start + (mask & -mask).bit_length() - 1
+
+    def matches_day(self, date):
+        if not self.months >> (date.month - 1) & 1:
+            return False
+        day_match = self.days >> (date.day - 1) & 1
+        weekday_match = self.weekdays >> ((date.weekday() + 1) % 7) & 1
+        if self.day_any or self.weekday_any:
+            return bool(day_match and weekday_match)
+        return bool(day_match or weekday_match)
+
+    def next_after(self, moment):
+        """严格晚于 moment 的下一次运行时间（精确到分钟），找不到时返回 None"""
+        moment = moment.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        date = moment.date()
+        hour, minute = moment.hour, moment.minute
+        for _ in range(self.MAX_DAYS):
+            if self.matches_day(date):
+                h = self.first_bit(self.hours, hour)
+                while h is not None:
+                    m = self.first_bit(self.minutes, minute if h == hour else 0)
+                    if m is not None:
+                        return datetime.datetime(date.year, date.month, date.day, h, m)
+                    h = self.first_bit(self.hours, h + 1)
+            date += datetime.timedelta(days=1)
+            hour = minute = 0
+        return None
+
+    def between(self, start, end):
+        """依次生成 (start, end] 之间的运行时间"""
+        moment = self.next_after(start)
+        while moment is not None and moment <= end:
+            yield moment
+            moment = self.next_after(moment)
+
+
+class FireQueue:
+    """所有任务下次运行时间的最小堆
+
+    堆中保存 (下次运行时间, 任务ID)，任务计划变化或到期后重新计算并压入新项，
+    旧项在弹出时与 next_times 比对后丢弃（惰性删除）。
+    相同表达式在同一时刻的下次运行时间只计算一次。
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.next_times = {}  # 任务ID -> 下次运行时间
+        self.expressions = {}  # 任务ID -> 表达式
+
+    def update(self, expressions, now):
+        """用 任务ID -> 表达式 的新映射更新堆，只重新计算变化或到期的任务"""
+        computed = {}
+        for job_id in [job_id for job_id in self.expressions if job_id not in expressions]:
+            del self.expressions[job_id]
+            self.next_times.pop(job_id, None)
+        for job_id, expression in expressions.items():
+            current = self.next_times.get(job_id)
+            if self.expressions.get(job_id) == expression and current is not None and current > now:
+                continue
+            self.expressions[job_id] = expression
+            if expression not in computed:
+                schedule = CronSchedule.compile(expression)
+                computed[expression] = schedule.next_after(now) if schedule is not None else None
+            self.set_next(job_id, computed[expression])
+        if len(self.heap) > 2 * len(self.next_times) + 64:
+            # 过期项太多时重建堆
+            self.heap = [(moment, job_id) for job_id, moment in self.next_times.items()]
+            heapq.heapify(self.heap)
+
+    def set_next(self, job_id, moment):
+        if moment is None:
+            self.next_times.pop(job_id, None)
+            return
+        self.next_times[job_id] = moment
+        heapq.heappush(self.heap, (moment, job_id))
+
+    def peek(self):
+        """最早的下次运行时间，没有任务时返回 None"""
+        while self.heap:
+            moment, job_id = self.heap[0]
+            if self.next_times.get(job_id) == moment:
+                return moment
+            heapq.heappop(self.heap)
+        return None
+
+    def advance(self, now):
+        """把已经到期的任务推进到下一次运行时间，返回这些任务的ID"""
+        due = []
+        computed = {}
+        while True:
+            moment = self.peek()
+            if moment is None or moment > now:
+                break
+            _, job_id = heapq.heappop(self.heap)
+            expression = self.expressions[job_id]
+            if expression not in computed:
+                computed[expression] = CronSchedule.compile(expression).next_after(now)
+            self.set_next(job_id, computed[expression])
+            due.append(job_id)
+        return due
+
+    def next_of(self, job_id):
+        return self.next_times.get(job_id)
+
+    def upcoming(self, start, end, limit=None):
+        """按时间顺序生成 (运行时间, 任务ID)
+
+        相同表达式的任务共用一个时间序列，各序列通过 heapq.merge 合并。
+        """
+        groups = {}
+        for job_id, expression in self.expressions.items():
+            groups.setdefault(expression, []).append(job_id)
+        def stream(schedule, expression):
+            for moment in schedule.between(start, end):
+                yield moment, expression
+
+        streams = []
+        for expression in groups:
+            schedule = CronSchedule.compile(expression)
+            if schedule is not None:
+                streams.append(stream(schedule, expression))
+        merged = ((moment, job_id) for moment, expression in heapq.merge(*streams)
+                  for job_id in groups[expression])
+        return merged if limit is None else itertools.islice(merged, limit)
+
+
+class LoadAnalyzer:
+    """执行计划负载分析
+
+    把每个计划在分析区间内的运行时间展开成位掩码（每分钟一位，区间内第 i 分钟对应第 i 位），
+    再用按位切片的计数器累加：第 k 个计数器保存各分钟计数的第 k 个二进制位，
+    加一个掩码只需要几次大整数的异或/与运算，一次处理区间内所有分钟。
+    相同表达式的任务合并为一个掩码乘以任务数量。
+    """
+
+    MINUTES_PER_DAY = 24 * 60
+
+    def __init__(self, expressions, start, days):
+        """expressions 为 任务ID -> 表达式；start 为分析起点（按整天对齐）"""
+        self.start = datetime.datetime.combine(start.date() if isinstance(start, datetime.datetime) else start,
+                                               datetime.time())
+        self.days = days
+        self.groups = {}  # 表达式 -> [任务ID, ...]
+        for job_id, expression in expressions.items():
+            if CronSchedule.compile(expression) is not None:
+                self.groups.setdefault(expression, []).append(job_id)
+        self.counters = []
+        for expression, job_ids in self.groups.items():
+            self.add(self.horizon_mask(CronSchedule.compile(expression)), len(job_ids))
+        self.histogram = self.decode()
+
+    @classmethod
+    def day_mask(cls, schedule):
+        """一天内运行时间的位掩码（第 h*60+m 位表示 h:m）"""
+        mask = 0
+        hours = schedule.hours
+        while hours:
+            hour = (hours & -hours).bit_length() - 1
+            mask |= schedule.minutes << (hour * 60)
+            hours &= hours - 1
+        return mask
+
+    def horizon_mask(self, schedule):
+        day_mask = self.day_mask(schedule)
+        mask = 0
+        for day in range(self.days):
+            if schedule.matches_day(self.start.date() + datetime.timedelta(days=day)):
+                mask |= day_mask << (day * self.MINUTES_PER_DAY)
+        return mask
+
+    def add(self, mask, weight):
+        """计数器加上 mask * weight"""
+        level = 0
+        while weight:
+            if weight & 1:
+                carry = mask
+                index = level
+                while carry:
+                    while index >= len(self.counters):
+                        self.counters.append(0)
+                    self.counters[index], carry = self.counters[index] ^ carry, self.counters[index] & carry
+                    index += 1
+            weight >>= 1
+            level += 1
+
+    def decode(self):
+        """把按位切片的计数器还原为每分钟的运行次数列表"""
+        size = self.days * self.MINUTES_PER_DAY
+        histogram = [0] * size
+        for level, counter in enumerate(self.counters):
+            value = 1 << level
+            while counter:
+                low = counter & -counter
+                histogram[low.bit_length() - 1] += value
+                counter ^= low
+        return histogram
+
+    def moment_of(self, index):
+        return self.start + datetime.timedelta(minutes=index)
+
+    def peaks(self, count=20):
+        """运行次数最多的分钟，返回 [(分钟序号, 次数), ...]"""
+        ranked = heapq.nlargest(count, ((value, -index) for index, value in enumerate(self.histogram) if value))
+        return [(-negative, value) for value, negative in ranked]
+
+    def jobs_at(self, index):
+        """在区间内第 index 分钟运行的任务ID"""
+        moment = self.moment_of(index)
+        jobs = []
+        for expression, job_ids in self.groups.items():
+            schedule = CronSchedule.compile(expression)
+            if (schedule.minutes >> moment.minute & 1 and schedule.hours >> moment.hour & 1
+                    and schedule.matches_day(moment.date())):
+                jobs.extend(job_ids)
+        return jobs
+
+
+# 表格中一行任务的数据，刷新时按字段比较决定哪些行需要更新
+# last 为执行记录账本中该任务最近一次的 LedgerEntry，没有记录时为 None；
+# next_run 为下次运行时间（datetime），任务禁用或计划不会触发时为 None；
+# splay 为 (延迟秒数, 错峰窗口, 是否来自全局设置)
+JobRow = namedtuple('JobRow', ['job_id', 'name', 'command', 'schedule', 'enabled', 'last', 'next_run',
+                               'splay'])
+
+
+class JobTableModel(QAbstractTableModel):
+    """任务列表模型
+
+    以紧凑的 JobRow 列表保存数据。set_rows 按任务ID对比新旧数据，
+    只发出实际变化行的插入/删除/移动/dataChanged 信号，
+    因此刷新时视图的选中状态和滚动位置都能保持。
+    """
+
+    COLUMNS = [
+        ('name', '任务名称'),
+        ('command', '执行命令'),
+        ('schedule', '执行计划'),
+        ('enabled', '状态'),
+        ('next_run', '下次运行'),
+        ('splay', '错峰'),
+        ('last_run', '上次运行'),
+        ('last_status', '上次状态'),
+        ('duration', '耗时'),
+        ('cpu', 'CPU时间'),
+        ('max_rss', '内存峰值'),
+    ]
+    LAST_RUN_KEYS = ('last_run', 'last_status', 'duration', 'cpu', 'max_rss')
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        self.positions = {}  # 任务ID -> 行号
+        self.enabled_brush = QBrush(QColor('#2e7d32'))   # 绿色圆点
+        self.disabled_brush = QBrush(QColor('#d32f2f'))  # 红色圆点
+        self.failed_brush = QBrush(QColor('#d32f2f'))
+        self.skipped_brush = QBrush(QColor('#ef6c00'))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.COLUMNS[section][1]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        key = self.COLUMNS[index.column()][0]
+        if role == Qt.ItemDataRole.DisplayRole:
+            if key == 'enabled':
+                return '⬤'
+            if key == 'command' and '\n' in row.command:
+                return row.command.split('\n', 1)[0] + ' …'
+            if key in self.LAST_RUN_KEYS:
+                return self.format_last(row.last, key)
+            if key == 'next_run':
+                return row.next_run.strftime('%m-%d %H:%M') if row.next_run is not None else ''
+            if key == 'splay':
+                return f'+{row.splay[0]}秒' if row.splay[1] else ''
+            return getattr(row, key)
+        if role == Qt.ItemDataRole.ForegroundRole and key == 'enabled':
+            return self.enabled_brush if row.enabled else self.disabled_brush
+        if role == Qt.ItemDataRole.ForegroundRole and key == 'last_status' and row.last is not None:
+            if row.last.skipped:
+                return self.skipped_brush
+            if row.last.exit_code != 0:
+                return self.failed_brush
+            return None
+        if role == Qt.ItemDataRole.TextAlignmentRole and key == 'enabled':
+            return Qt.AlignmentFlag.AlignCenter
+        if role == Qt.ItemDataRole.ToolTipRole and key == 'command':
+            return row.command
+        if role == Qt.ItemDataRole.ToolTipRole and key == 'next_run' and row.next_run is not None:
+            return row.next_run.strftime('%Y-%m-%d %H:%M')
+        if role == Qt.ItemDataRole.ToolTipRole and key == 'splay' and row.splay[1]:
+            source = '全局设置' if row.splay[2] else '任务设置'
+            return f'启动前延迟 {row.splay[0]} 秒（错峰窗口 {row.splay[1]} 秒，{source}）'
+        if role == Qt.ItemDataRole.UserRole:
+            return row.job_id
+        return None
+
+    @staticmethod
+    def format_last(last, key):
+        if last is None:
+            return ''
+        if key == 'last_run':
+            return datetime.datetime.fromtimestamp(last.started).strftime('%m-%d %H:%M:%S')
+        if key == 'last_status':
+            return format_exit_status(last.exit_code, last.skipped)
+        if key == 'cpu':
+            return format_cpu_time(last)
+        if key == 'max_rss':
+            return format_memory(last.max_rss_kb)
+        return format_duration(last.finished - last.started)
+
+    def job_id(self, row):
+        if 0 <= row < len(self.rows):
+            return self.rows[row].job_id
+        return None
+
+    def row_of(self, job_id):
+        return self.positions.get(job_id, -1)
+
+    def set_rows(self, rows):
+        """用新数据替换模型内容，只通知实际变化的行"""
+        wanted = set(row.job_id for row in rows)
+
+        # 1. 从后往前删除已经不存在的任务，连续的行合并为一次删除
+        end = len(self.rows) - 1
+        while end >= 0:
+            if self.rows[end].job_id in wanted:
+                end -= 1
+                continue
+            start = end
+            while start > 0 and self.rows[start - 1].job_id not in wanted:
+                start -= 1
+            self.beginRemoveRows(QModelIndex(), start, end)
+            del self.rows[start:end + 1]
+            self.endRemoveRows()
+            end = start - 1
+
+        # 2. 按新顺序逐行对齐：相同则跳过，内容变化则 dataChanged，新任务插入，位置变化则移动
+        present = set(row.job_id for row in self.rows)
+        last_column = len(self.COLUMNS) - 1
+        position = 0
+        while position < len(rows):
+            row = rows[position]
+            if position < len(self.rows) and self.rows[position].job_id == row.job_id:
+                if self.rows[position] != row:
+                    self.rows[position] = row
+                    self.dataChanged.emit(self.index(position, 0), self.index(position, last_column))
+                position += 1
+            elif row.job_id not in present:
+                end = position
+                while end + 1 < len(rows) and rows[end + 1].job_id not in present:
+                    end += 1
+                self.beginInsertRows(QModelIndex(), position, end)
+                self.rows[position:position] = rows[position:end + 1]
+                self.endInsertRows()
+                position = end + 1
+            else:
+                current = next(i for i in range(position + 1, len(self.rows))
+                               if self.rows[i].job_id == row.job_id)
+                self.beginMoveRows(QModelIndex(), current, current, QModelIndex(), position)
+                self.rows.insert(position, self.rows.pop(current))
+                self.endMoveRows()
+
+        self.positions = {row.job_id: i for i, row in enumerate(self.rows)}
+
+
+# 从生成的脚本头部解析出的任务信息，wrapper 为生成脚本所用模板的版本
+ScriptHeader = namedtuple('ScriptHeader', ['name', 'created', 'command', 'wrapper'])
+
+# 脚本模板版本：模板变化时递增，启动时会重新生成旧版本的脚本
+WRAPPER_VERSION = 8
+
+
+class ScriptHeaderCache:
+    """生成脚本头部信息的缓存
+
+    以 (mtime, 大小, inode) 作为每个脚本的版本标识，只有脚本实际变化时才重新读取，
+    刷新任务列表和编辑任务共用同一份缓存。
+    """
+
+    def __init__(self):
+        self.entries = {}  # 路径 -> ((mtime, 大小, inode), ScriptHeader)
+
+    def get(self, path):
+        """返回脚本的 ScriptHeader，脚本不存在时返回 None"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.entries.pop(path, None)
+            return None
+        key = (st.st_mtime_ns, st.st_size, st.st_ino)
+        entry = self.entries.get(path)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        header = self.parse(path)
+        self.entries[path] = (key, header)
+        return header
+
+    def parse(self, path):
+        name = created = ''
+        wrapper = 1
+        command_lines = []
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    line = line.rstrip('\n')
+                    if line.startswith('## ') or (command_lines and line == '##'):
+                        command_lines.append(line[3:])  # 去掉 '## ' 前缀，多行命令每行都有前缀
+                    elif command_lines:
+                        # 原始命令之后都是固定的模板内容，不需要继续读取
+                        break
+                    elif line.startswith('# Task:'):
+                        name = line[len('# Task:'):].strip()
+                    elif line.startswith('# Created:'):
+                        created = line[len('# Created:'):].strip()
+                    elif line.startswith('# Wrapper:'):
+                        try:
+                            wrapper = int(line[len('# Wrapper:'):])
+                        except ValueError:
+                            pass
+        except (OSError, UnicodeDecodeError):
+            pass
+        return ScriptHeader(name, created, '\n'.join(command_lines).strip(), wrapper)
+
+    def retain(self, paths):
+        """丢弃不再对应任何任务的缓存项"""
+        paths = set(paths)
+        for path in [path for path in self.entries if path not in paths]:
+            del self.entries[path]
+
+
+# 元数据存储中的一条任务记录，options 为任务选项字典
+JobRecord = namedtuple('JobRecord', ['job_id', 'name', 'command', 'created', 'options'])
+
+# 任务选项的取值范围：整数选项为 (最小值, 最大值)，其余为允许的取值集合
+OPTION_SCHEMA = {
+    'splay': (0, 3600),
+    'overlap': {'allow', 'skip', 'queue'},
+    'instances': (1, 32),
+    'timeout': (0, 7 * 24 * 3600),
+    'nice': (0, 19),
+    'io_class': {'low', 'idle'},
+    'memory_limit': (0, 1024 * 1024),
+    'cpu_limit': (0, 7 * 24 * 3600),
+    'rotate_size': (0, 1024 * 1024),
+    'rotate_age': (0, 3650),
+    'rotate_runs': (0, 1000000),
+    'rotate_keep': (1, 1000),
+}
+
+
+def clean_options(options):
+    """校验导入的任务选项，丢弃无法识别或超出范围的值（选项会写入生成的脚本）"""
+    if not isinstance(options, dict):
+        return {}
+    cleaned = {}
+    for key, value in options.items():
+        allowed = OPTION_SCHEMA.get(key)
+        if isinstance(allowed, tuple):
+            if isinstance(value, int) and not isinstance(value, bool) and allowed[0] <= value <= allowed[1]:
+                cleaned[key] = value
+        elif allowed is not None and isinstance(value, str) and value in allowed:
+            cleaned[key] = value
+    return cleaned
+
+
+class JobStore:
+    """任务元数据存储
+
+    任务ID、名称、原始命令、创建时间和选项统一保存在 ~/.chronos/chronos.db（SQLite）中。
+    加载全部任务只需要一次查询，多行命令也能原样保存；
+    生成脚本中的注释只作为旧版本任务的兜底来源。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        with self.conn:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' id TEXT PRIMARY KEY,'
+                ' name TEXT NOT NULL UNIQUE,'
+                ' command TEXT NOT NULL,'
+                ' created TEXT NOT NULL,'
+                " options TEXT NOT NULL DEFAULT '{}')")
+
+    def record_from_row(self, row):
+        try:
+            options = json.loads(row[4]) if row[4] else {}
+        except ValueError:
+            options = {}
+        return JobRecord(row[0], row[1], row[2], row[3], options)
+
+    def load_all(self):
+        """一次查询加载全部任务，返回 名称 -> JobRecord"""
+        cursor = self.conn.execute('SELECT id, name, command, created, options FROM jobs')
+        return {row[1]: self.record_from_row(row) for row in cursor}
+
+    def get(self, name):
+        row = self.conn.execute('SELECT id, name, command, created, options FROM jobs WHERE name = ?',
+                                (name,)).fetchone()
+        return self.record_from_row(row) if row else None
+
+    def save(self, record):
+        self.save_many([record])
+
+    def save_many(self, records):
+        with self.conn:
+            for record in records:
+                # 名称唯一：同名的旧记录（ID不同）被新记录取代
+                self.conn.execute('DELETE FROM jobs WHERE name = ? AND id != ?', (record.name, record.job_id))
+                self.conn.execute(
+                    'INSERT INTO jobs (id, name, command, created, options) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT(id) DO UPDATE SET name = excluded.name, command = excluded.command, '
+                    'created = excluded.created, options = excluded.options',
+                    (record.job_id, record.name, record.command, record.created,
+                     json.dumps(record.options, ensure_ascii=False)))
+
+    def rename(self, old_name, new_name):
+        with self.conn:
+            self.conn.execute('DELETE FROM jobs WHERE name = ?', (new_name,))
+            self.conn.execute('UPDATE jobs SET name = ? WHERE name = ?', (new_name, old_name))
+
+    def delete(self, names):
+        with self.conn:
+            self.conn.executemany('DELETE FROM jobs WHERE name = ?', [(name,) for name in names])
+
+    def close(self):
+        self.conn.close()
+
+
+# 执行记录账本中的一条记录（时间均为 Unix 时间戳，单位秒）。
+# 资源使用字段：用户/系统CPU毫秒、内存峰值KB、读/写块数，未记录时为 None；
+# skipped 表示因上一次运行尚未结束而按重叠策略跳过
+LedgerEntry = namedtuple('LedgerEntry', ['job_id', 'scheduled', 'started', 'finished',
+                                         'exit_code', 'output_bytes', 'user_ms', 'system_ms',
+                                         'max_rss_kb', 'read_blocks', 'write_blocks', 'skipped'],
+                         defaults=(None, None, None, None, None, False))
+
+
+def format_duration(seconds):
+    seconds = max(int(seconds), 0)
+    if seconds < 60:
+        return f'{seconds}秒'
+    if seconds < 3600:
+        return f'{seconds // 60}分{seconds % 60}秒'
+    return f'{seconds // 3600}时{seconds % 3600 // 60}分'
+
+
+def format_exit_status(exit_code, skipped=False):
+    if skipped:
+        return '已跳过'
+    return '成功' if exit_code == 0 else f'失败 ({exit_code})'
+
+
+def format_cpu_time(entry):
+    """用户+系统CPU时间，没有资源记录时返回空字符串"""
+    if entry.user_ms is None or entry.system_ms is None:
+        return ''
+    return f'{(entry.user_ms + entry.system_ms) / 1000:.2f}秒'
+
+
+def format_memory(kb):
+    if kb is None:
+        return ''
+    if kb < 1024:
+        return f'{kb} KB'
+    if kb < 1024 * 1024:
+        return f'{kb / 1024:.1f} MB'
+    return f'{kb / 1024 / 1024:.2f} GB'
+
+
+class RunLedger:
+    """执行记录账本
+
+    生成的脚本每次运行结束时向 ~/.chronos/runs.ledger 追加一行制表符分隔的记录：
+    任务ID、计划分钟、开始时间、结束时间、退出码、输出字节数。
+    有 python3 时还会附加执行器统计的资源使用情况（CPU时间、内存峰值、块I/O）。
+    每条记录用一次 O_APPEND 写入，多个任务同时结束也不会交错。
+
+    这里按偏移量增量读取新追加的记录（每次最多读入 READ_BYTES），只保留每个任务最近一次的结果，
+    任务列表的"上次运行/上次状态/耗时"列由此得到，不需要读取日志文件。
+    账本超过 ROTATE_BYTES 时由写入者（执行器或生成的脚本）改名为 runs.ledger.1（覆盖更早的一份），
+    Chronos 没有运行时账本也不会无限增长；这里发现文件被轮转后读完旧文件剩余的部分。
+    """
+
+    ROTATE_BYTES = LEDGER_ROTATE_BYTES
+    READ_BYTES = 1024 * 1024
+
+    def __init__(self, path):
+        self.path = path
+        self.rotated_path = path + '.1'
+        self.latest = {}  # 任务ID -> LedgerEntry
+        self.offset = 0
+        self.inode = None
+        self.pending = b''  # 尚未写完的最后一行
+        self.read_file(self.rotated_path, 0)
+
+    def parse(self, line):
+        fields = line.split(b'\t')
+        if len(fields) < 6:
+            return None
+        try:
+            usage = [None if field == b'-' else int(field) for field in fields[6:11]]
+            usage += [None] * (5 - len(usage))
+            skipped = len(fields) > 11 and fields[11] == b'1'
+            return LedgerEntry(fields[0].decode('ascii'), int(fields[1]), int(fields[2]),
+                               int(fields[3]), int(fields[4]), int(fields[5]), *usage, skipped)
+        except ValueError:
+            return None
+
+    def consume(self, data):
+        """解析完整的行，返回是否有新记录"""
+        data = self.pending + data
+        end = data.rfind(b'\n') + 1
+        self.pending = data[end:]
+        changed = False
+        for line in data[:end].splitlines():
+            entry = self.parse(line)
+            if entry is not None:
+                self.latest[entry.job_id] = entry
+                changed = True
+        return changed
+
+    def read_file(self, path, offset):
+        """从指定偏移分块读取到文件末尾，返回 (读取后的偏移, 是否有新记录)"""
+        changed = False
+        try:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                for data in iter(lambda: f.read(self.READ_BYTES), b''):
+                    offset += len(data)
+                    changed = self.consume(data) or changed
+        except OSError:
+            pass
+        return offset, changed
+
+    def update(self):
+        """读取新追加的记录，返回是否有变化"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        changed = False
+        if st.st_ino != self.inode or st.st_size < self.offset:
+            if self.inode is not None and self.stat_inode(self.rotated_path) == self.inode:
+                # 已被轮转：上次读取之后追加到旧文件的记录还没有读
+                _, changed = self.read_file(self.rotated_path, self.offset)
+            # 新文件（首次读取或已被轮转）：从头读取
+            self.inode = st.st_ino
+            self.offset = 0
+            self.pending = b''
+        if st.st_size > self.offset:
+            self.offset, read = self.read_file(self.path, self.offset)
+            changed = changed or read
+        if self.offset > self.ROTATE_BYTES:
+            # 旧版本的脚本不会轮转账本，这里代为轮转（与写入者使用同一个加锁的实现）
+            rotate_ledger(self.path)
+        return changed
+
+    @staticmethod
+    def stat_inode(path):
+        try:
+            return os.stat(path).st_ino
+        except OSError:
+            return None
+
+    def last(self, job_id):
+        return self.latest.get(job_id)
+
+    def history(self, job_id, limit=500):
+        """从账本（包括轮转的上一份）读取任务最近的执行记录，最新的在前"""
+        prefix = job_id.encode('ascii') + b'\t'
+        entries = []
+        for path in (self.rotated_path, self.path):
+            try:
+                with open(path, 'rb') as f:
+                    pending = b''
+                    for data in iter(lambda: f.read(self.READ_BYTES), b''):
+                        data = pending + data
+                        end = data.rfind(b'\n') + 1
+                        pending = data[end:]
+                        for line in data[:end].splitlines():
+                            if line.startswith(prefix):
+                                entry = self.parse(line)
+                                if entry is not None:
+                                    entries.append(entry)
+            except OSError:
+                continue
+        entries.reverse()
+        return entries[:limit]
+
+
+class RunHistoryDialog(QDialog):
+    """单个任务的运行历史
+
+    列出执行记录账本中该任务最近的运行及其资源使用情况。
+    CPU时间和内存峰值超过历史中位数 REGRESSION_FACTOR 倍的单元格标红，便于发现开销的增长。
+    """
+
+    REGRESSION_FACTOR = 2
+    HEADERS = ['开始时间', '状态', '耗时', '用户CPU', '系统CPU', '内存峰值', '读块数', '写块数', '输出']
+
+    def __init__(self, name, entries, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f'运行历史 - {name}')
+        self.resize(900, 500)
+        self.entries = entries
+
+        layout = QVBoxLayout(self)
+        self.summary_label = QLabel()
+        layout.addWidget(self.summary_label)
+
+        self.table = QTableWidget(len(entries), len(self.HEADERS))
+        self.table.setHorizontalHeaderLabels(self.HEADERS)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.table)
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        close_button = QPushButton('关闭')
+        close_button.clicked.connect(self.accept)
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout)
+
+        self.populate()
+
+    @staticmethod
+    def median(values):
+        values = sorted(value for value in values if value is not None)
+        return values[len(values) // 2] if values else None
+
+    def populate(self):
+        cpu_values = [None if entry.user_ms is None or entry.system_ms is None
+                      else entry.user_ms + entry.system_ms for entry in self.entries]
+        cpu_median = self.median(cpu_values)
+        rss_median = self.median(entry.max_rss_kb for entry in self.entries)
+        failed_brush = QBrush(QColor('#d32f2f'))
+        skipped_brush = QBrush(QColor('#ef6c00'))
+
+        for row, (entry, cpu) in enumerate(zip(self.entries, cpu_values)):
+            cells = [
+                datetime.datetime.fromtimestamp(entry.started).strftime('%Y-%m-%d %H:%M:%S'),
+                format_exit_status(entry.exit_code, entry.skipped),
+                format_duration(entry.finished - entry.started),
+                '' if entry.user_ms is None else f'{entry.user_ms / 1000:.2f}秒',
+                '' if entry.system_ms is None else f'{entry.system_ms / 1000:.2f}秒',
+                format_memory(entry.max_rss_kb),
+                '' if entry.read_blocks is None else str(entry.read_blocks),
+                '' if entry.write_blocks is None else str(entry.write_blocks),
+                f'{entry.output_bytes} 字节',
+            ]
+            for column, text in enumerate(cells):
+                self.table.setItem(row, column, QTableWidgetItem(text))
+            if entry.skipped:
+                self.table.item(row, 1).setForeground(skipped_brush)
+            elif entry.exit_code != 0:
+                self.table.item(row, 1).setForeground(failed_brush)
+            for column, value, median in ((3, cpu, cpu_median), (5, entry.max_rss_kb, rss_median)):
+                if value is not None and median and value > median * self.REGRESSION_FACTOR:
+                    item = self.table.item(row, column)
+                    item.setForeground(failed_brush)
+                    item.setToolTip(f'超过历史中位数的 {self.REGRESSION_FACTOR} 倍')
+
+        failures = sum(1 for entry in self.entries if entry.exit_code != 0)
+        summary = f'最近 {len(self.entries)} 次运行，失败 {failures} 次'
+        skipped = sum(1 for entry in self.entries if entry.skipped)
+        if skipped:
+            summary += f'，因重叠跳过 {skipped} 次'
+        if cpu_median is not None:
+            summary += f' | CPU时间中位数 {cpu_median / 1000:.2f}秒'
+        if rss_median is not None:
+            summary += f' | 内存峰值中位数 {format_memory(rss_median)}'
+        self.summary_label.setText(summary)
+
+
+class TimelineWidget(QWidget):
+    """未来一段时间内各任务运行时间的时间轴
+
+    每个任务一行，每次运行画一条竖线；鼠标悬停时显示该位置附近的运行时间。
+    """
+
+    ROW_HEIGHT = 22
+    NAME_WIDTH = 160
+    HEADER_HEIGHT = 24
+
+    def __init__(self, start, end, lanes, parent=None):
+        super().__init__(parent)
+        self.start = start
+        self.end = end
+        self.lanes = lanes  # [(任务名称, [运行时间, ...]), ...]
+        self.setMouseTracking(True)
+        self.setMinimumWidth(self.NAME_WIDTH + 600)
+        self.setMinimumHeight(self.HEADER_HEIGHT + self.ROW_HEIGHT * max(len(lanes), 1))
+        self.tick_pen = QPen(QColor('#007bff'))
+        self.grid_pen = QPen(QColor('#e0e0e0'))
+        self.text_pen = QPen(QColor('#333333'))
+
+    def lane_width(self):
+        return max(self.width() - self.NAME_WIDTH - 10, 1)
+
+    def x_of(self, moment):
+        span = (self.end - self.start).total_seconds()
+        return self.NAME_WIDTH + int((moment - self.start).total_seconds() / span * self.lane_width())
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor('white'))
+        hours = int((self.end - self.start).total_seconds() // 3600)
+        first_hour = self.start.replace(minute=0, second=0, microsecond=0)
+        # 每小时一条网格线，每3小时标注时间
+        for i in range(1, hours + 1):
+            moment = first_hour + datetime.timedelta(hours=i)
+            x = self.x_of(moment)
+            painter.setPen(self.grid_pen)
+            painter.drawLine(x, self.HEADER_HEIGHT - 4, x, self.height())
+            if moment.hour % 3 == 0:
+                painter.setPen(self.text_pen)
+                painter.drawText(x - 20, 0, 40, self.HEADER_HEIGHT - 6,
+                                 Qt.AlignmentFlag.AlignCenter, moment.strftime('%H:%M'))
+
+        visible = event.rect()
+        for row, (name, moments) in enumerate(self.lanes):
+            top = self.HEADER_HEIGHT + row * self.ROW_HEIGHT
+            if top > visible.bottom() or top + self.ROW_HEIGHT < visible.top():
+                continue
+            painter.setPen(self.text_pen)
+            painter.drawText(4, top, self.NAME_WIDTH - 8, self.ROW_HEIGHT,
+                             Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignLeft, name)
+            painter.setPen(self.tick_pen)
+            last_x = None
+            for moment in moments:
+                x = self.x_of(moment)
+                if x != last_x:  # 同一像素只画一次
+                    painter.drawLine(x, top + 4, x, top + self.ROW_HEIGHT - 4)
+                    last_x = x
+        painter.end()
+
+    def mouseMoveEvent(self, event):
+        position = event.position()
+        row = int((position.y() - self.HEADER_HEIGHT) // self.ROW_HEIGHT)
+        if position.x() < self.NAME_WIDTH or not 0 <= row < len(self.lanes):
+            QToolTip.hideText()
+            return
+        name, moments = self.lanes[row]
+        span = (self.end - self.start).total_seconds()
+        moment = self.start + datetime.timedelta(
+            seconds=(position.x() - self.NAME_WIDTH) / self.lane_width() * span)
+        tolerance = datetime.timedelta(seconds=span / self.lane_width() * 3)
+        index = bisect.bisect_left(moments, moment - tolerance)
+        nearby = [m.strftime('%H:%M') for m in moments[index:index + 50] if m <= moment + tolerance]
+        if nearby:
+            QToolTip.showText(event.globalPosition().toPoint(), f'{name}\n' + ', '.join(nearby[:10]), self)
+        else:
+            QToolTip.hideText()
+
+
+class UpcomingRunsDialog(QDialog):
+    """未来24小时的运行计划时间轴"""
+
+    HOURS = 24
+    MAX_RUNS = 200000  # 展开的运行次数上限，避免大量每分钟任务时占用过多内存
+
+    def __init__(self, fire_queue, names, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('运行计划（未来24小时）')
+        self.resize(1000, 600)
+
+        start = datetime.datetime.now().replace(second=0, microsecond=0)
+        end = start + datetime.timedelta(hours=self.HOURS)
+        lanes = {}
+        total = 0
+        for moment, job_id in fire_queue.upcoming(start, end, self.MAX_RUNS):
+            lanes.setdefault(job_id, []).append(moment)
+            total += 1
+        # 按第一次运行时间排序
+        ordered = sorted(lanes.items(), key=lambda item: item[1][0])
+
+        layout = QVBoxLayout(self)
+        summary = f'未来 {self.HOURS} 小时内 {len(ordered)} 个任务共运行 {total} 次'
+        if total >= self.MAX_RUNS:
+            summary += f'（只展开前 {self.MAX_RUNS} 次）'
+        layout.addWidget(QLabel(summary))
+
+        self.timeline = TimelineWidget(start, end, [(names.get(job_id, job_id), moments)
+                                                    for job_id, moments in ordered])
+        scroll = QScrollArea()
+        scroll.setWidgetResizable(True)
+        scroll.setWidget(self.timeline)
+        layout.addWidget(scroll)
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        close_button = QPushButton('关闭')
+        close_button.clicked.connect(self.accept)
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout)
+
+
+class HistogramWidget(QWidget):
+    """每分钟运行次数的柱状图
+
+    每个像素列显示它所覆盖分钟中的最大值，不低于 threshold 的柱子标红；
+    点击柱子发出 minute_clicked(分钟序号)。
+    """
+
+    minute_clicked = pyqtSignal(int)
+
+    MARGIN = 30
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.analyzer = None
+        self.threshold = None
+        self.setMinimumHeight(220)
+        self.setMouseTracking(True)
+        self.bar_brush = QBrush(QColor('#90caf9'))
+        self.peak_brush = QBrush(QColor('#d32f2f'))
+
+    def set_analyzer(self, analyzer, threshold):
+        self.analyzer = analyzer
+        self.threshold = threshold
+        self.update()
+
+    def plot_width(self):
+        return max(self.width() - 2 * self.MARGIN, 1)
+
+    def index_at(self, x):
+        size = len(self.analyzer.histogram)
+        return min(max(int((x - self.MARGIN) / self.plot_width() * size), 0), size - 1)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor('white'))
+        if self.analyzer is None or not self.analyzer.histogram:
+            painter.end()
+            return
+        histogram = self.analyzer.histogram
+        size = len(histogram)
+        peak = max(histogram) or 1
+        bottom = self.height() - self.MARGIN
+        height = bottom - 10
+        width = self.plot_width()
+
+        painter.setPen(Qt.PenStyle.NoPen)
+        for x in range(width):
+            first = x * size // width
+            last = max((x + 1) * size // width, first + 1)
+            value = max(histogram[first:last])
+            if not value:
+                continue
+            bar = max(int(value / peak * height), 1)
+            brush = self.peak_brush if self.threshold and value >= self.threshold else self.bar_brush
+            painter.fillRect(self.MARGIN + x, bottom - bar, 1, bar, brush)
+
+        # 坐标轴：纵轴标注最大值，横轴按天或按小时标注
+        painter.setPen(QPen(QColor('#666666')))
+        painter.drawLine(self.MARGIN, bottom, self.MARGIN + width, bottom)
+        painter.drawText(0, 0, self.MARGIN - 4, 20, Qt.AlignmentFlag.AlignRight, str(peak))
+        days = self.analyzer.days
+        step = 1440 if days > 1 else 180
+        for index in range(0, size + 1, step):
+            x = self.MARGIN + int(index / size * width)
+            label = self.analyzer.moment_of(index).strftime('%m-%d' if days > 1 else '%H:%M')
+            painter.drawLine(x, bottom, x, bottom + 4)
+            painter.drawText(x - 30, bottom + 4, 60, 20, Qt.AlignmentFlag.AlignCenter, label)
+        painter.end()
+
+    def mouseMoveEvent(self, event):
+        if self.analyzer is None:
+            return
+        index = self.index_at(event.position().x())
+        moment = self.analyzer.moment_of(index)
+        QToolTip.showText(event.globalPosition().toPoint(),
+                          f"{moment.strftime('%m-%d %H:%M')}: {self.analyzer.histogram[index]} 次", self)
+
+    def mousePressEvent(self, event):
+        if self.analyzer is not None:
+            self.minute_clicked.emit(self.index_at(event.position().x()))
 
-    def clear_log(self):
-        reply = QMessageBox.question(self, '确认', '确定要清除日志吗？',
-                                   QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
-        if reply == QMessageBox.StandardButton.Yes:
+
+class LoadAnalysisDialog(QDialog):
+    """执行计划负载分析：每分钟运行次数的分布、峰值分钟以及峰值背后的任务"""
+
+    PEAK_COUNT = 20
+
+    def __init__(self, expressions, names, parent=None):
+        super().__init__(parent)
+        self.expressions = expressions
+        self.names = names
+        self.analyzer = None
+        self.setWindowTitle('负载分析')
+        self.resize(1000, 700)
+
+        layout = QVBoxLayout(self)
+        options_layout = QHBoxLayout()
+        options_layout.addWidget(QLabel('分析区间'))
+        self.days_spin = QSpinBox()
+        self.days_spin.setRange(1, 31)
+        self.days_spin.setValue(1)
+        self.days_spin.setSuffix(' 天')
+        options_layout.addWidget(self.days_spin)
+        analyze_button = QPushButton('分析')
+        analyze_button.clicked.connect(self.analyze)
+        options_layout.addWidget(analyze_button)
+        options_layout.addStretch()
+        layout.addLayout(options_layout)
+
+        self.summary_label = QLabel()
+        layout.addWidget(self.summary_label)
+
+        self.histogram = HistogramWidget()
+        self.histogram.minute_clicked.connect(self.show_jobs_at)
+        layout.addWidget(self.histogram)
+
+        lists_layout = QHBoxLayout()
+        self.peak_table = QTableWidget(0, 2)
+        self.peak_table.setHorizontalHeaderLabels(['峰值时间', '运行次数'])
+        self.peak_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.peak_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.peak_table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.peak_table.verticalHeader().setVisible(False)
+        self.peak_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.peak_table.currentCellChanged.connect(self.on_peak_selected)
+        lists_layout.addWidget(self.peak_table, 1)
+
+        self.jobs_text = QPlainTextEdit()
+        self.jobs_text.setReadOnly(True)
+        self.jobs_text.setPlaceholderText('选择峰值或点击柱状图查看该分钟运行的任务')
+        lists_layout.addWidget(self.jobs_text, 2)
+        layout.addLayout(lists_layout)
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        close_button = QPushButton('关闭')
+        close_button.clicked.connect(self.accept)
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout)
+
+        self.peaks = []
+        self.analyze()
+
+    def analyze(self):
+        self.analyzer = LoadAnalyzer(self.expressions, datetime.datetime.now(), self.days_spin.value())
+        histogram = self.analyzer.histogram
+        self.peaks = self.analyzer.peaks(self.PEAK_COUNT)
+        threshold = self.peaks[-1][1] if self.peaks else None
+        self.histogram.set_analyzer(self.analyzer, threshold)
+
+        total = sum(histogram)
+        busy = sum(1 for value in histogram if value)
+        summary = f'共 {total} 次运行，{busy} 个分钟有任务运行，平均每分钟 {total / len(histogram):.2f} 次'
+        if self.peaks:
+            index, value = self.peaks[0]
+            summary += f"，峰值 {value} 次（{self.analyzer.moment_of(index).strftime('%m-%d %H:%M')}）"
+        self.summary_label.setText(summary)
+
+        self.peak_table.setRowCount(len(self.peaks))
+        for row, (index, value) in enumerate(self.peaks):
+            self.peak_table.setItem(row, 0, QTableWidgetItem(self.analyzer.moment_of(index).strftime('%m-%d %H:%M')))
+            self.peak_table.setItem(row, 1, QTableWidgetItem(str(value)))
+        self.jobs_text.clear()
+
+    def on_peak_selected(self, row, column, previous_row, previous_column):
+        if 0 <= row < len(self.peaks):
+            self.show_jobs_at(self.peaks[row][0])
+
+    def show_jobs_at(self, index):
+        job_ids = self.analyzer.jobs_at(index)
+        moment = self.analyzer.moment_of(index).strftime('%m-%d %H:%M')
+        lines = [f'{moment} 运行 {len(job_ids)} 个任务：']
+        lines += sorted(f'{self.names.get(job_id, job_id)}    {self.expressions[job_id]}' for job_id in job_ids)
+        self.jobs_text.setPlainText('\n'.join(lines))
+
+
+class TrayJobMenu(QMenu):
+    """托盘中的任务菜单
+
+    菜单项在 aboutToShow 时才根据任务列表生成，最多显示 MAX_ITEMS 个任务，
+    其余任务通过顶部的搜索框过滤查找。已生成的菜单项按任务ID缓存，
+    任务变化时只更新对应菜单项的文字和状态，不再每次刷新都重建整个菜单。
+    """
+
+    STATUS = 'status'  # 只显示任务状态
+    MANAGE = 'manage'  # 每个任务一个启用/禁用/立即运行子菜单
+    MAX_ITEMS = 30
+
+    def __init__(self, title, manager, mode, parent=None):
+        super().__init__(title, parent)
+        self.manager = manager
+        self.mode = mode
+        self.rows = []
+        self.dirty = True
+        self.entries = {}  # 任务ID -> (JobRow, QAction)
+
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText('搜索任务…')
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.textChanged.connect(self.populate)
+        self.search_action = QWidgetAction(self)
+        self.search_action.setDefaultWidget(self.search_edit)
+
+        self.search_separator = QAction(self)
+        self.search_separator.setSeparator(True)
+
+        # 提示项始终位于菜单末尾，不需要时隐藏，任务菜单项插入在它之前
+        self.info_action = QAction(self)
+        self.info_action.setEnabled(False)
+        self.info_action.setVisible(False)
+        self.addAction(self.info_action)
+        self.shown = []  # 当前菜单中按顺序排列的任务菜单项
+
+        self.aboutToShow.connect(self.on_about_to_show)
+
+    def set_rows(self, rows):
+        """更新任务数据；菜单未打开时只做标记，打开时再生成菜单项"""
+        self.rows = rows
+        if self.isVisible():
+            self.populate()
+        else:
+            self.dirty = True
+            for row in rows:
+                entry = self.entries.get(row.job_id)
+                if entry is not None and entry[0] != row:
+                    self.update_entry(row, entry[1])
+                    self.entries[row.job_id] = (row, entry[1])
+
+    def on_about_to_show(self):
+        if self.dirty:
+            self.populate()
+
+    def populate(self):
+        """只插入、移除或移动发生变化的任务菜单项，搜索框保持原位，输入时不会失去焦点"""
+        self.dirty = False
+        keyword = self.search_edit.text().strip().lower()
+        matched = [row for row in self.rows if keyword in row.name.lower()] if keyword else self.rows
+        visible = matched[:self.MAX_ITEMS]
+
+        searchable = len(self.rows) > self.MAX_ITEMS
+        if searchable and self.search_action not in self.actions():
+            first = self.actions()[0]
+            self.insertAction(first, self.search_action)
+            self.insertAction(first, self.search_separator)
+        elif not searchable and self.search_action in self.actions():
+            self.removeAction(self.search_action)
+            self.removeAction(self.search_separator)
+
+        entries = {}
+        for row in visible:
+            entry = self.entries.pop(row.job_id, None)
+            if entry is None:
+                action = self.create_entry(row)
+            else:
+                action = entry[1]
+                if entry[0] != row:
+                    self.update_entry(row, action)
+            entries[row.job_id] = (row, action)
+        # 不再显示的菜单项直接释放，菜单只持有可见任务对应的Qt对象
+        for _, action in self.entries.values():
+            self.removeAction(action)
+            if action.menu() is not None:
+                action.menu().deleteLater()
+            action.deleteLater()
+        self.entries = entries
+
+        wanted = [entries[row.job_id][1] for row in visible]
+        kept = set(wanted)
+        shown = [action for action in self.shown if action in kept]
+        for i, action in enumerate(wanted):
+            if i < len(shown) and shown[i] is action:
+                continue
+            before = shown[i] if i < len(shown) else self.info_action
+            if action in shown:
+                shown.remove(action)
+            self.insertAction(before, action)
+            shown.insert(i, action)
+        self.shown = shown
+
+        if not self.rows:
+            self.info_action.setText('暂无任务')
+        elif len(matched) > len(visible):
+            self.info_action.setText(f'还有 {len(matched) - len(visible)} 个任务，请输入关键字搜索')
+        elif not matched:
+            self.info_action.setText('没有匹配的任务')
+        self.info_action.setVisible(not self.rows or len(matched) > len(visible) or not matched)
+
+    def create_entry(self, row):
+        if self.mode == self.STATUS:
+            action = QAction(self)
+            action.setEnabled(False)
+        else:
+            submenu = QMenu(row.name, self)
+            enable_action = submenu.addAction('启用')
+            enable_action.triggered.connect(lambda checked, job_id=row.job_id: self.manager.enable_job_from_tray(job_id))
+            disable_action = submenu.addAction('禁用')
+            disable_action.triggered.connect(lambda checked, job_id=row.job_id: self.manager.disable_job_from_tray(job_id))
+            submenu.addSeparator()
+            run_action = submenu.addAction('立即运行')
+            run_action.triggered.connect(lambda checked, job_id=row.job_id: self.manager.run_job_from_tray(job_id))
+            action = submenu.menuAction()
+        self.update_entry(row, action)
+        return action
+
+    def update_entry(self, row, action):
+        if self.mode == self.STATUS:
+            status = '启用' if row.enabled else '禁用'
+            action.setText(f'{row.name}: {status}')
+        else:
+            action.setText(row.name)
+            enable_action, disable_action = action.menu().actions()[:2]
+            enable_action.setEnabled(not row.enabled)
+            disable_action.setEnabled(row.enabled)
+
+
+# 立即运行的一个任务：name 用于结果报告
+RunRequest = namedtuple('RunRequest', ['job_id', 'name', 'script_path'])
+
+
+class JobRunner(QObject):
+    """立即运行任务的进程池
+
+    提交的任务按顺序排队，最多同时运行 max_workers 个脚本进程。
+    脚本本身会把输出写入任务日志并追加执行记录，这里只关心退出码。
+    同一个任务已在排队或运行时不会重复提交。每次 submit 的任务全部结束后发出 batch_finished。
+    """
+
+    job_started = pyqtSignal(str)
+    job_finished = pyqtSignal(str, str, int)  # 任务ID, 任务名称, 退出码
+    batch_finished = pyqtSignal(list)         # [(任务名称, 退出码), ...]
+    state_changed = pyqtSignal()
+
+    def __init__(self, max_workers=4, parent=None):
+        super().__init__(parent)
+        self.max_workers = max_workers
+        self.queue = []
+        self.running = {}  # 任务ID -> (RunRequest, QProcess)
+        self.batches = []  # [待完成的任务ID集合, 结果列表]
+
+    def set_max_workers(self, count):
+        self.max_workers = max(1, count)
+        self.start_next()
+
+    def is_busy(self, job_id):
+        return job_id in self.running or any(request.job_id == job_id for request in self.queue)
+
+    def submit(self, requests):
+        """提交一批任务，返回实际加入队列的数量"""
+        requests = [request for request in requests if not self.is_busy(request.job_id)]
+        if requests:
+            self.queue.extend(requests)
+            self.batches.append([set(request.job_id for request in requests), []])
+            self.start_next()
+        return len(requests)
+
+    def start_next(self):
+        while self.queue and len(self.running) < self.max_workers:
+            request = self.queue.pop(0)
+            process = QProcess(self)
+            # 输出已经由脚本写入日志
+            process.setStandardOutputFile(QProcess.nullDevice())
+            process.setStandardErrorFile(QProcess.nullDevice())
+            environment = QProcessEnvironment.systemEnvironment()
+            environment.insert('CHRONOS_NO_SPLAY', '1')  # 立即运行不需要错峰延迟
+            process.setProcessEnvironment(environment)
+            process.finished.connect(
+                lambda exit_code, exit_status, job_id=request.job_id: self.on_finished(job_id, exit_code, exit_status))
+            process.errorOccurred.connect(
+                lambda error, job_id=request.job_id: self.on_error(job_id, error))
+            self.running[request.job_id] = (request, process)
+            process.start('/bin/bash', [request.script_path])
+            self.job_started.emit(request.job_id)
+        self.state_changed.emit()
+
+    def on_error(self, job_id, error):
+        if error == QProcess.ProcessError.FailedToStart:
+            self.on_finished(job_id, 127, QProcess.ExitStatus.CrashExit)
+
+    def on_finished(self, job_id, exit_code, exit_status):
+        entry = self.running.pop(job_id, None)
+        if entry is None:
+            return
+        request, process = entry
+        process.deleteLater()
+        if exit_status == QProcess.ExitStatus.CrashExit and exit_code == 0:
+            exit_code = -1  # 被信号终止
+        self.job_finished.emit(job_id, request.name, exit_code)
+        for batch in list(self.batches):
+            if job_id in batch[0]:
+                batch[0].discard(job_id)
+                batch[1].append((request.name, exit_code))
+                if not batch[0]:
+                    self.batches.remove(batch)
+                    self.batch_finished.emit(batch[1])
+                break
+        self.start_next()
+
+    def stop(self):
+        """程序退出时结束排队和运行中的任务"""
+        self.queue.clear()
+        self.batches.clear()
+        for _, process in list(self.running.values()):
+            process.finished.disconnect()
+            process.kill()
+            process.waitForFinished(1000)
+        self.running.clear()
+
+
+class CronBatch:
+    """crontab批量修改
+
+    在 with 块中对 CronTab 对象的所有修改在退出时只写入一次（只启动一次 crontab 进程）。
+    写入失败或块内抛出异常时，把内存中的 CronTab 恢复到进入前的状态并继续抛出异常。
+    通过本类的方法进行的修改会同步更新任务索引。
+    """
+
+    def __init__(self, cron, index, on_committed=None):
+        self.cron = cron
+        self.index = index
+        self.snapshot = None
+        self.after_commit = []  # 写入成功后才执行的回调，例如清理脚本和日志文件
+        self.on_committed = on_committed
+
+    def __enter__(self):
+        self.snapshot = self.cron.render()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.rollback()
+            return False
+        # 没有实际修改时不必重写crontab
+        if self.cron.render() != self.snapshot:
             try:
-                with open(self.log_file, 'w') as f:
-                    f.write(f"=== 日志清除于 {datetime.datetime.now()} ===\n")
-                self.update_log()
-                QMessageBox.information(self, '成功', '日志已清除')
-            except PermissionError:
-                QMessageBox.critical(self, '错误', '无法清除日志：权限不足')
+                self.cron.write()
+            except Exception:
+                self.rollback()
+                raise
+        for callback in self.after_commit:
+            try:
+                callback()
             except Exception as e:
-                QMessageBox.critical(self, '错误', f'清除日志失败：{str(e)}')
-
-    def export_log(self):
+                print(f"执行提交回调时出错: {str(e)}")
+        if self.on_committed is not None:
+            self.on_committed()
+        return False
+
+    def rollback(self):
+        """恢复进入批量修改前的内存状态"""
+        self.cron.intab = self.snapshot
         try:
-            timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-            default_name = f'log_export_{timestamp}.txt'
-            
-            file_path, _ = QFileDialog.getSaveFileName(
-                self,
-                '导出日志',
-                os.path.join(os.path.expanduser('~/Desktop'), default_name),
-                '文本文件 (*.txt);;所有文件 (*)'
-            )
-            
-            if file_path:
-                with open(self.log_file, 'r') as src, open(file_path, 'w') as dst:
-                    dst.write(src.read())
-                QMessageBox.information(self, '成功', f'日志已导出到：{file_path}')
-        except Exception as e:
-            QMessageBox.critical(self, '错误', f'导出日志失败：{str(e)}')
+            self.cron.read()
+        finally:
+            self.cron.intab = None
+            self.index.rebuild(self.cron)
+
+    def new(self, command, comment, schedule, enabled=True):
+        job = self.cron.new(command=command, comment=comment)
+        job.setall(schedule)
+        if not enabled:
+            job.enable(False)
+        self.index.add(job)
+        return job
+
+    def rename(self, job, name):
+        old_name = job.comment
+        if name != old_name:
+            job.set_comment(name)
+            self.index.rename(job, old_name)
+
+    def set_enabled(self, jobs, enabled=True):
+        for job in jobs:
+            job.enable(enabled)
+
+    def remove(self, jobs):
+        """一次性移除多个任务，避免逐个 remove 造成的 O(n²)"""
+        jobs = list(jobs)
+        self.index.remove(jobs)
+        doomed = set()
+        for job in jobs:
+            if job.env:
+                # 带环境变量的任务交给 python-crontab 处理，以便把环境变量移交给下一个任务
+                self.cron.remove(job)
+            else:
+                doomed.add(id(job))
+        if not doomed:
+            return
+        self.cron.crons[:] = [job for job in self.cron.crons if id(job) not in doomed]
+        self.cron.lines[:] = [line for line in self.cron.lines if id(line) not in doomed]
 
-    def closeEvent(self, event):
-        self.timer.stop()
-        event.accept()
 
 class JobManager(QMainWindow):
+    RETENTION_INTERVAL = 15 * 60 * 1000  # 检查日志磁盘预算的间隔（毫秒）
+
     def __init__(self):
         super().__init__()
         # 设置应用程序名称和组织信息
@@ -565,21 +4450,58 @@ class JobManager(QMainWindow):
         self.base_dir = os.path.expanduser('~/.chronos')
         self.log_dir = os.path.join(self.base_dir, 'logs')
         self.scripts_dir = os.path.join(self.base_dir, 'scripts')
+        self.index_dir = os.path.join(self.base_dir, 'index')
+        self.bin_dir = os.path.join(self.base_dir, 'bin')
+        self.run_dir = os.path.join(self.base_dir, 'run')
+        self.locks_dir = os.path.join(self.base_dir, 'locks')
         
         # 创建必要的目录
         try:
             os.makedirs(self.log_dir, exist_ok=True)
             os.makedirs(self.scripts_dir, exist_ok=True)
+            os.makedirs(self.index_dir, exist_ok=True)
+            os.makedirs(self.bin_dir, exist_ok=True)
+            os.makedirs(self.run_dir, exist_ok=True)
+            os.makedirs(self.locks_dir, exist_ok=True)
         except Exception as e:
             QMessageBox.critical(self, '错误', f'无法创建必要的目录：{str(e)}\n请确保当前用户有权限创建目录。')
             sys.exit(1)
             
         self.setup_ui()
+        self.job_index = JobIndex()
+        self.script_cache = ScriptHeaderCache()
         try:
             self.cron = CronTab(user=True)
         except Exception as e:
             QMessageBox.critical(self, '错误', f'无法初始化crontab：{str(e)}\n请确保系统支持crontab且当前用户有权限访问。')
             sys.exit(1)
+        try:
+            self.job_store = JobStore(os.path.join(self.base_dir, 'chronos.db'))
+        except Exception as e:
+            QMessageBox.critical(self, '错误', f'无法打开任务数据库：{str(e)}')
+            sys.exit(1)
+        for record in self.job_store.load_all().values():
+            self.job_index.remember(record.name, record.job_id)
+        self.job_index.rebuild(self.cron)
+        self.run_ledger = RunLedger(self.get_ledger_path())
+        self.log_search_index = LogSearchIndex(os.path.join(self.index_dir, 'search.db'), self.log_dir)
+        self.fire_queue = FireQueue()
+        # 在最早的下次运行时间到达时刷新"下次运行"列
+        self.fire_timer = QTimer(self)
+        self.fire_timer.setSingleShot(True)
+        self.fire_timer.timeout.connect(self.on_fire_timer)
+        self.settings = QSettings()
+        self.job_runner = JobRunner(SettingsDialog.value(self.settings, 'run/max_workers'), self)
+        self.job_runner.state_changed.connect(self.update_runner_status)
+        self.job_runner.job_finished.connect(lambda *args: self.refresh_runs())
+        self.job_runner.batch_finished.connect(self.report_run_results)
+        # 定期在后台线程中把日志目录控制在磁盘预算之内
+        self.log_compactor = None
+        self.segment_failures = {}
+        self.retention_timer = QTimer(self)
+        self.retention_timer.timeout.connect(self.enforce_log_budget)
+        self.retention_timer.start(self.RETENTION_INTERVAL)
+        QTimer.singleShot(10000, self.enforce_log_budget)
 
         # 初始化日志和脚本目录
         self.base_dir = os.path.expanduser('~/.chronos')
@@ -593,12 +4515,15 @@ class JobManager(QMainWindow):
             sys.exit(1)
 
         self.setup_tray()
-        self.refresh_jobs()
+        self.install_runner()
+        self.refresh_jobs()  # 同时把旧版本任务迁移到元数据存储
+        self.upgrade_scripts()
 
-        # 设置自动刷新定时器
-        self.refresh_timer = QTimer(self)
-        self.refresh_timer.timeout.connect(self.refresh_jobs)
-        self.refresh_timer.start(60000)  # 每分钟刷新一次
+        # 只在crontab或脚本目录实际发生变化时刷新
+        self.crontab_watcher = CrontabWatcher(self.scripts_dir, self.get_ledger_path(), self)
+        self.crontab_watcher.crontab_changed.connect(self.reload_crontab)
+        self.crontab_watcher.scripts_changed.connect(self.refresh_jobs)
+        self.crontab_watcher.runs_changed.connect(self.refresh_runs)
 
     def closeEvent(self, event):
         if not self.tray_icon.isVisible():
@@ -613,10 +4538,21 @@ class JobManager(QMainWindow):
     def cleanup_resources(self):
         """清理程序资源"""
         try:
-            if hasattr(self, 'refresh_timer') and self.refresh_timer is not None:
-                self.refresh_timer.stop()
-                self.refresh_timer.deleteLater()
-                self.refresh_timer = None
+            if hasattr(self, 'job_runner') and self.job_runner is not None:
+                self.job_runner.stop()
+                self.job_runner = None
+            if getattr(self, 'log_compactor', None) is not None:
+                self.log_compactor.requestInterruption()
+                self.log_compactor.wait()
+                self.log_compactor = None
+            if hasattr(self, 'crontab_watcher') and self.crontab_watcher is not None:
+                self.crontab_watcher.stop()
+                self.crontab_watcher.deleteLater()
+                self.crontab_watcher = None
+            FileWatchService.instance().stop()
+            if hasattr(self, 'job_store') and self.job_store is not None:
+                self.job_store.close()
+                self.job_store = None
             if hasattr(self, 'tray_icon') and self.tray_icon is not None:
                 self.tray_icon.hide()
                 self.tray_icon.deleteLater()
@@ -653,11 +4589,11 @@ class JobManager(QMainWindow):
         self.tray_menu.addSeparator()
 
         # 添加状态子菜单
-        self.status_menu = QMenu('任务状态', self)
+        self.status_menu = TrayJobMenu('任务状态', self, TrayJobMenu.STATUS, self)
         self.tray_menu.addMenu(self.status_menu)
-        
+
         # 添加任务管理子菜单
-        self.job_menu = QMenu('任务管理', self)
+        self.job_menu = TrayJobMenu('任务管理', self, TrayJobMenu.MANAGE, self)
         self.tray_menu.addMenu(self.job_menu)
         
         # 添加目录访问子菜单
@@ -684,92 +4620,26 @@ class JobManager(QMainWindow):
         self.tray_icon.activated.connect(self.tray_icon_activated)
 
     def update_status_menu(self):
-        self.status_menu.clear()
-        self.job_menu.clear()
-        for job in self.cron:
-            # 更新状态菜单
-            status = '启用' if job.is_enabled() else '禁用'
-            status_action = QAction(f'{job.comment}: {status}', self)
-            status_action.setEnabled(False)
-            self.status_menu.addAction(status_action)
-            
-            # 更新任务管理菜单
-            job_submenu = QMenu(job.comment, self)
-            
-            enable_action = QAction('启用', self)
-            enable_action.triggered.connect(lambda checked, j=job: self.enable_job_from_tray(j))
-            enable_action.setEnabled(not job.is_enabled())
-            job_submenu.addAction(enable_action)
-            
-            disable_action = QAction('禁用', self)
-            disable_action.triggered.connect(lambda checked, j=job: self.disable_job_from_tray(j))
-            disable_action.setEnabled(job.is_enabled())
-            job_submenu.addAction(disable_action)
-            
-            self.job_menu.addMenu(job_submenu)
-            
-        if self.status_menu.isEmpty():
-            status_action = QAction('暂无任务', self)
-            status_action.setEnabled(False)
-            self.status_menu.addAction(status_action)
-            
-            job_action = QAction('暂无任务', self)
-            job_action.setEnabled(False)
-            self.job_menu.addAction(job_action)
-            
-    def enable_job_from_tray(self, job):
-        job.enable()
-        self.cron.write()
-        self.refresh_jobs()
-        
-    def disable_job_from_tray(self, job):
-        job.enable(False)
-        self.cron.write()
-        self.refresh_jobs()
+        # 托盘菜单在打开时才生成菜单项
+        if getattr(self, 'status_menu', None) is None:
+            return
+        self.status_menu.set_rows(self.job_model.rows)
+        self.job_menu.set_rows(self.job_model.rows)
 
-    def refresh_jobs(self):
-        self.table.setRowCount(0)
-        enabled_count = 0
-        disabled_count = 0
-        
-        for job in self.cron:
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-            name = job.comment
-            
-            # 从脚本文件中读取原始命令
-            script_path = self.get_script_path(name)
-            original_command = ""
-            if os.path.exists(script_path):
-                with open(script_path, 'r') as f:
-                    lines = f.readlines()
-                    # 查找以 ## 开头的行来获取原始命令
-                    for line in lines:
-                        line = line.strip()
-                        if line.startswith('## '):
-                            original_command = line[3:].strip()  # 去掉 '## ' 前缀
-                            break
-            
-            if not original_command:
-                original_command = job.command
-            self.table.setItem(row, 0, QTableWidgetItem(name))
-            self.table.setItem(row, 1, QTableWidgetItem(original_command))
-            self.table.setItem(row, 2, QTableWidgetItem(str(job.slices)))
-            
-            # 添加启用/禁用状态
-            status_item = QTableWidgetItem('⬤')
-            if job.is_enabled():
-                status_item.setForeground(QBrush(QColor('#2e7d32')))  # 绿色圆点
-                enabled_count += 1
-            else:
-                status_item.setForeground(QBrush(QColor('#d32f2f')))  # 红色圆点
-                disabled_count += 1
-            status_item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-            self.table.setItem(row, 3, status_item)
-        
-        total_count = enabled_count + disabled_count
-        self.status_bar.showMessage(f'总任务数: {total_count} | 已启用: {enabled_count} | 已禁用: {disabled_count} | 版本: {VERSION}')
-        self.update_status_menu()
+    def enable_job_from_tray(self, job_id):
+        job = self.job_index.get_by_id(job_id)
+        if job is not None:
+            self.set_jobs_enabled([job], True)
+
+    def disable_job_from_tray(self, job_id):
+        job = self.job_index.get_by_id(job_id)
+        if job is not None:
+            self.set_jobs_enabled([job], False)
+
+    def run_job_from_tray(self, job_id):
+        job = self.job_index.get_by_id(job_id)
+        if job is not None:
+            self.run_jobs([job])
 
     def setup_ui(self):
         self.setMinimumSize(1000, 500)
@@ -782,16 +4652,16 @@ class JobManager(QMainWindow):
             QMainWindow {
                 background-color: #f5f5f5;
             }
-            QTableWidget {
+            QTableView {
                 background-color: white;
                 border: 1px solid #ddd;
                 border-radius: 4px;
                 gridline-color: #eee;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 5px;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background-color: #f5f5f5;
                 color: #333;
             }
@@ -876,6 +4746,12 @@ class JobManager(QMainWindow):
         self.add_action.setToolTip('添加新任务')
         file_menu.addAction(self.add_action)
 
+        file_menu.addSeparator()
+        self.settings_action = QAction('设置…', self)
+        self.settings_action.setShortcut('Ctrl+,')
+        self.settings_action.triggered.connect(self.show_settings)
+        file_menu.addAction(self.settings_action)
+
         file_menu.addSeparator()
         exit_action = QAction('退出', self)
         exit_action.setShortcut('Ctrl+Q')
@@ -904,6 +4780,16 @@ class JobManager(QMainWindow):
         self.disable_action.setToolTip('禁用选中的任务')
         edit_menu.addAction(self.disable_action)
 
+        edit_menu.addSeparator()
+        self.run_now_action = QAction('立即运行', self)
+        self.run_now_action.setShortcut('Ctrl+R')
+        self.run_now_action.setToolTip('立即运行选中的任务，输出写入任务日志')
+        edit_menu.addAction(self.run_now_action)
+
+        self.spread_action = QAction('错峰分布', self)
+        self.spread_action.setToolTip('重新分配选中任务的分钟字段，使其避开其他任务集中运行的时间')
+        edit_menu.addAction(self.spread_action)
+
         # 视图菜单
         view_menu = menubar.addMenu('视图')
         self.view_log_action = QAction('查看日志', self)
@@ -911,6 +4797,32 @@ class JobManager(QMainWindow):
         self.view_log_action.setToolTip('查看选中任务的日志')
         view_menu.addAction(self.view_log_action)
 
+        self.view_history_action = QAction('运行历史', self)
+        self.view_history_action.setShortcut('Ctrl+H')
+        self.view_history_action.setToolTip('查看选中任务的运行历史和资源使用情况')
+        view_menu.addAction(self.view_history_action)
+
+        self.upcoming_action = QAction('运行计划', self)
+        self.upcoming_action.setToolTip('查看未来24小时所有任务的运行时间轴')
+        self.upcoming_action.triggered.connect(self.view_upcoming_runs)
+        view_menu.addAction(self.upcoming_action)
+
+        self.load_analysis_action = QAction('负载分析', self)
+        self.load_analysis_action.setToolTip('分析所有任务每分钟的运行次数，找出集中运行的时间点')
+        self.load_analysis_action.triggered.connect(self.view_load_analysis)
+        view_menu.addAction(self.load_analysis_action)
+
+        self.merged_log_action = QAction('合并查看日志', self)
+        self.merged_log_action.setToolTip('按执行时间合并查看选中任务的日志')
+        self.merged_log_action.triggered.connect(self.view_merged_logs)
+        view_menu.addAction(self.merged_log_action)
+
+        self.search_logs_action = QAction('搜索日志', self)
+        self.search_logs_action.setShortcut('Ctrl+Shift+F')
+        self.search_logs_action.setToolTip('在所有任务的日志中搜索文本')
+        self.search_logs_action.triggered.connect(self.search_logs)
+        view_menu.addAction(self.search_logs_action)
+
         self.refresh_action = QAction('刷新', self)
         self.refresh_action.setShortcut('F5')
         self.refresh_action.setToolTip('刷新任务列表')
@@ -984,14 +4896,16 @@ class JobManager(QMainWindow):
         toolbar.addAction(self.delete_action)
         toolbar.addAction(self.enable_action)
         toolbar.addAction(self.disable_action)
+        toolbar.addAction(self.run_now_action)
         toolbar.addAction(self.view_log_action)
         toolbar.addAction(self.refresh_action)
 
 
         # 创建表格
-        self.table = QTableWidget()
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels(['任务名称', '执行命令', '执行计划', '状态'])
+        self.job_model = JobTableModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.job_model)
+        self.table.verticalHeader().setVisible(False)
         header = self.table.horizontalHeader()
         header.setStretchLastSection(False)  # 禁用最后一列自动拉伸
         header.setSectionResizeMode(0, QHeaderView.ResizeMode.Interactive)
@@ -1000,18 +4914,21 @@ class JobManager(QMainWindow):
         header.setSectionResizeMode(3, QHeaderView.ResizeMode.Fixed)  # 将状态列设置为固定宽度
         self.table.setColumnWidth(0, 150)  # 调整任务名称列宽度
         self.table.setColumnWidth(3, 50)  # 设置状态列固定宽度为50px
-        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)  # 禁用编辑
+        for column, width in ((4, 100), (5, 60), (6, 120), (7, 80), (8, 70), (9, 80), (10, 80)):
+            header.setSectionResizeMode(column, QHeaderView.ResizeMode.Interactive)
+            self.table.setColumnWidth(column, width)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)  # 禁用编辑
         
         # 设置表格选择模式为整行选择，支持多选
-        self.table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
-        self.table.setSelectionMode(QTableWidget.SelectionMode.ExtendedSelection)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
         
         # 添加右键菜单
         self.table.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.table.customContextMenuRequested.connect(self.show_context_menu)
         
         # 添加双击事件处理
-        self.table.cellDoubleClicked.connect(self.edit_job)
+        self.table.doubleClicked.connect(self.edit_job)
 
         layout.addWidget(self.table)
 
@@ -1019,6 +4936,8 @@ class JobManager(QMainWindow):
         self.status_bar = QStatusBar()
         self.setStatusBar(self.status_bar)
         self.status_bar.showMessage('就绪')
+        self.runner_label = QLabel()
+        self.status_bar.addPermanentWidget(self.runner_label)
 
         # 连接信号
         self.add_action.triggered.connect(self.add_job)
@@ -1026,8 +4945,11 @@ class JobManager(QMainWindow):
         self.delete_action.triggered.connect(self.delete_job)
         self.enable_action.triggered.connect(self.enable_jobs)
         self.disable_action.triggered.connect(self.disable_jobs)
-        self.refresh_action.triggered.connect(self.refresh_jobs)
+        self.refresh_action.triggered.connect(self.reload_crontab)
         self.view_log_action.triggered.connect(self.view_log)
+        self.view_history_action.triggered.connect(self.view_history)
+        self.run_now_action.triggered.connect(self.run_selected_jobs)
+        self.spread_action.triggered.connect(self.spread_job_minutes)
 
     
 
@@ -1037,6 +4959,7 @@ class JobManager(QMainWindow):
             name = dialog.name_edit.text().strip()
             command = dialog.command_edit.toPlainText().strip()
             schedule = dialog.cron_editor.get_cron_expression()
+            options = dialog.get_options()
 
             # 验证输入
             if not name:
@@ -1048,19 +4971,17 @@ class JobManager(QMainWindow):
 
             try:
                 # 检查任务名是否重复
-                for job in self.cron:
-                    if job.comment == name:
-                        QMessageBox.warning(self, '输入错误', '任务名称已存在，请使用其他名称')
-                        return
+                if name in self.job_index:
+                    QMessageBox.warning(self, '输入错误', '任务名称已存在，请使用其他名称')
+                    return
 
                 # 创建执行脚本
-                script_path = self.create_script_file(name, command)
-                # 添加到crontab
-                job = self.cron.new(command=script_path, comment=name)
-                job.setall(schedule)
+                script_path = self.create_script_file(name, command, options=options)
 
                 try:
-                    self.cron.write()
+                    # 添加到crontab
+                    with self.cron_batch() as batch:
+                        batch.new(script_path, name, schedule)
                     # 创建日志文件并添加初始记录
                     log_file = self.get_log_path(name)
                     with open(log_file, 'a') as f:
@@ -1071,79 +4992,77 @@ class JobManager(QMainWindow):
                     self.refresh_jobs()
                     self.status_bar.showMessage(f'任务 "{name}" 创建成功', 3000)
                 except IOError as e:
-                    if 'Operation not permitted' in str(e):
-                        QMessageBox.critical(self, '权限错误',
-                            '无法修改定时任务，因为当前用户没有足够的权限。\n\n'
-                            '请尝试以下解决方案：\n'
-                            '1. 使用管理员权限运行此程序\n'
-                            '2. 确保当前用户有权限修改crontab文件')
-                    else:
-                        QMessageBox.critical(self, '错误', f'写入定时任务失败：{str(e)}')
+                    self.show_crontab_error(e, '写入定时任务失败')
             except Exception as e:
                 QMessageBox.critical(self, '错误', f'创建任务失败：{str(e)}')
 
     def edit_job(self):
-        current_row = self.table.currentRow()
-        if current_row < 0:
+        if not self.table.currentIndex().isValid():
             QMessageBox.warning(self, '警告', '请选择要编辑的任务')
             return
 
         try:
-            cron_jobs = list(self.cron)
-            if current_row >= len(cron_jobs):
+            job = self.current_job()
+            if job is None:
                 QMessageBox.warning(self, '错误', '无法找到选中的任务，请刷新任务列表后重试')
                 return
-            job = cron_jobs[current_row]
+            job_id = self.job_index.id_of(job)
             name = job.comment
         
-            # 从脚本文件中读取原始命令
-            script_path = self.get_script_path(name)
-            original_command = job.command
-            if os.path.exists(script_path):
-                with open(script_path, 'r') as f:
-                    lines = f.readlines()
-                    # 查找以 ## 开头的行来获取原始命令
-                    for line in lines:
-                        line = line.strip()
-                        if line.startswith('## '):
-                            original_command = line[3:].strip()  # 去掉 '## ' 前缀
-                            break
-            
+            # 优先从元数据存储读取原始命令，旧任务再从脚本文件中读取
+            record = self.job_store.get(name)
+            if record is not None:
+                original_command = record.command
+            else:
+                header = self.script_cache.get(self.get_script_path(name))
+                original_command = header.command if header is not None and header.command else job.command
+
+            options = record.options if record is not None else {}
             dialog = JobDialog(self)
             dialog.name_edit.setText(name)
             dialog.command_edit.setPlainText(original_command)
             dialog.cron_editor.set_cron_expression(str(job.slices))
+            dialog.set_options(options)
 
             if dialog.exec() == QDialog.DialogCode.Accepted:
                 try:
                     new_name = dialog.name_edit.text().strip()
                     new_command = dialog.command_edit.toPlainText().strip()
-                    
-                    # 如果任务名称改变，需要删除旧的脚本文件
-                    if new_name != name:
-                        old_script_path = self.get_script_path(name)
-                        if os.path.exists(old_script_path):
-                            os.remove(old_script_path)
-                    
-                    # 创建新的脚本文件
-                    script_path = self.create_script_file(new_name, new_command)
-                    
-                    # 更新crontab任务
-                    job.set_command(script_path)
-                    job.set_comment(new_name)
-                    job.setall(dialog.cron_editor.get_cron_expression())
-                    self.cron.write()
+
+                    # 对话框打开期间crontab可能已被重新加载，按ID重新定位任务
+                    job = self.job_index.get_by_id(job_id)
+                    if job is None:
+                        QMessageBox.warning(self, '错误', '任务已被删除，请刷新任务列表后重试')
+                        return
+                    if new_name != name and new_name in self.job_index:
+                        QMessageBox.warning(self, '输入错误', '任务名称已存在，请使用其他名称')
+                        return
+
+                    # 写入crontab失败时恢复脚本和元数据记录，任务不会指向已删除或内容不符的脚本
+                    saved = self.save_job_files([name, new_name])
+                    try:
+                        # 任务名称改变时元数据记录随之改名（保留任务ID），再创建新的脚本文件
+                        if new_name != name:
+                            self.job_store.rename(name, new_name)
+                        script_path = self.create_script_file(new_name, new_command,
+                                                              options=dialog.get_options(options))
+
+                        # 更新crontab任务，写入成功后才删除旧的脚本文件
+                        with self.cron_batch() as batch:
+                            job.set_command(script_path)
+                            batch.rename(job, new_name)
+                            job.setall(dialog.cron_editor.get_cron_expression())
+                            old_script_path = self.get_script_path(name)
+                            if old_script_path != script_path:
+                                batch.after_commit.append(lambda: self.remove_file(old_script_path))
+                    except Exception:
+                        self.restore_job_files(saved)
+                        raise
                     self.refresh_jobs()
                     self.status_bar.showMessage(f'任务 "{new_name}" 更新成功', 3000)
                 except IOError as e:
-                    if 'Operation not permitted' in str(e):
-                        QMessageBox.critical(self, '权限错误',
-                            '无法修改定时任务，因为当前用户没有足够的权限。\n\n'
-                            '请尝试以下解决方案：\n'
-                            '1. 使用管理员权限运行此程序\n'
-                            '2. 确保当前用户有权限修改crontab文件')
-                    else:
-                        QMessageBox.critical(self, '错误', f'写入定时任务失败：{str(e)}')
+                    self.refresh_jobs()
+                    self.show_crontab_error(e, '写入定时任务失败')
                 except Exception as e:
                     QMessageBox.critical(self, '错误', f'更新任务失败：{str(e)}')
         except Exception as e:
@@ -1164,12 +5083,221 @@ class JobManager(QMainWindow):
         normalized_name = self.normalize_task_name(name)
         return os.path.join(self.log_dir, f"{normalized_name}.log")
 
-    def create_script_file(self, name, command):
-        """创建任务的执行脚本"""
+    def get_ledger_path(self):
+        """获取执行记录账本的路径（每个用户一个）"""
+        return os.path.join(self.base_dir, 'runs.ledger')
+
+    def get_runner_path(self):
+        """获取任务执行器（runner.py）安装后的路径"""
+        return os.path.join(self.bin_dir, 'runner.py')
+
+    def install_runner(self):
+        """把随程序发布的执行器复制到 ~/.chronos/bin，内容相同时不重复写入"""
+        source = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'runner.py')
+        target = self.get_runner_path()
+        try:
+            with open(source, 'rb') as f:
+                content = f.read()
+        except OSError:
+            QMessageBox.warning(self, '警告', '找不到任务执行器 runner.py，任务将不记录资源使用情况。')
+            return
+        try:
+            with open(target, 'rb') as f:
+                if f.read() == content:
+                    return
+        except OSError:
+            pass
+        try:
+            with open(target + '.tmp', 'wb') as f:
+                f.write(content)
+            os.chmod(target + '.tmp', 0o755)
+            os.replace(target + '.tmp', target)  # 原子替换，正在运行的任务不会读到写了一半的文件
+        except OSError as e:
+            QMessageBox.warning(self, '警告', f'无法安装任务执行器：{str(e)}')
+
+    def get_run_index_path(self, name):
+        """获取任务日志的执行索引文件路径"""
+        normalized_name = self.normalize_task_name(name)
+        return os.path.join(self.index_dir, f"{normalized_name}.runs")
+
+    def cron_batch(self):
+        """开始一次crontab批量修改，退出时统一写入"""
+        # 自己写入的变化不需要再由监视器触发一次重新加载
+        watcher = getattr(self, 'crontab_watcher', None)
+        return CronBatch(self.cron, self.job_index, watcher.reset if watcher is not None else None)
+
+    def reload_crontab(self):
+        """从系统重新读取crontab并刷新界面"""
+        try:
+            self.cron.read()
+        except Exception as e:
+            self.status_bar.showMessage(f'重新读取crontab失败：{str(e)}', 5000)
+            return
+        self.job_index.rebuild(self.cron)
+        self.refresh_jobs()
+
+    def current_job(self):
+        """通过任务ID获取表格当前行对应的任务"""
+        index = self.table.currentIndex()
+        if not index.isValid():
+            return None
+        return self.job_index.get_by_id(self.job_model.job_id(index.row()))
+
+    def selected_jobs(self):
+        """通过任务ID获取表格中所有选中的任务"""
+        jobs = []
+        for index in self.table.selectionModel().selectedRows():
+            job = self.job_index.get_by_id(self.job_model.job_id(index.row()))
+            if job is not None:
+                jobs.append(job)
+        return jobs
+
+    def show_crontab_error(self, e, message):
+        """显示写入crontab失败的错误信息"""
+        if 'Operation not permitted' in str(e):
+            QMessageBox.critical(self, '权限错误',
+                '无法修改定时任务，因为当前用户没有足够的权限。\n\n'
+                '请尝试以下解决方案：\n'
+                '1. 使用管理员权限运行此程序\n'
+                '2. 确保当前用户有权限修改crontab文件')
+        else:
+            QMessageBox.critical(self, '错误', f'{message}：{str(e)}')
+
+    def save_job_record(self, name, command, created=None, options=None):
+        """写入任务元数据，保留已有记录的ID、创建时间和选项"""
+        record = self.job_store.get(name)
+        if record is None:
+            job = self.job_index.get(name)
+            job_id = self.job_index.id_of(job) if job is not None else None
+            record = JobRecord(job_id or self.job_index.new_id(), name, command,
+                               created or str(datetime.datetime.now()), options or {})
+        else:
+            record = record._replace(command=command)
+            if created:
+                record = record._replace(created=created)
+            if options is not None:
+                record = record._replace(options=options)
+        self.job_store.save(record)
+        self.job_index.remember(name, record.job_id)
+        return record
+
+    def create_script_file(self, name, command, created=None, options=None):
+        """创建任务的执行脚本，同时更新元数据存储"""
         script_path = self.get_script_path(name)
         log_path = self.get_log_path(name)
-        
-        script_content = f"#!/bin/bash\n\n# Task: {name}\n# Created: {datetime.datetime.now()}\n\n## {command}\n\n# 设置错误处理\nset -e\n\n# 设置工作目录\ncd $(dirname \"$0\")\n\n# 添加分隔符\necho \"\n----------------------------------------\n执行时间: $(date '+%Y-%m-%d %H:%M:%S')\n----------------------------------------\n\" | tee -a \"{log_path}\"\n\n# 执行命令并记录日志\n{{ {command}; }} 2>&1 | tee -a \"{log_path}\" || {{\n    echo \"[$(date '+%Y-%m-%d %H:%M:%S')] 执行失败\" | tee -a \"{log_path}\"\n    exit 1\n}}\n\necho \"[$(date '+%Y-%m-%d %H:%M:%S')] 执行成功\" | tee -a \"{log_path}\"\n"
+        record = self.save_job_record(name, command, created, options)
+        # 多行命令的每一行都加上 '## ' 前缀，避免注释之外的行被执行
+        header_command = '\n'.join(f'## {line}' for line in command.split('\n'))
+        # here-document 遇到与结束标记相同的行就会结束，命令中含有该行时换用带随机后缀的标记
+        lines = set(command.split('\n'))
+        delimiter = 'CHRONOS_COMMAND'
+        while delimiter in lines:
+            delimiter = f'CHRONOS_COMMAND_{uuid.uuid4().hex[:8]}'
+
+        ledger_path = self.get_ledger_path()
+        runner_path = self.get_runner_path()
+        # 每次运行的资源统计临时文件，$$ 为脚本进程号，同一任务并发运行时互不覆盖
+        usage_path = os.path.join(self.run_dir, f'{record.job_id}.$$.usage')
+        runner_args = self.runner_args(record)
+        rotate_args = self.rotate_args(record)
+        splay_block = lean_block = rotate_block = ''
+        offset, _, _ = self.splay_of(name, record.options)
+        if SettingsDialog.value(self.settings, 'run/lean'):
+            lean_block = f"""
+# 精简模式：错峰、日志和执行记录都由执行器完成，只启动这一个进程；没有 python3 时按下面的方式运行
+if command -v python3 > /dev/null && [ -f "{runner_path}" ]; then
+    exec python3 -S "{runner_path}" job --job-id "{record.job_id}" --log "{log_path}" --ledger "{ledger_path}" --cwd "{self.scripts_dir}" --splay {offset}{rotate_args}{runner_args} -- /bin/bash -ec "$__command"
+fi
+"""
+        if rotate_args:
+            rotate_block = f"""
+# 日志轮转：满足条件时重命名当前日志，旧日志段在后台压缩
+if command -v python3 > /dev/null && [ -f "{runner_path}" ]; then
+    python3 -S "{runner_path}" rotate --log "{log_path}"{rotate_args} || true
+fi
+"""
+        if offset:
+            splay_block = f"""
+# 错峰：按任务名称散列的固定延迟（立即运行时跳过）
+__scheduled=$(date +%s)
+if [ -z "$CHRONOS_NO_SPLAY" ]; then
+    sleep {offset}
+fi
+"""
+        script_content = f"""#!/bin/bash
+
+# Task: {name}
+# Job-ID: {record.job_id}
+# Created: {record.created}
+# Wrapper: {WRAPPER_VERSION}
+
+{header_command}
+
+# 原始命令
+IFS= read -r -d '' __command <<'{delimiter}' || true
+{command}
+{delimiter}
+{lean_block}
+# 设置错误处理
+set -e
+
+# 设置工作目录
+cd $(dirname "$0")
+{splay_block}{rotate_block}
+# 添加分隔符
+echo "
+----------------------------------------
+执行时间: $(date '+%Y-%m-%d %H:%M:%S')
+----------------------------------------
+" | tee -a "{log_path}"
+
+# 有 python3 时通过执行器运行命令，以记录CPU时间、内存峰值和块I/O，并按重叠策略加锁
+__usage="{usage_path}"
+if command -v python3 > /dev/null && [ -f "{runner_path}" ]; then
+    __measure=(python3 -S "{runner_path}" exec --usage "$__usage"{runner_args} --)
+else
+    __measure=()
+fi
+
+# 执行命令并记录日志，退出码取命令本身而不是 tee 的
+__start=$(date +%s)
+__scheduled=${{__scheduled:-$__start}}
+__before=$(wc -c < "{log_path}")
+"${{__measure[@]}}" /bin/bash -ec "$__command" 2>&1 | tee -a "{log_path}"
+__status=${{PIPESTATUS[0]}}
+__end=$(date +%s)
+__after=$(wc -c < "{log_path}")
+
+__utime=- __stime=- __maxrss=- __inblock=- __oublock=- __skipped=0
+if [ -f "$__usage" ]; then
+    read -r __utime __stime __maxrss __inblock __oublock < "$__usage" || true
+    rm -f "$__usage"
+    if [ "$__utime" = skipped ]; then
+        __utime=- __stime=- __maxrss=- __inblock=- __oublock=- __skipped=1
+    fi
+fi
+
+# 追加执行记录：任务ID、计划分钟、开始/结束时间、退出码、输出字节数、
+# 用户/系统CPU毫秒、内存峰值KB、读/写块数、是否因重叠而跳过（单行写入，并发追加不会交错）
+printf '%s\\t%s\\t%s\\t%s\\t%s\\t%s\\t%s\\t%s\\t%s\\t%s\\t%s\\t%s\\n' "{record.job_id}" "$((__scheduled / 60 * 60))" "$__start" "$__end" "$__status" "$((__after - __before))" "$__utime" "$__stime" "$__maxrss" "$__inblock" "$__oublock" "$__skipped" >> "{ledger_path}"
+
+# 账本超过上限时由执行器轮转，Chronos 没有运行时账本也不会无限增长
+if [ ${{#__measure[@]}} -gt 0 ] && [ "$(wc -c < "{ledger_path}")" -gt {LEDGER_ROTATE_BYTES} ]; then
+    python3 -S "{runner_path}" rotate-ledger --ledger "{ledger_path}" || true
+fi
+
+if [ "$__skipped" = 1 ]; then
+    echo "[$(date '+%Y-%m-%d %H:%M:%S')] 已跳过" | tee -a "{log_path}"
+    exit 0
+fi
+
+if [ "$__status" -ne 0 ]; then
+    echo "[$(date '+%Y-%m-%d %H:%M:%S')] 执行失败" | tee -a "{log_path}"
+    exit "$__status"
+fi
+
+echo "[$(date '+%Y-%m-%d %H:%M:%S')] 执行成功" | tee -a "{log_path}"
+"""
         
         try:
             with open(script_path, 'w') as f:
@@ -1180,14 +5308,11 @@ class JobManager(QMainWindow):
             raise Exception(f'创建脚本文件失败：{str(e)}')
 
     def delete_job(self):
-        selected_items = self.table.selectedItems()
-        if not selected_items:
+        jobs = self.selected_jobs()
+        if not jobs:
             QMessageBox.warning(self, '警告', '请先选择要删除的任务')
             return
-
-        # 获取选中的行
-        rows = list(set(item.row() for item in selected_items))
-        names = [self.table.item(row, 0).text() for row in rows]
+        names = [job.comment for job in jobs]
         
         # 构建确认消息
         message = '确定要删除以下任务吗？\n\n' + '\n'.join(f'- {name}' for name in names)
@@ -1196,169 +5321,456 @@ class JobManager(QMainWindow):
 
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                for name in names:
+                with self.cron_batch() as batch:
                     # 删除crontab中的任务
-                    for job in self.cron:
-                        if job.comment == name:
-                            self.cron.remove(job)
-                            break
-                    
-                    # 清理相关文件
-                    script_path = self.get_script_path(name)
-                    log_path = self.get_log_path(name)
-                    
-                    if os.path.exists(script_path):
-                        os.remove(script_path)
-                    if os.path.exists(log_path):
-                        os.remove(log_path)
-                
-                # 写入crontab文件
-                self.cron.write()
+                    batch.remove(jobs)
+                    # crontab写入成功后再清理相关文件
+                    batch.after_commit.append(lambda: self.remove_job_files(names))
                 self.refresh_jobs()
                 self.status_bar.showMessage(f'已删除 {len(names)} 个任务', 3000)
+            except IOError as e:
+                self.show_crontab_error(e, '删除任务失败')
             except Exception as e:
                 QMessageBox.critical(self, '错误', f'删除任务失败：{str(e)}')
 
+    def remove_job_files(self, names):
+        """清理任务对应的脚本、日志文件和元数据"""
+        for name in names:
+            log_path = self.get_log_path(name)
+            for path in ([self.get_script_path(name), log_path, log_path + RUN_COUNT_SUFFIX,
+                          self.get_run_index_path(name)] + log_segments(log_path)):
+                if os.path.exists(path):
+                    os.remove(path)
+        self.job_store.delete(names)
+
+    def refresh_runs(self):
+        """执行记录账本有新记录时刷新任务列表"""
+        if self.run_ledger.update():
+            self.refresh_jobs()
+
+    def upgrade_scripts(self):
+        """重新生成由旧版本模板创建的脚本，使其写入执行记录等新功能"""
+        self.regenerate_scripts(lambda record, header: header.wrapper < WRAPPER_VERSION)
+
+    def regenerate_scripts(self, predicate):
+        """重新生成满足 predicate(record, header) 的任务脚本"""
+        for record in self.job_store.load_all().values():
+            job = self.job_index.get(record.name)
+            script_path = self.get_script_path(record.name)
+            if job is None or job.command != script_path:
+                continue
+            header = self.script_cache.get(script_path)
+            if header is not None and predicate(record, header):
+                try:
+                    self.create_script_file(record.name, record.command)
+                except Exception as e:
+                    print(f"更新脚本失败 {record.name}: {str(e)}")
+
+    def runner_args(self, record):
+        """任务选项对应的执行器参数：重叠运行策略和执行策略"""
+        options = record.options
+        args = ''
+        # 重叠运行策略：skip/queue 时由执行器持有 ~/.chronos/locks 下的文件锁
+        overlap = options.get('overlap', 'allow')
+        if overlap in ('skip', 'queue'):
+            lock_prefix = os.path.join(self.locks_dir, record.job_id)
+            args += f' --lock "{lock_prefix}" --slots {max(int(options.get("instances", 1)), 1)}'
+            if overlap == 'queue':
+                args += ' --wait'
+        for key, flag in (('timeout', '--timeout'), ('nice', '--nice'), ('memory_limit', '--memory'),
+                          ('cpu_limit', '--cpu-time')):
+            if options.get(key):
+                args += f' {flag} {int(options[key])}'
+        if options.get('io_class') in ('low', 'idle'):
+            args += f' --io-class {options["io_class"]}'
+        return args
+
+    def rotate_args(self, record):
+        """日志轮转选项对应的执行器参数，没有设置轮转时为空"""
+        options = record.options
+        args = ''
+        for key, flag in (('rotate_size', '--max-size'), ('rotate_age', '--max-age'), ('rotate_runs', '--max-runs')):
+            if options.get(key):
+                args += f' {flag} {int(options[key])}'
+        if args:
+            args += f' --keep {int(options.get("rotate_keep", 5))}'
+        return args
+
+    def splay_of(self, name, options, global_window=None):
+        """返回 (延迟秒数, 错峰窗口, 是否来自全局设置)"""
+        window = options.get('splay')
+        is_global = window is None
+        if is_global:
+            window = global_window if global_window is not None else SettingsDialog.value(self.settings, 'run/splay')
+        if window <= 0:
+            return 0, 0, is_global
+        # 按名称散列，同一任务每次得到相同的延迟，不同任务均匀分布在窗口内
+        digest = hashlib.sha1(name.encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big') % (window + 1), window, is_global
+
+    def schedule_expression(self, job):
+        """任务计划的数字形式（python-crontab 会把 "0 * * * *" 显示为 @hourly）"""
+        if job.slices.special == '@reboot':
+            return '@reboot'
+        return job.slices.clean_render()
+
+    def update_fire_queue(self):
+        """按已启用任务的计划更新下次运行时间"""
+        expressions = {self.job_index.id_of(job): self.schedule_expression(job)
+                       for job in self.cron if job.is_enabled()}
+        self.fire_queue.update(expressions, datetime.datetime.now())
+        self.schedule_fire_timer()
+
+    def schedule_fire_timer(self):
+        moment = self.fire_queue.peek()
+        if moment is None:
+            self.fire_timer.stop()
+            return
+        delay = (moment - datetime.datetime.now()).total_seconds()
+        # 长时间休眠后系统时间可能跳变，最多等待一小时再重新计算
+        self.fire_timer.start(int(min(max(delay, 0) + 1, 3600) * 1000))
+
+    def on_fire_timer(self):
+        if self.fire_queue.advance(datetime.datetime.now()):
+            self.refresh_jobs()
+        else:
+            self.schedule_fire_timer()
+
     def refresh_jobs(self):
-        self.table.setRowCount(0)
+        self.run_ledger.update()
+        self.update_fire_queue()
+
+        rows = []
         enabled_count = 0
         disabled_count = 0
-        
+
+        script_paths = []
+        records = self.job_store.load_all()
+        migrated = []
+        global_splay = SettingsDialog.value(self.settings, 'run/splay')
         for job in self.cron:
-            row = self.table.rowCount()
-            self.table.insertRow(row)
             name = job.comment
-            
-            # 从脚本文件中读取原始命令
-            script_path = self.get_script_path(name)
-            original_command = ""
-            if os.path.exists(script_path):
-                with open(script_path, 'r') as f:
-                    lines = f.readlines()
-                    # 查找以 ## 开头的行来获取原始命令
-                    for line in lines:
-                        line = line.strip()
-                        if line.startswith('## '):
-                            original_command = line[3:].strip()  # 去掉 '## ' 前缀
-                            break
-            
+
+            record = records.get(name)
+            if record is not None:
+                original_command = record.command
+            else:
+                # 旧版本创建的任务：从脚本文件中读取原始命令（只有脚本变化时才会重新读取），
+                # 并迁移到元数据存储中
+                script_path = self.get_script_path(name)
+                script_paths.append(script_path)
+                header = self.script_cache.get(script_path)
+                original_command = header.command if header is not None else ''
+                if original_command and job.command == script_path:
+                    migrated.append(JobRecord(self.job_index.id_of(job), name, original_command,
+                                              header.created or str(datetime.datetime.now()), {}))
+
             if not original_command:
                 original_command = job.command
-            self.table.setItem(row, 0, QTableWidgetItem(name))
-            self.table.setItem(row, 1, QTableWidgetItem(original_command))
-            self.table.setItem(row, 2, QTableWidgetItem(str(job.slices)))
-            
-            # 添加启用/禁用状态
-            status_item = QTableWidgetItem('⬤')
-            if job.is_enabled():
-                status_item.setForeground(QBrush(QColor('#2e7d32')))  # 绿色圆点
+
+            enabled = job.is_enabled()
+            if enabled:
                 enabled_count += 1
             else:
-                status_item.setForeground(QBrush(QColor('#d32f2f')))  # 红色圆点
                 disabled_count += 1
-            status_item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-            self.table.setItem(row, 3, status_item)
-        
+            job_id = self.job_index.id_of(job)
+            splay = self.splay_of(name, record.options, global_splay) if record is not None else (0, 0, False)
+            rows.append(JobRow(job_id, name, original_command, str(job.slices), enabled,
+                               self.run_ledger.last(job_id), self.fire_queue.next_of(job_id), splay))
+
+        self.job_model.set_rows(rows)
+        self.script_cache.retain(script_paths)
+        if migrated:
+            self.job_store.save_many(migrated)
         total_count = enabled_count + disabled_count
         self.status_bar.showMessage(f'总任务数: {total_count} | 已启用: {enabled_count} | 已禁用: {disabled_count} | 版本: {VERSION}')
         self.update_status_menu()
 
+    def plan_minute_spread(self, jobs):
+        """为任务选择新的分钟字段，返回 ([(任务, 新表达式), ...], 无法调整的任务名称)
+
+        只调整固定分钟（如 "0"）和步长分钟（如 "*/15"，调整为 "7-59/15"）。
+        以其他已启用任务一天内每分钟的运行次数为初始负载，运行次数多的任务先分配，
+        每个任务选择使其运行分钟负载之和最小的位置，负载相同时优先按名称散列出的位置。
+        """
+        selected = set(id(job) for job in jobs)
+        others = {self.job_index.id_of(job): self.schedule_expression(job)
+                  for job in self.cron if job.is_enabled() and id(job) not in selected}
+        load = LoadAnalyzer(others, datetime.datetime.now(), 1).histogram
+
+        candidates = []
+        skipped = []
+        for job in jobs:
+            fields = self.schedule_expression(job).split()
+            schedule = CronSchedule.compile(' '.join(fields)) if len(fields) == 5 else None
+            step_match = re.fullmatch(r'(?:\*|\d+-59)/(\d+)', fields[0]) if schedule is not None else None
+            if schedule is not None and fields[0].isdigit():
+                step = 60
+            elif step_match and 1 < int(step_match.group(1)) <= 30:
+                step = int(step_match.group(1))
+            else:
+                skipped.append(job.comment)
+                continue
+            hours = [hour for hour in range(24) if schedule.hours >> hour & 1]
+            candidates.append((len(hours) * (60 // step), job, fields, step, hours))
+
+        plan = []
+        candidates.sort(key=lambda item: (-item[0], item[1].comment))
+        for _, job, fields, step, hours in candidates:
+            digest = hashlib.sha1(job.comment.encode('utf-8')).digest()
+            preferred = int.from_bytes(digest[:8], 'big') % step
+            best = None
+            for shift in range(step):
+                offset = (preferred + shift) % step
+                minutes = range(offset, 60, step)
+                score = sum(load[hour * 60 + minute] for hour in hours for minute in minutes)
+                if best is None or score < best[0]:
+                    best = (score, offset, minutes)
+            _, offset, minutes = best
+            for hour in hours:
+                for minute in minutes:
+                    load[hour * 60 + minute] += 1
+            if step == 60:
+                minute_field = str(offset)
+            else:
+                minute_field = f'{offset}-59/{step}' if offset else f'*/{step}'
+            expression = ' '.join([minute_field] + fields[1:])
+            if expression != ' '.join(fields):
+                plan.append((job, expression))
+        return plan, skipped
+
+    def spread_job_minutes(self):
+        """批量调整选中任务的分钟字段以分散负载"""
+        jobs = self.selected_jobs()
+        if not jobs:
+            QMessageBox.warning(self, '警告', '请先选择要错峰的任务')
+            return
+
+        plan, skipped = self.plan_minute_spread(jobs)
+        message = ''
+        if skipped:
+            message += '以下任务的分钟字段不是固定值或步长，不做调整：\n' + '\n'.join(skipped[:20]) + '\n\n'
+        if not plan:
+            QMessageBox.information(self, '错峰分布', message + '选中任务的分布已经是最优，无需调整')
+            return
+        changes = '\n'.join(f'{job.comment}: {self.schedule_expression(job)} → {expression}'
+                            for job, expression in plan[:30])
+        if len(plan) > 30:
+            changes += f'\n…… 共 {len(plan)} 个任务'
+        reply = QMessageBox.question(self, '错峰分布', message + '将调整以下任务的执行计划：\n' + changes,
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        try:
+            with self.cron_batch():
+                for job, expression in plan:
+                    job.setall(expression)
+        except IOError as e:
+            self.refresh_jobs()
+            self.show_crontab_error(e, '写入定时任务失败')
+            return
+        self.refresh_jobs()
+        self.status_bar.showMessage(f'已调整 {len(plan)} 个任务的执行计划', 3000)
+
+    def run_selected_jobs(self):
+        jobs = self.selected_jobs()
+        if not jobs:
+            QMessageBox.warning(self, '警告', '请先选择要运行的任务')
+            return
+        self.run_jobs(jobs)
+
+    def run_jobs(self, jobs):
+        """通过进程池立即运行任务的脚本"""
+        requests = []
+        skipped = []
+        for job in jobs:
+            script_path = self.get_script_path(job.comment)
+            if job.command != script_path or not os.path.exists(script_path):
+                skipped.append(job.comment)
+                continue
+            requests.append(RunRequest(self.job_index.id_of(job), job.comment, script_path))
+        if skipped:
+            QMessageBox.warning(self, '警告', '以下任务不是由本程序创建的，无法立即运行：\n' + '\n'.join(skipped))
+        submitted = self.job_runner.submit(requests)
+        if submitted < len(requests):
+            self.status_bar.showMessage(f'{len(requests) - submitted} 个任务已在运行或排队中', 5000)
+
+    def update_runner_status(self):
+        running = len(self.job_runner.running)
+        queued = len(self.job_runner.queue)
+        if running or queued:
+            self.runner_label.setText(f'正在运行: {running} | 排队: {queued}')
+        else:
+            self.runner_label.setText('')
+
+    def report_run_results(self, results):
+        """一批立即运行的任务全部结束后报告每个任务的结果"""
+        failed = sum(1 for _, exit_code in results if exit_code != 0)
+        lines = [f'{name}: {format_exit_status(exit_code)}' for name, exit_code in results]
+        title = '运行完成' if not failed else f'运行完成，{failed} 个任务失败'
+        tray_icon = getattr(self, 'tray_icon', None)
+        if not self.isVisible() and tray_icon is not None:
+            icon = QSystemTrayIcon.MessageIcon.Information if not failed else QSystemTrayIcon.MessageIcon.Warning
+            tray_icon.showMessage(title, '\n'.join(lines), icon)
+            return
+        msg = QMessageBox(QMessageBox.Icon.Information if not failed else QMessageBox.Icon.Warning,
+                          title, '\n'.join(lines), QMessageBox.StandardButton.Ok, self)
+        msg.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        msg.setModal(False)
+        msg.show()
+
+    def show_settings(self):
+        splay = SettingsDialog.value(self.settings, 'run/splay')
+        lean = SettingsDialog.value(self.settings, 'run/lean')
+        dialog = SettingsDialog(self.settings, self)
+        if dialog.exec() == QDialog.DialogCode.Accepted:
+            self.job_runner.set_max_workers(SettingsDialog.value(self.settings, 'run/max_workers'))
+            self.enforce_log_budget()
+            if SettingsDialog.value(self.settings, 'run/lean') != lean:
+                self.regenerate_scripts(lambda record, header: True)
+                self.refresh_jobs()
+            elif SettingsDialog.value(self.settings, 'run/splay') != splay:
+                # 全局错峰窗口变化：重新生成没有单独设置错峰的任务脚本
+                self.regenerate_scripts(lambda record, header: 'splay' not in record.options)
+                self.refresh_jobs()
+
+    def enforce_log_budget(self):
+        """设置了日志磁盘预算时在后台整理日志目录，上一次整理尚未结束时跳过"""
+        budget = SettingsDialog.value(self.settings, 'logs/budget_mb')
+        if not budget or (self.log_compactor is not None and self.log_compactor.isRunning()):
+            return
+        self.log_compactor = LogCompactor(self.log_dir, budget * 1024 * 1024, self.segment_failures, self)
+        self.log_compactor.report.connect(self.report_log_compaction)
+        self.log_compactor.start()
+
+    def report_log_compaction(self, reclaimed, compressed, removed, total):
+        budget = SettingsDialog.value(self.settings, 'logs/budget_mb') * 1024 * 1024
+        parts = []
+        if compressed:
+            parts.append(f'压缩 {compressed} 个日志段')
+        if removed:
+            parts.append(f'删除 {removed} 个日志段')
+        message = ''
+        if reclaimed:
+            message = f'日志整理：{"，".join(parts)}，释放 {format_memory(reclaimed // 1024)}'
+        if budget and total > budget:
+            message += ('；' if message else '') + \
+                f'日志目录 {format_memory(total // 1024)} 仍超出预算，当前日志不会被自动删除'
+        if message:
+            self.status_bar.showMessage(message, 10000)
+
+    def view_upcoming_runs(self):
+        self.update_fire_queue()
+        names = {row.job_id: row.name for row in self.job_model.rows}
+        dialog = UpcomingRunsDialog(self.fire_queue, names, self)
+        dialog.exec()
+
+    def view_merged_logs(self):
+        jobs = self.selected_jobs()
+        if not jobs:
+            QMessageBox.warning(self, '警告', '请先选择要查看的任务')
+            return
+        sources = [(job.comment, self.get_log_path(job.comment), self.get_run_index_path(job.comment))
+                   for job in jobs]
+        dialog = MergedLogDialog(sources, self)
+        dialog.exec()
+
+    def search_logs(self):
+        names = {self.get_log_path(row.name): row.name for row in self.job_model.rows}
+        dialog = LogSearchDialog(self.log_search_index, names, self)
+        dialog.open_requested.connect(self.open_log_at)
+        dialog.exec()
+
+    def open_log_at(self, path, offset):
+        """打开日志查看器并定位到日志文件（或已轮转的日志段）中的字节偏移"""
+        position = path.rfind('.log.')
+        log_file = path[:position + 4] if position >= 0 else path
+        name = next((row.name for row in self.job_model.rows if self.get_log_path(row.name) == log_file), None)
+        run_index_path = self.get_run_index_path(name) if name is not None else None
+        dialog = LogViewerDialog(log_file, self.sender() or self, run_index_path)
+        dialog.jump_to_offset(offset, path if position >= 0 else None)
+        dialog.exec()
+
+    def view_load_analysis(self):
+        self.update_fire_queue()
+        names = {row.job_id: row.name for row in self.job_model.rows}
+        dialog = LoadAnalysisDialog(dict(self.fire_queue.expressions), names, self)
+        dialog.exec()
+
+    def view_history(self):
+        job = self.current_job()
+        if job is None:
+            QMessageBox.warning(self, '警告', '请先选择一个任务')
+            return
+
+        self.run_ledger.update()
+        entries = self.run_ledger.history(self.job_index.id_of(job))
+        if not entries:
+            QMessageBox.information(self, '提示', '该任务还没有执行记录')
+            return
+        dialog = RunHistoryDialog(job.comment, entries, self)
+        dialog.exec()
+
     def view_log(self):
-        current_row = self.table.currentRow()
-        if current_row < 0:
+        job = self.current_job()
+        if job is None:
             QMessageBox.warning(self, '警告', '请先选择一个任务')
             return
 
-        name = self.table.item(current_row, 0).text()
+        name = job.comment
         log_file = self.get_log_path(name)
         
         if not os.path.exists(log_file):
             with open(log_file, 'w') as f:
                 f.write(f"=== Log file created at {datetime.datetime.now()} ===\n")
         
-        dialog = LogViewerDialog(log_file, self)
+        dialog = LogViewerDialog(log_file, self, self.get_run_index_path(name))
         dialog.exec()
 
     def toggle_job(self):
-        current_row = self.table.currentRow()
-        if current_row < 0:
+        job = self.current_job()
+        if job is None:
             QMessageBox.warning(self, '警告', '请先选择一个任务')
             return
 
-        name = self.table.item(current_row, 0).text()
-        for job in self.cron:
-            if job.comment == name:
-                if job.is_enabled():
-                    job.enable(False)
-                else:
-                    job.enable(True)
-                self.cron.write()
-                self.refresh_jobs()
-                break
+        self.set_jobs_enabled([job], not job.is_enabled())
 
     def enable_jobs(self):
         """启用选中的任务"""
-        selected_items = self.table.selectedItems()
-        if not selected_items:
+        jobs = self.selected_jobs()
+        if not jobs:
             QMessageBox.warning(self, '警告', '请先选择要启用的任务')
             return
 
-        # 获取选中的行
-        rows = list(set(item.row() for item in selected_items))
-        for row in rows:
-            job_name = self.table.item(row, 0).text()
-            try:
-                for job in self.cron.find_comment(job_name):
-                    job.enable()
-                self.cron.write()
-            except IOError as e:
-                if 'Operation not permitted' in str(e):
-                    QMessageBox.critical(self, '权限错误',
-                        f'无法启用任务 {job_name}，因为当前用户没有足够的权限。\n\n'
-                        '请尝试以下解决方案：\n'
-                        '1. 使用管理员权限运行此程序\n'
-                        '2. 确保当前用户有权限修改crontab文件')
-                else:
-                    QMessageBox.critical(self, '错误', f'启用任务 {job_name} 失败：{str(e)}')
-                return
-            except Exception as e:
-                QMessageBox.critical(self, '错误', f'启用任务 {job_name} 失败：{str(e)}')
-                return
-
-        self.refresh_jobs()
-        QMessageBox.information(self, '成功', '任务已启用')
+        if self.set_jobs_enabled(jobs, True):
+            QMessageBox.information(self, '成功', '任务已启用')
 
     def disable_jobs(self):
         """禁用选中的任务"""
-        selected_items = self.table.selectedItems()
-        if not selected_items:
+        jobs = self.selected_jobs()
+        if not jobs:
             QMessageBox.warning(self, '警告', '请先选择要禁用的任务')
             return
 
-        # 获取选中的行
-        rows = list(set(item.row() for item in selected_items))
-        for row in rows:
-            job_name = self.table.item(row, 0).text()
-            try:
-                for job in self.cron.find_comment(job_name):
-                    job.enable(False)
-                self.cron.write()
-            except IOError as e:
-                if 'Operation not permitted' in str(e):
-                    QMessageBox.critical(self, '权限错误',
-                        f'无法禁用任务 {job_name}，因为当前用户没有足够的权限。\n\n'
-                        '请尝试以下解决方案：\n'
-                        '1. 使用管理员权限运行此程序\n'
-                        '2. 确保当前用户有权限修改crontab文件')
-                else:
-                    QMessageBox.critical(self, '错误', f'禁用任务 {job_name} 失败：{str(e)}')
-                return
-            except Exception as e:
-                QMessageBox.critical(self, '错误', f'禁用任务 {job_name} 失败：{str(e)}')
-                return
+        if self.set_jobs_enabled(jobs, False):
+            QMessageBox.information(self, '成功', '任务已禁用')
 
+    def set_jobs_enabled(self, jobs, enabled):
+        """批量启用/禁用任务，只写入一次crontab"""
+        action = '启用' if enabled else '禁用'
+        try:
+            with self.cron_batch() as batch:
+                batch.set_enabled(jobs, enabled)
+        except IOError as e:
+            self.refresh_jobs()
+            self.show_crontab_error(e, f'{action}任务失败')
+            return False
+        except Exception as e:
+            self.refresh_jobs()
+            QMessageBox.critical(self, '错误', f'{action}任务失败：{str(e)}')
+            return False
         self.refresh_jobs()
-        QMessageBox.information(self, '成功', '任务已禁用')
+        return True
 
     def show_context_menu(self, position):
         menu = QMenu()
@@ -1388,17 +5800,24 @@ class JobManager(QMainWindow):
         edit_action = menu.addAction('编辑任务')
         delete_action = menu.addAction('删除任务')
         toggle_action = menu.addAction('启用/禁用')
+        run_now_action = menu.addAction('立即运行')
+        spread_action = menu.addAction('错峰分布')
         view_log_action = menu.addAction('查看日志')
+        view_history_action = menu.addAction('运行历史')
+        merged_log_action = menu.addAction('合并查看日志')
 
         # 获取当前选中的行
-        current_row = self.table.currentRow()
-        actions_enabled = current_row >= 0
+        actions_enabled = self.table.currentIndex().isValid()
 
         # 根据是否选中行来启用/禁用菜单项
         edit_action.setEnabled(actions_enabled)
         delete_action.setEnabled(actions_enabled)
         toggle_action.setEnabled(actions_enabled)
+        run_now_action.setEnabled(actions_enabled)
+        spread_action.setEnabled(actions_enabled)
         view_log_action.setEnabled(actions_enabled)
+        view_history_action.setEnabled(actions_enabled)
+        merged_log_action.setEnabled(actions_enabled)
 
         # 显示菜单并获取用户选择的操作
         action = menu.exec(self.table.viewport().mapToGlobal(position))
@@ -1410,8 +5829,16 @@ class JobManager(QMainWindow):
             self.delete_job()
         elif action == toggle_action:
             self.toggle_job()
+        elif action == run_now_action:
+            self.run_selected_jobs()
+        elif action == spread_action:
+            self.spread_job_minutes()
         elif action == view_log_action:
             self.view_log()
+        elif action == view_history_action:
+            self.view_history()
+        elif action == merged_log_action:
+            self.view_merged_logs()
 
 
     def open_logs_directory(self):
@@ -1459,13 +5886,18 @@ class JobManager(QMainWindow):
 
         try:
             tasks = []
-            for row in range(self.table.rowCount()):
+            records = self.job_store.load_all()
+            for job in self.cron:
+                record = records.get(job.comment)
                 task = {
-                    'name': self.table.item(row, 0).text(),
-                    'command': self.table.item(row, 1).text(),
-                    'schedule': self.table.item(row, 2).text(),
-                    'enabled': self.table.item(row, 3).text() == '是'
+                    'name': job.comment,
+                    'command': record.command if record is not None else job.command,
+                    'schedule': str(job.slices),
+                    'enabled': job.is_enabled()
                 }
+                if record is not None:
+                    task['created'] = record.created
+                    task['options'] = record.options
                 tasks.append(task)
 
             with open(file_path, 'w', encoding='utf-8') as f:
@@ -1497,48 +5929,70 @@ class JobManager(QMainWindow):
                 if not all(key in task for key in ['name', 'command', 'schedule', 'enabled']):
                     raise ValueError('任务配置缺少必要字段')
 
-                # 添加任务到表格
-                row = self.table.rowCount()
-                self.table.insertRow(row)
-                self.table.setItem(row, 0, QTableWidgetItem(task['name']))
-                self.table.setItem(row, 1, QTableWidgetItem(task['command']))
-                self.table.setItem(row, 2, QTableWidgetItem(task['schedule']))
-                self.table.setItem(row, 3, QTableWidgetItem('是' if task['enabled'] else '否'))
+            # 所有导入的任务一次性写入crontab；失败时除了回滚crontab，
+            # 还要恢复已经生成的脚本和元数据记录，使导入要么全部生效要么完全不生效
+            saved = self.save_job_files(task['name'] for task in tasks)
+            try:
+                with self.cron_batch() as batch:
+                    for task in tasks:
+                        options = task.get('options')
+                        script_path = self.create_script_file(task['name'], task['command'], task.get('created'),
+                                                              clean_options(options) if options is not None else None)
+                        job = self.job_index.get(task['name'])
+                        if job is None:
+                            batch.new(script_path, task['name'], task['schedule'], task['enabled'])
+                        else:
+                            job.set_command(script_path)
+                            job.setall(task['schedule'])
+                            job.enable(bool(task['enabled']))
+            except Exception:
+                self.restore_job_files(saved)
+                raise
 
+            self.refresh_jobs()
             QMessageBox.information(self, '成功', '任务配置已成功导入！')
-            self.save_tasks()  # 保存导入的任务
+        except IOError as e:
+            self.refresh_jobs()
+            self.show_crontab_error(e, '导入任务配置时发生错误')
         except Exception as e:
+            self.refresh_jobs()
             QMessageBox.critical(self, '错误', f'导入任务配置时发生错误：{str(e)}')
 
-    def save_tasks(self):
-        """将表格中的任务保存到 crontab"""
-        try:
-            # 清空现有的 crontab 任务
-            self.cron.remove_all()
-            
-            # 遍历表格中的所有任务
-            for row in range(self.table.rowCount()):
-                name = self.table.item(row, 0).text()
-                command = self.table.item(row, 1).text()
-                schedule = self.table.item(row, 2).text()
-                enabled = self.table.item(row, 3).text() == '⬤' and self.table.item(row, 3).foreground().color().name() == '#2e7d32'
-                
-                # 创建执行脚本
-                script_path = self.create_script_file(name, command)
-                
-                # 添加到 crontab
-                job = self.cron.new(command=script_path, comment=name)
-                job.setall(schedule)
-                
-                # 设置任务状态
-                if not enabled:
-                    job.enable(False)
-            
-            # 写入 crontab 文件
-            self.cron.write()
-            self.refresh_jobs()
-        except Exception as e:
-            QMessageBox.critical(self, '错误', f'保存任务配置时发生错误：{str(e)}')
+    def remove_file(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+
+    def save_job_files(self, names):
+        """记录任务脚本内容和元数据记录，供 restore_job_files 恢复；不存在的记为 None"""
+        saved = {}
+        for name in names:
+            if name in saved:
+                continue
+            try:
+                with open(self.get_script_path(name)) as f:
+                    script = f.read()
+            except FileNotFoundError:
+                script = None
+            saved[name] = (script, self.job_store.get(name))
+        return saved
+
+    def restore_job_files(self, saved):
+        """把任务脚本和元数据记录恢复到 save_job_files 时的状态"""
+        for name, (script, record) in saved.items():
+            script_path = self.get_script_path(name)
+            try:
+                if script is None:
+                    if os.path.exists(script_path):
+                        os.remove(script_path)
+                else:
+                    with open(script_path, 'w') as f:
+                        f.write(script)
+                if record is None:
+                    self.job_store.delete([name])
+                else:
+                    self.job_store.save(record)
+            except Exception as e:
+                print(f"恢复任务 {name} 的脚本和记录时出错: {str(e)}")
 
     def toggle_stay_on_top(self):
         flags = self.windowFlags()
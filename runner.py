@@ -0,0 +1,592 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Chronos任务执行器
+
+由生成的任务脚本调用（Chronos启动时会复制到 ~/.chronos/bin），只依赖Python标准库。
+
+用法：
+    runner.py exec [--usage 文件] [--lock 前缀 [--slots N] [--wait]]
+                   [--timeout 秒 [--grace 秒]] [--nice N] [--io-class low|idle]
+                   [--memory MB] [--cpu-time 秒] -- <命令> [参数...]
+        执行命令并等待其结束，退出码与命令本身一致（被信号终止时为 128+信号值）。
+        --usage     把子进程的资源使用情况写入该文件
+        --lock      运行期间持有 "<前缀>.<序号>.lock" 中的一个文件锁（flock），最多 N 个实例同时运行；
+                    没有空闲位置时，默认跳过本次执行（--usage 文件写入 skipped），
+                    指定 --wait 则排队等待
+        --timeout   超过该时间后向命令的进程组发送 SIGTERM，再过 --grace 秒（默认10）仍未结束则发送 SIGKILL，
+                    退出码为 124
+        --nice      CPU调度优先级（0-19，越大越低）
+        --io-class  I/O调度类别：low 为尽力而为的最低级别，idle 为仅在磁盘空闲时；需要 ionice，仅 Linux 支持
+        --memory    地址空间上限（RLIMIT_AS，MB）
+        --cpu-time  CPU时间上限（RLIMIT_CPU，秒），超出时命令收到 SIGXCPU
+    runner.py job --job-id ID --log 日志 --ledger 账本 [--cwd 目录] [--splay 秒] [exec 的选项] -- <命令> [参数...]
+        精简模式的任务包装：完成错峰延迟、日志分隔符与结束标记、输出写入日志（同时输出到标准输出）
+        以及执行记录，日志和账本格式与生成的 bash 脚本相同，整个运行只启动这一个额外进程。
+        可以同时指定 rotate 的轮转选项，在写入分隔符之前检查是否需要轮转。
+    runner.py rotate --log 日志 [--max-size MB] [--max-age 天] [--max-runs N] [--keep N]
+        当前日志达到任一条件时重命名为 "<日志>.<时间戳>"，只保留最近 --keep 个（默认5）日志段，
+        未压缩的日志段在脱离的后台进程中压缩为 .gz，不阻塞任务本身。
+    runner.py rotate-ledger --ledger 账本
+        账本超过 16MB 时改名为 "<账本>.1"（覆盖更早的一份），job 子命令写入执行记录后会自动检查
+    runner.py rusage <输出文件> -- <命令> [参数...]
+        等同于 exec --usage <输出文件>，兼容旧版本生成的脚本
+"""
+
+import os
+import re
+import sys
+import time
+import fcntl
+import signal
+import argparse
+import resource
+
+
+def usage_line(usage):
+    """把 wait4 返回的 rusage 转换为一行：用户CPU毫秒 系统CPU毫秒 最大RSS(KB) 读块数 写块数"""
+    max_rss = usage.ru_maxrss
+    if sys.platform == 'darwin':
+        max_rss //= 1024  # macOS 上 ru_maxrss 的单位是字节，Linux 上是KB
+    return '%d %d %d %d %d\n' % (round(usage.ru_utime * 1000), round(usage.ru_stime * 1000),
+                                 max_rss, usage.ru_inblock, usage.ru_oublock)
+
+
+def exit_code(status):
+    if os.WIFSIGNALED(status):
+        return 128 + os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+IO_CLASSES = {
+    'low': ['-c', '2', '-n', '7'],
+    'idle': ['-c', '3'],
+}
+
+
+def which(name):
+    """在 PATH 中查找可执行文件（不导入 shutil，减少每次运行的启动开销）"""
+    for directory in os.environ.get('PATH', os.defpath).split(os.pathsep):
+        path = os.path.join(directory, name)
+        if os.access(path, os.X_OK) and not os.path.isdir(path):
+            return path
+    return None
+
+
+def limit_child(options):
+    """在子进程 exec 之前应用优先级和资源限制"""
+    if options.nice:
+        os.nice(options.nice)
+    if options.memory:
+        size = options.memory * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (size, size))
+    if options.cpu_time:
+        # 软限制到达时收到 SIGXCPU，留出几秒后再由硬限制强制结束
+        resource.setrlimit(resource.RLIMIT_CPU, (options.cpu_time, options.cpu_time + 5))
+
+
+def spawn(argv, options, output_fd=None):
+    """启动子进程，父进程收到的终止信号转发给子进程
+
+    设置了超时时子进程自成一个进程组，超时后整组终止，命令启动的后台进程也不会残留。
+    指定 output_fd 时子进程的标准输出和标准错误都重定向到该描述符。
+    """
+    group = bool(options.timeout)
+    if options.io_class in IO_CLASSES and which('ionice'):
+        argv = ['ionice'] + IO_CLASSES[options.io_class] + argv
+    pid = os.fork()
+    if pid == 0:
+        try:
+            if group:
+                os.setpgid(0, 0)
+            if output_fd is not None:
+                os.dup2(output_fd, 1)
+                os.dup2(output_fd, 2)
+                os.close(output_fd)
+            limit_child(options)
+            os.execvp(argv[0], argv)
+        except OSError as e:
+            sys.stderr.write(f'无法执行 {argv[0]}: {e}\n')
+        os._exit(127)
+    if group:
+        try:
+            os.setpgid(pid, pid)  # 与子进程中的调用重复，避免在子进程设置前发送信号
+        except OSError:
+            pass
+
+    def forward(signum, frame):
+        try:
+            if group:
+                os.killpg(pid, signum)
+            else:
+                os.kill(pid, signum)
+        except OSError:
+            pass
+
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(signum, forward)
+    return pid
+
+
+class Deadline:
+    """超时后先发送 SIGTERM，宽限期过后发送 SIGKILL"""
+
+    def __init__(self, pid, timeout, grace, report=None):
+        self.pid = pid
+        self.timeout = timeout
+        self.grace = max(grace, 1)
+        self.report = report or (lambda data: os.write(2, data))
+        self.expired = False
+        signal.signal(signal.SIGALRM, self.on_alarm)
+        signal.alarm(timeout)
+
+    def on_alarm(self, signum, frame):
+        try:
+            if not self.expired:
+                self.expired = True
+                self.report(f'执行超时（{self.timeout} 秒），正在终止\n'.encode('utf-8'))
+                os.killpg(self.pid, signal.SIGTERM)
+                signal.alarm(self.grace)
+            else:
+                os.killpg(self.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    def cancel(self):
+        signal.alarm(0)
+
+
+def wait(pid):
+    """等待子进程结束，返回 (退出码, rusage)"""
+    while True:
+        try:
+            _, status, usage = os.wait4(pid, 0)
+            return exit_code(status), usage
+        except InterruptedError:
+            continue
+
+
+def write_usage(path, line):
+    if not path:
+        return
+    try:
+        with open(path, 'w') as f:
+            f.write(line)
+    except OSError:
+        pass
+
+
+def try_lock(path):
+    """以非阻塞方式锁定文件，成功时返回文件描述符"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return fd
+    except OSError:
+        os.close(fd)
+        return None
+
+
+def acquire_slot(prefix, slots, wait_for_slot):
+    """获取 slots 个位置中的一个，返回持有锁的文件描述符；不等待且没有空位时返回 None"""
+    paths = [f'{prefix}.{slot}.lock' for slot in range(slots)]
+    if slots == 1 and wait_for_slot:
+        fd = os.open(paths[0], os.O_WRONLY | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)  # 只有一个位置时直接阻塞等待
+        return fd
+    while True:
+        for path in paths:
+            fd = try_lock(path)
+            if fd is not None:
+                return fd
+        if not wait_for_slot:
+            return None
+        time.sleep(0.5)
+
+
+def add_exec_arguments(parser):
+    parser.add_argument('--usage')
+    parser.add_argument('--lock')
+    parser.add_argument('--slots', type=int, default=1)
+    parser.add_argument('--wait', action='store_true')
+    parser.add_argument('--timeout', type=int, default=0)
+    parser.add_argument('--grace', type=int, default=10)
+    parser.add_argument('--nice', type=int, default=0)
+    parser.add_argument('--io-class', choices=sorted(IO_CLASSES))
+    parser.add_argument('--memory', type=int, default=0)
+    parser.add_argument('--cpu-time', type=int, default=0)
+    parser.add_argument('argv', nargs=argparse.REMAINDER)
+
+
+def parse_exec_arguments(parser, args):
+    options = parser.parse_args(args)
+    options.argv = options.argv[1:] if options.argv[:1] == ['--'] else options.argv
+    if not options.argv:
+        parser.error('缺少要执行的命令')
+    return options
+
+
+def hold_slot(options):
+    """按 --lock 获取一个运行位置，没有空闲位置时返回 False
+
+    os.open 打开的描述符默认不被子进程继承：锁只由本进程持有，进程退出时释放，
+    命令残留的子进程不会占住位置。
+    """
+    if not options.lock:
+        return True
+    os.makedirs(os.path.dirname(options.lock), exist_ok=True)
+    return acquire_slot(options.lock, max(options.slots, 1), options.wait) is not None
+
+
+def skip_message(options):
+    return f'已有 {options.slots} 个实例正在运行，跳过本次执行\n'
+
+
+def run_command(options, output=None):
+    """运行命令直到结束，返回 (退出码, rusage)；指定 output 时命令的输出逐块交给它处理"""
+    read_fd = write_fd = None
+    if output is not None:
+        read_fd, write_fd = os.pipe()
+    pid = spawn(options.argv, options, write_fd)
+    deadline = Deadline(pid, options.timeout, options.grace, output) if options.timeout else None
+    if read_fd is not None:
+        os.close(write_fd)
+        with open(read_fd, 'rb', buffering=0) as pipe:
+            for chunk in iter(lambda: pipe.read(65536), b''):
+                output(chunk)
+    code, usage = wait(pid)
+    if deadline is not None:
+        deadline.cancel()
+        if deadline.expired:
+            code = 124
+    return code, usage
+
+
+def command_exec(args):
+    parser = argparse.ArgumentParser(prog='runner.py exec')
+    add_exec_arguments(parser)
+    options = parse_exec_arguments(parser, args)
+
+    if not hold_slot(options):
+        print(skip_message(options), end='', flush=True)
+        write_usage(options.usage, 'skipped\n')
+        return 0
+
+    code, usage = run_command(options)
+    write_usage(options.usage, usage_line(usage))
+    return code
+
+
+# 与生成的 bash 脚本写入的分隔符相同，日志查看器和执行索引依赖这一格式
+SEPARATOR = '\n----------------------------------------\n执行时间: {}\n----------------------------------------\n\n'
+
+
+def timestamp():
+    return time.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class JobLog:
+    """追加写入任务日志并复制到标准输出，相当于 tee -a
+
+    使用无缓冲的写入，超时处理函数在读取输出的过程中写入也是安全的。
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'ab', buffering=0)
+        self.written = 0
+
+    def write(self, data):
+        self.file.write(data)
+        self.written += len(data)
+        try:
+            os.write(1, data)
+        except OSError:
+            pass  # 标准输出已关闭时只写日志
+
+
+def command_job(args):
+    parser = argparse.ArgumentParser(prog='runner.py job')
+    parser.add_argument('--job-id', required=True)
+    parser.add_argument('--log', required=True)
+    parser.add_argument('--ledger', required=True)
+    parser.add_argument('--cwd')
+    parser.add_argument('--splay', type=int, default=0)
+    add_rotate_arguments(parser)
+    add_exec_arguments(parser)
+    options = parse_exec_arguments(parser, args)
+
+    if options.cwd:
+        os.chdir(options.cwd)
+    scheduled = int(time.time())
+    if options.splay and not os.environ.get('CHRONOS_NO_SPLAY'):
+        time.sleep(options.splay)
+
+    rotate_log(options)
+    log = JobLog(options.log)
+    log.write(SEPARATOR.format(timestamp()).encode('utf-8'))
+    log.written = 0
+    started = int(time.time())
+    if hold_slot(options):
+        code, usage = run_command(options, log.write)
+        fields = usage_line(usage).split() + ['0']
+        outcome = '执行成功' if code == 0 else '执行失败'
+    else:
+        log.write(skip_message(options).encode('utf-8'))
+        code, fields, outcome = 0, ['-'] * 5 + ['1'], '已跳过'
+    finished = int(time.time())
+
+    # 与 bash 脚本相同的执行记录，一次 write 追加整行，并发追加不会交错
+    record = '\t'.join([options.job_id, str(scheduled // 60 * 60), str(started), str(finished), str(code),
+                        str(log.written)] + fields) + '\n'
+    fd = os.open(options.ledger, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, record.encode('utf-8'))
+    finally:
+        os.close(fd)
+    rotate_ledger(options.ledger)
+
+    log.write(f'[{timestamp()}] {outcome}\n'.encode('utf-8'))
+    return code
+
+
+LEDGER_ROTATE_BYTES = 16 * 1024 * 1024
+
+
+def rotate_ledger(path):
+    """账本超过 LEDGER_ROTATE_BYTES 时改名为 "<账本>.1"（覆盖更早的一份），返回是否进行了轮转
+
+    由写入者在追加记录后检查，Chronos 没有运行时账本也不会无限增长。
+    加非阻塞的文件锁并在加锁后重新确认文件和大小，多个写入者同时检查时只有一个会轮转。
+    """
+    try:
+        if os.stat(path).st_size <= LEDGER_ROTATE_BYTES:
+            return False
+        f = open(path, 'rb')
+    except OSError:
+        return False
+    with f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            st = os.fstat(f.fileno())
+            if os.stat(path).st_ino != st.st_ino or st.st_size <= LEDGER_ROTATE_BYTES:
+                return False
+            os.replace(path, path + '.1')
+        except OSError:
+            return False
+    return True
+
+
+# 已轮转的日志段后缀：.<年月日-时分秒>[-序号][.gz]
+SEGMENT_PATTERN = re.compile(r'\.(\d{8}-\d{6})(?:-(\d+))?(\.gz)?')
+RUN_MARKER = '执行时间: '.encode('utf-8')
+RUN_COUNT_SUFFIX = '.runcount'  # 记录当前日志执行次数的附属文件
+
+
+def log_segments(log_path):
+    """已轮转的日志段，按时间从旧到新排列"""
+    directory, base = os.path.split(log_path)
+    segments = []
+    try:
+        names = os.listdir(directory or '.')
+    except OSError:
+        return []
+    for name in names:
+        match = SEGMENT_PATTERN.fullmatch(name[len(base):]) if name.startswith(base) else None
+        if match:
+            segments.append(((match.group(1), int(match.group(2) or 0)), os.path.join(directory, name)))
+    return [path for _, path in sorted(segments)]
+
+
+def log_started(f):
+    """当前日志中第一次执行的开始时间，找不到时返回 None"""
+    match = re.search(RUN_MARKER + rb'(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)', f.read(64 * 1024))
+    if match is None:
+        return None
+    return time.mktime(time.strptime(match.group(1).decode('ascii'), '%Y-%m-%d %H:%M:%S'))
+
+
+def count_runs(f, log_path):
+    """统计日志中的执行次数
+
+    统计结果和已统计到的位置（最后一个完整行之后）记录在 <日志>.runcount 中，
+    每次只统计新追加的部分，不必在每次执行前从头读取整个日志；日志被替换或截断时重新统计。
+    """
+    st = os.fstat(f.fileno())
+    count_path = log_path + RUN_COUNT_SUFFIX
+    offset = count = 0
+    try:
+        with open(count_path) as saved:
+            inode, saved_offset, saved_count = map(int, saved.read().split())
+        if inode == st.st_ino and saved_offset <= st.st_size:
+            offset, count = saved_offset, saved_count
+    except (OSError, ValueError):
+        pass
+
+    f.seek(offset)
+    tail = b''
+    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+        # 只统计完整的行，最后一行可能还在写入，留到下次统计
+        data = tail + chunk
+        end = data.rfind(b'\n') + 1
+        count += data[:end].count(RUN_MARKER)
+        offset += end
+        tail = data[end:]
+
+    try:
+        with open(count_path + '.tmp', 'w') as saved:
+            saved.write(f'{st.st_ino} {offset} {count}\n')
+        os.replace(count_path + '.tmp', count_path)
+    except OSError:
+        pass
+    return count
+
+
+def needs_rotation(f, size, options):
+    if size == 0:
+        return False
+    if options.max_size and size >= options.max_size * 1024 * 1024:
+        return True
+    if options.max_age:
+        started = log_started(f)
+        if started is not None and time.time() - started >= options.max_age * 86400:
+            return True
+    if options.max_runs:
+        return count_runs(f, options.log) >= options.max_runs
+    return False
+
+
+def rotate_log(options):
+    """按轮转条件轮转日志，返回是否进行了轮转
+
+    对当前日志加非阻塞的文件锁并确认它仍是同一个文件，同一任务的多个实例同时检查时只有一个会轮转。
+    """
+    if not (options.max_size or options.max_age or options.max_runs):
+        return False
+    log_path = options.log
+    try:
+        f = open(log_path, 'rb')
+    except OSError:
+        return False
+    with f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            st = os.fstat(f.fileno())
+            if os.stat(log_path).st_ino != st.st_ino or not needs_rotation(f, st.st_size, options):
+                return False
+            stamp = time.strftime('%Y%m%d-%H%M%S')
+            target = f'{log_path}.{stamp}'
+            serial = 0
+            while os.path.exists(target) or os.path.exists(target + '.gz'):
+                serial += 1
+                target = f'{log_path}.{stamp}-{serial}'
+            os.rename(log_path, target)
+        except OSError:
+            return False
+        try:
+            # 新日志的 inode 可能复用被压缩删除的旧日志的，统计结果不能沿用
+            os.unlink(log_path + RUN_COUNT_SUFFIX)
+        except OSError:
+            pass
+
+    for path in log_segments(log_path)[:-max(options.keep, 1)]:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    compress_in_background(log_path)
+    return True
+
+
+def compress_segments(log_path):
+    """把未压缩的日志段压缩为 .gz；压缩中的日志段加锁，多个压缩进程不会重复处理"""
+    import gzip
+    import shutil
+    for path in log_segments(log_path):
+        if path.endswith('.gz'):
+            continue
+        try:
+            with open(path, 'rb') as source:
+                fcntl.flock(source.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                if not os.path.exists(path):
+                    continue  # 加锁前已被其他进程压缩
+                with gzip.open(path + '.gz.tmp', 'wb') as target:
+                    shutil.copyfileobj(source, target, 1024 * 1024)
+                os.replace(path + '.gz.tmp', path + '.gz')
+                os.unlink(path)
+        except OSError:
+            try:
+                os.unlink(path + '.gz.tmp')
+            except OSError:
+                pass
+
+
+def compress_in_background(log_path):
+    """在脱离的孙进程中压缩日志段：不继承标准输出，cron 和 tee 不会等待它结束"""
+    try:
+        pid = os.fork()
+    except OSError:
+        return
+    if pid:
+        os.waitpid(pid, 0)
+        return
+    try:
+        os.setsid()
+        if os.fork():
+            os._exit(0)
+        null = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(null, fd)
+        os.nice(10)
+        compress_segments(log_path)
+    finally:
+        os._exit(0)
+
+
+def add_rotate_arguments(parser):
+    parser.add_argument('--max-size', type=int, default=0)
+    parser.add_argument('--max-age', type=int, default=0)
+    parser.add_argument('--max-runs', type=int, default=0)
+    parser.add_argument('--keep', type=int, default=5)
+
+
+def command_rotate(args):
+    parser = argparse.ArgumentParser(prog='runner.py rotate')
+    parser.add_argument('--log', required=True)
+    add_rotate_arguments(parser)
+    rotate_log(parser.parse_args(args))
+    return 0
+
+
+def command_rotate_ledger(args):
+    parser = argparse.ArgumentParser(prog='runner.py rotate-ledger')
+    parser.add_argument('--ledger', required=True)
+    rotate_ledger(parser.parse_args(args).ledger)
+    return 0
+
+
+def command_rusage(args):
+    if len(args) < 3 or args[1] != '--':
+        sys.stderr.write('用法: runner.py rusage <输出文件> -- <命令> [参数...]\n')
+        return 2
+    return command_exec(['--usage', args[0]] + args[1:])
+
+
+COMMANDS = {
+    'exec': command_exec,
+    'job': command_job,
+    'rotate': command_rotate,
+    'rotate-ledger': command_rotate_ledger,
+    'rusage': command_rusage,
+}
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        sys.stderr.write(__doc__)
+        return 2
+    return COMMANDS[sys.argv[1]](sys.argv[2:])
+
+
+if __name__ == '__main__':
+    sys.exit(main())